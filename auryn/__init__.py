@@ -1,9 +1,22 @@
-from .api import execute, execute_standalone, generate
+from .api import compile, execute, execute_standalone, generate, stream
 from .code import Code, CodeArgument
+from .compiled import CompiledTemplate
+from .discovery import PluginIndex
+from .environment import Environment
 from .errors import Error, ExecutionError, GenerationError
-from .gx import GX, LineTransform, PluginArgument, PostProcessor
+from .gx import (
+    GX,
+    Continuation,
+    LineTransform,
+    LineTransforms,
+    Namespace,
+    PluginArgument,
+    PluginBundle,
+    PostProcessor,
+)
 from .interpolate import interpolate, split
 from .origin import Origin
+from .output import Sink, Writer
 from .template import Line, Lines, Template, TemplateArgument
 from .utils import crop_lines
 
@@ -11,10 +24,21 @@ __all__ = [
     "generate",
     "execute",
     "execute_standalone",
+    "stream",
+    "compile",
+    "CompiledTemplate",
+    "Environment",
     "GX",
     "PluginArgument",
+    "PluginBundle",
+    "PluginIndex",
     "LineTransform",
+    "Continuation",
+    "LineTransforms",
+    "Namespace",
     "PostProcessor",
+    "Sink",
+    "Writer",
     "Template",
     "TemplateArgument",
     "Lines",
@@ -1,7 +1,9 @@
-from typing import Any
+from typing import Any, Iterator
 
 from .code import CodeArgument
+from .compiled import CompiledTemplate
 from .gx import GX, PluginArgument
+from .output import Sink
 from .template import TemplateArgument
 
 
@@ -25,7 +27,7 @@ def generate(
         ... ''')
         >>> print(code)
         for i in range(n):
-            emit(0, 'line ', i)
+            emit_text(0, f'line {i!s}')
 
     Arguments:
         template: The template used as generation instructions.
@@ -60,6 +62,7 @@ def execute(
     *,
     load: PluginArgument | None = None,
     load_core: bool | None = None,
+    sink: Sink | None = None,
     stack_level: int = 0,
     **context_kwargs: Any,
 ) -> str:
@@ -88,12 +91,15 @@ def execute(
             list, each item is loaded recursively.
             In any case, names starting with g_ are added to the generation namespaces, names starting with x_ are added
             to the execution namespace, and on_load is called after the plugin loads.
+        sink: Where to write the execution output as it's emitted, instead of returning it: a text file object, a binary
+            file object or a socket (in which case the output is UTF-8 encoded), a function, or a Writer (to configure
+            the encoding or buffer size).
         stack_level: How many frames to ascend to infer the GX origin.
         **context_kwargs: Additional context to add to the generation and execution namespaces.
             Names starting with g_ are added to the generation namespace; the rest are added to the execution namespace.
 
     Returns:
-        The runtime output.
+        The runtime output (or an empty string, if it's written into a sink).
     """
     g_context: dict[str, Any] = {}
     x_context: dict[str, Any] = {}
@@ -107,7 +113,112 @@ def execute(
     if load:
         gx.load(load)
     gx.generate(g_context)
-    return gx.execute(x_context)
+    return gx.execute(x_context, sink=sink)
+
+
+def stream(
+    template: TemplateArgument,
+    context: dict[str, Any] | None = None,
+    /,
+    *,
+    load: PluginArgument | None = None,
+    load_core: bool | None = None,
+    stack_level: int = 0,
+    **context_kwargs: Any,
+) -> Iterator[str]:
+    """
+    Generate code from a template and execute it, yielding its output in chunks as it's emitted.
+
+        >>> for chunk in stream('''
+        ...     !for i in range(n):
+        ...         line {i}
+        ... ''', n=3):
+        ...     sys.stdout.write(chunk)
+        line 0
+        line 1
+        line 2
+
+    The generation happens immediately, and the execution as the chunks are iterated over (see GX.execute_iter).
+
+    Arguments:
+        template: The template used as generation instructions.
+            If it's a template object, it's used as is; if it's a path object or a string refering to a valid file, its
+            contents are parsed; otherwise, *it* is parsed.
+        context: Additional context to add to the generation and execution namespaces.
+            Names starting with g_ are added to the generation namespace; the rest are added to the execution namespace.
+        load: Additional plugins to load into the generation and execution (see execute).
+        load_core: Whether to load the core plugin, containing the default macros and hooks (e.g. %include and concat;
+            default is GX.load_core_by_default).
+        stack_level: How many frames to ascend to infer the GX origin.
+        **context_kwargs: Additional context to add to the generation and execution namespaces.
+            Names starting with g_ are added to the generation namespace; the rest are added to the execution namespace.
+
+    Returns:
+        An iterator over the execution output chunks.
+    """
+    g_context: dict[str, Any] = {}
+    x_context: dict[str, Any] = {}
+    for key, value in {**(context or {}), **context_kwargs}.items():
+        if key.startswith("g_"):
+            key = key.removeprefix("g_")
+            g_context[key] = value
+        else:
+            x_context[key] = value
+    gx = GX.parse(template, load_core=load_core, stack_level=stack_level + 1)
+    if load:
+        gx.load(load)
+    gx.generate(g_context)
+    return gx.execute_iter(x_context)
+
+
+def compile(
+    template: TemplateArgument,
+    context: dict[str, Any] | None = None,
+    /,
+    *,
+    load: PluginArgument | None = None,
+    load_core: bool | None = None,
+    stack_level: int = 0,
+    **context_kwargs: Any,
+) -> CompiledTemplate:
+    """
+    Generate code from a template and compile it, so it can be executed many times.
+
+        >>> template = compile('''
+        ...     !for i in range(n):
+        ...         line {i}
+        ... ''')
+        >>> print(template.render(n=2))
+        line 0
+        line 1
+        >>> print(template.render(n=3))
+        line 0
+        line 1
+        line 2
+
+    Arguments:
+        template: The template used as generation instructions.
+            If it's a template object, it's used as is; if it's a path object or a string refering to a valid file, its
+            contents are parsed; otherwise, *it* is parsed.
+        context: Additional context to add to the generation namespace.
+        load: Additional plugins to load into the generation and execution.
+            If it's a string or a path object, it's loaded as a module; if it's a dictionary, it's traversed; if it's a
+            list, each item is loaded recursively.
+            In any case, names starting with g_ are added to the generation namespaces, names starting with x_ are added
+            to the execution namespace, and on_load is called after the plugin loads.
+        load_core: Whether to load the core plugin, containing the default macros and hooks (e.g. %include and concat;
+            default is GX.load_core_by_default).
+        stack_level: How many frames to ascend to infer the GX origin.
+        **context_kwargs: Additional context to add to the generation namespace.
+
+    Returns:
+        The compiled template, whose render method executes it with a given context.
+    """
+    gx = GX.parse(template, load_core=load_core, stack_level=stack_level + 1)
+    if load:
+        gx.load(load)
+    gx.generate(context, **context_kwargs)
+    return CompiledTemplate(gx)
 
 
 def execute_standalone(
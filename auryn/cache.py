@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import collections
+import marshal
+import os
+import pathlib
+import threading
+from typing import Any, Callable, ClassVar, Hashable
+
+
+class LRUCache[K: Hashable, V]:
+    """
+    A bounded, thread-safe cache that evicts its least recently used entries.
+
+        >>> cache = LRUCache(2)
+        >>> cache["a"] = 1
+        >>> cache["b"] = 2
+        >>> cache.get("a")
+        1
+        >>> cache["c"] = 3  # Evicts "b", since "a" was used more recently.
+        >>> cache.get("b") is None
+        True
+        >>> cache
+        <LRU cache: 2/2 entries, 1 hits, 1 misses, 1 evictions>
+
+    Attributes:
+        max_size: The maximal number of entries.
+        on_evict: A function called with the key and value of every entry that is evicted or removed.
+        hits: How many lookups found their key.
+        misses: How many lookups didn't find their key.
+        evictions: How many entries were evicted to make room for new ones.
+    """
+
+    def __init__(self, max_size: int, on_evict: Callable[[K, V], None] | None = None) -> None:
+        if max_size < 1:
+            raise ValueError(f"invalid cache size: {max_size!r} (expected a positive integer)")
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: collections.OrderedDict[K, V] = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __str__(self) -> str:
+        return (
+            f"LRU cache: {len(self)}/{self.max_size} entries, {self.hits} hits, {self.misses} misses, "
+            f"{self.evictions} evictions"
+        )
+
+    def __repr__(self) -> str:
+        return f"<{self}>"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __setitem__(self, key: K, value: V) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                evicted_key, evicted_value = self._entries.popitem(last=False)
+                self.evictions += 1
+                if self.on_evict:
+                    self.on_evict(evicted_key, evicted_value)
+
+    def get(
+        self,
+        key: K,
+        default: V | None = None,
+        *,
+        validate: Callable[[V], bool] | None = None,
+    ) -> V | None:
+        """
+        Look up an entry, marking it as recently used.
+
+        Arguments:
+            key: The entry key.
+            default: The value to return if the entry is missing.
+            validate: A function that checks whether the entry is still valid; if it isn't, it's removed and considered
+                missing.
+
+        Returns:
+            The entry value, or the default if it's missing.
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if validate and not validate(value):
+                self.pop(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def items(self) -> list[tuple[K, V]]:
+        """
+        Return the entries, from the least to the most recently used, without affecting their order or statistics.
+
+        Returns:
+            A list of key-value pairs.
+        """
+        with self._lock:
+            return list(self._entries.items())
+
+    def pop(self, key: K) -> V | None:
+        """
+        Remove an entry.
+
+        Arguments:
+            key: The entry key.
+
+        Returns:
+            The removed value, or None if the entry is missing.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value = self._entries.pop(key)
+            if self.on_evict:
+                self.on_evict(key, value)
+            return value
+
+    def clear(self) -> None:
+        """
+        Remove all the entries and reset the statistics.
+        """
+        with self._lock:
+            while self._entries:
+                self.pop(next(iter(self._entries)))
+            self.hits = self.misses = self.evictions = 0
+
+
+class DiskCache:
+    """
+    A directory of cached entries that persists across processes, similar to __pycache__.
+
+        >>> cache = DiskCache(".auryn_cache")
+        >>> cache["key"] = {"text": "hello world"}
+        >>> cache.get("key")  # Possibly in another process.
+        {'text': 'hello world'}
+
+    Entries are dictionaries of marshallable values (e.g. strings, numbers, lists, dictionaries and code objects),
+    stored in a file per key. They are written atomically, so concurrent processes never read partial entries, and
+    entries that can't be read or written are considered missing, so a broken cache is never worse than no cache at all.
+
+    Attributes:
+        directory: The cache directory.
+        hits: How many lookups found their key.
+        misses: How many lookups didn't find their key.
+    """
+
+    default_directory_name: ClassVar[str] = ".auryn_cache"
+    entry_suffix: ClassVar[str] = ".marshal"
+
+    def __init__(self, directory: str | pathlib.Path) -> None:
+        self.directory = pathlib.Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self) -> str:
+        return f"disk cache at {self.directory}: {self.hits} hits, {self.misses} misses"
+
+    def __repr__(self) -> str:
+        return f"<{self}>"
+
+    def __setitem__(self, key: str, value: dict[str, Any]) -> None:
+        path = self._path(key)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(marshal.dumps(value))
+            os.replace(temp_path, path)
+        except OSError:
+            temp_path.unlink(missing_ok=True)
+
+    def get(
+        self,
+        key: str,
+        default: dict[str, Any] | None = None,
+        *,
+        validate: Callable[[dict[str, Any]], bool] | None = None,
+    ) -> dict[str, Any] | None:
+        """
+        Look up an entry.
+
+        Arguments:
+            key: The entry key.
+            default: The value to return if the entry is missing.
+            validate: A function that checks whether the entry is still valid; if it isn't, it's removed and considered
+                missing.
+
+        Returns:
+            The entry value, or the default if it's missing.
+        """
+        try:
+            value = marshal.loads(self._path(key).read_bytes())
+        except (OSError, ValueError, EOFError, TypeError):
+            value = None
+        if not isinstance(value, dict) or (validate and not validate(value)):
+            self.pop(key)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def pop(self, key: str) -> None:
+        """
+        Remove an entry.
+
+        Arguments:
+            key: The entry key.
+        """
+        try:
+            self._path(key).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """
+        Remove all the entries and reset the statistics.
+        """
+        import shutil
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.hits = self.misses = 0
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / f"{key}{self.entry_suffix}"
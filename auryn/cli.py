@@ -1,11 +1,13 @@
 import argparse
-import json
 import pathlib
 import sys
 from typing import Any
 
 from .api import execute, execute_standalone, generate
+from .cache import DiskCache
+from .environment import Environment
 from .errors import Error
+from .output import Writer
 
 
 def cli(argv: list[str] | None = None) -> None:
@@ -36,6 +38,12 @@ def cli(argv: list[str] | None = None) -> None:
         default=False,
         help="generate standalone code",
     )
+    generate_parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=False,
+        help=f"cache generated code in {DiskCache.default_directory_name} next to the template",
+    )
     generate_parser.add_argument(
         "context_kwargs",
         nargs="*",
@@ -54,6 +62,12 @@ def cli(argv: list[str] | None = None) -> None:
         default=False,
         help="do not load core plugin",
     )
+    run_parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=False,
+        help=f"cache generated code in {DiskCache.default_directory_name} next to the template",
+    )
     run_parser.add_argument(
         "context_kwargs",
         nargs="*",
@@ -77,24 +91,41 @@ def cli(argv: list[str] | None = None) -> None:
         match args.command:
             case "generate":
                 context = _parse_context(args.context, args.context_kwargs)
-                code = generate(
-                    pathlib.Path(args.template).absolute(),
-                    context,
-                    load=args.load,
-                    load_core=not args.no_core,
-                    standalone=args.standalone,
-                )
+                template = pathlib.Path(args.template).absolute()
+                if args.cache:
+                    code = _environment(template, args).generate(
+                        template,
+                        context,
+                        load=args.load,
+                        standalone=args.standalone,
+                    )
+                else:
+                    code = generate(
+                        template,
+                        context,
+                        load=args.load,
+                        load_core=not args.no_core,
+                        standalone=args.standalone,
+                    )
                 print(code)
 
             case "execute":
                 context = _parse_context(args.context, args.context_kwargs)
-                output = execute(
-                    pathlib.Path(args.template).absolute(),
-                    context,
-                    load=args.load,
-                    load_core=not args.no_core,
-                )
-                print(output)
+                template = pathlib.Path(args.template).absolute()
+                # Print the output as it's emitted, rather than once the execution is over; unlike stream, writing it
+                # into a sink keeps the execution in this thread.
+                sink = Writer(sys.stdout, buffer_size=0)
+                if args.cache:
+                    _environment(template, args).execute(template, context, load=args.load, sink=sink)
+                else:
+                    execute(
+                        template,
+                        context,
+                        load=args.load,
+                        load_core=not args.no_core,
+                        sink=sink,
+                    )
+                print()
 
             case "execute-standalone":
                 context = _parse_context(args.context, args.context_kwargs)
@@ -109,7 +140,16 @@ def cli(argv: list[str] | None = None) -> None:
         exit(1)
 
 
+def _environment(template: pathlib.Path, args: argparse.Namespace) -> Environment:
+    return Environment(
+        load_core=not args.no_core,
+        cache_directory=template.parent / DiskCache.default_directory_name,
+    )
+
+
 def _parse_context(path: str | pathlib.Path | None, args: list[str]) -> dict[str, Any]:
+    import json
+
     context: dict[str, Any] = {}
     if path:
         path = pathlib.Path(path)
@@ -1,12 +1,11 @@
 from __future__ import annotations
 
-import ast
 import builtins
-import json
 import pathlib
 import re
+from array import array
 from types import CodeType
-from typing import ClassVar, TypedDict
+from typing import ClassVar, Iterable, Iterator, Sequence, TypedDict, overload
 
 from .template import Template
 from .utils import refers_to_file
@@ -33,17 +32,34 @@ class Code:
     """
     The code generated in a generation/execution.
 
-    Attributes:
+    Generated code can run into hundreds of thousands of lines, so rather than an object per line, it's stored in
+    columns: the line contents, and compact arrays of their indentations, template line numbers and source indices (into
+    a table of the GXs that generated them). Line objects are only created when the lines are accessed.
+
+    Arguments:
         lines: The lines of generated code.
+
+    Attributes:
+        lines: The lines of generated code (see CodeLines).
     """
 
     # The prefix of the comment that holds the sources involved in the generation.
     sources_comment_prefix: ClassVar[str] = "# sources: "
 
-    def __init__(self, lines: list[Line] | None = None) -> None:
-        if lines is None:
-            lines = []
-        self.lines = lines
+    def __init__(self, lines: Iterable[Line] | None = None) -> None:
+        self._gxs: list[GX] = []
+        # GXs are mapped to their source index by identity, since that's how lines are attributed to them.
+        self._source_indices: dict[int, int] = {}
+        self._sources = array("i")
+        self._template_line_numbers = array("i")
+        self._indents = array("i")
+        self._contents: list[str] = []
+        for line in lines or []:
+            self.append(line.gx, line.template_line_number, line.indent, line.content)
+
+    @property
+    def lines(self) -> CodeLines:
+        return CodeLines(self)
 
     @classmethod
     def restore(cls, code: CodeArgument, *, stack_level: int = 0) -> tuple[Code, str]:
@@ -71,14 +87,15 @@ class Code:
         for line in text.splitlines():
             # Restore sources from the sources comment.
             if line.startswith(cls.sources_comment_prefix):
+                import json
+
                 sources: dict[str, Source] = json.loads(line.removeprefix(cls.sources_comment_prefix))
                 # For each source, create a GX with its ID, template path and text, and origin path and line number.
                 for source_id, source in sources.items():
-                    gx = GX(Origin.infer(stack_level=stack_level + 1), Template(), Code())
+                    template_path = source["template_path"]
+                    template = Template(source["template_text"], pathlib.Path(template_path) if template_path else None)
+                    gx = GX(Origin.infer(stack_level=stack_level + 1), template, Code())
                     gx.id = source_id
-                    if template_path := source["template_path"]:
-                        gx.template.path = pathlib.Path(template_path)
-                    gx.template.text = source["template_text"]
                     if origin_path := source["origin_path"]:
                         gx.origin.path = pathlib.Path(origin_path)
                     gx.origin.line_number = source["origin_line_number"]
@@ -96,7 +113,7 @@ class Code:
                 intro.append(line)
         return cls(lines), "\n".join(intro)
 
-    def append(self, gx: GX, template_line_number: int, indent: int, content: str) -> Line:
+    def append(self, gx: GX, template_line_number: int, indent: int, content: str) -> None:
         """
         Append a line.
 
@@ -105,13 +122,28 @@ class Code:
             template_line_number: The template line number the code is generated on.
             indent: The code indentation.
             content: The code content.
+        """
+        self._sources.append(self._source_index(gx))
+        self._template_line_numbers.append(template_line_number)
+        self._indents.append(indent)
+        self._contents.append(content)
 
-        Returns:
-            The appended line.
+    def extend(self, code: Code, indent: int = 0) -> None:
         """
-        line = Line(gx, template_line_number, indent, content)
-        self.lines.append(line)
-        return line
+        Append the lines of other generated code.
+
+        Arguments:
+            code: The generated code to append.
+            indent: How much to increase the appended lines' indentation.
+        """
+        source_indices = [self._source_index(gx) for gx in code._gxs]
+        self._sources.extend(source_indices[source] for source in code._sources)
+        self._template_line_numbers.extend(code._template_line_numbers)
+        if indent:
+            self._indents.extend(line_indent + indent for line_indent in code._indents)
+        else:
+            self._indents.extend(code._indents)
+        self._contents.extend(code._contents)
 
     def to_string(self, gx: GX, *, standalone: bool) -> str:
         """
@@ -124,22 +156,121 @@ class Code:
         Returns:
             The generated code as a string.
         """
-        code = "\n".join(line.to_string(add_source_comment=standalone) for line in self.lines)
+        code = "\n".join(self._to_strings(add_source_comment=standalone))
         if standalone:
             code = self._add_intro(gx, code)
         return code
 
+    def optimize(self) -> None:
+        """
+        Optimize the generated code, by merging consecutive emits of literal text at the same code indentation into a
+        single emit of a block of text.
+
+            >>> code.lines  # emit(0, '<ul>'), emit(4, '<li>'), emit(4, 'item'), emit(4, '</li>'), emit(0, '</ul>')
+            >>> code.optimize()
+            >>> code.lines  # emit_block('<ul>\\n    <li>\\n    item\\n    </li>\\n</ul>\\n')
+
+        Static regions of a template (e.g. boilerplate HTML) are then emitted with a single call, rather than a call per
+        line. The merged line is attributed to the first line it was merged from, so it still maps back to the template;
+        and since emitting literal text can't fail, errors are reported in the same place they would be otherwise.
+        """
+        # The optimized lines are collected into new columns, with the same sources.
+        code = type(self)()
+        code._gxs = self._gxs
+        code._source_indices = self._source_indices
+        block: list[str] = []
+        for source, template_line_number, indent, content in zip(
+            self._sources, self._template_line_numbers, self._indents, self._contents
+        ):
+            text = self._literal_text(content)
+            # If the line can't be merged into the current block (or there isn't one), start a new block; lines are only
+            # merged with lines at the same code indentation and from the same source (e.g. not an included template).
+            if text is None or not block or indent != code._indents[-1] or source != code._sources[-1]:
+                self._end_block(code, block)
+                content = content if text is None else ""
+                code._sources.append(source)
+                code._template_line_numbers.append(template_line_number)
+                code._indents.append(indent)
+                code._contents.append(content)
+                if text is None:
+                    continue
+            block.append(text)
+        self._end_block(code, block)
+        self._sources = code._sources
+        self._template_line_numbers = code._template_line_numbers
+        self._indents = code._indents
+        self._contents = code._contents
+
+    def dump(self) -> str:
+        """
+        Return the generated code as a string that can be restored later, with its sources and source comments but
+        without the intro that makes it executable on its own.
+
+        This is used to persist the generated code alongside its compiled code, which doesn't need the intro, but still
+        needs the sources to report errors.
+
+        Returns:
+            The generated code as a string.
+        """
+        output = list(self._to_strings(add_source_comment=True))
+        if sources_comment := self._sources_comment():
+            output.insert(0, sources_comment)
+        return "\n".join(output)
+
+    def _source_index(self, gx: GX) -> int:
+        source_index = self._source_indices.get(id(gx))
+        if source_index is None:
+            source_index = self._source_indices[id(gx)] = len(self._gxs)
+            self._gxs.append(gx)
+        return source_index
+
+    def _to_strings(self, *, add_source_comment: bool) -> Iterator[str]:
+        # The same as Line.to_string, without creating line objects.
+        if not add_source_comment:
+            for indent, content in zip(self._indents, self._contents):
+                yield f"{' ' * indent}{content}"
+            return
+        ids = [gx.id for gx in self._gxs]
+        for source, template_line_number, indent, content in zip(
+            self._sources, self._template_line_numbers, self._indents, self._contents
+        ):
+            yield f"{' ' * indent}{content} # {ids[source]}:{template_line_number}"
+
+    def _literal_text(self, content: str) -> str | None:
+        # Returns the text emitted by a line that emits literal text with a newline (or a block of such text), or None
+        # if the line does something else (e.g. interpolates expressions or emits inline).
+        for hook in [GX.EMIT, GX.EMIT_TEXT, GX.EMIT_NEWLINE, GX.EMIT_BLOCK]:
+            if content.startswith(f"{hook}(") and content.endswith(")"):
+                break
+        else:
+            return None
+        import ast
+
+        try:
+            args = ast.literal_eval(f"({content[len(hook) + 1 : -1]},)")
+        except (ValueError, SyntaxError):
+            return None
+        if hook == GX.EMIT_BLOCK:
+            return args[0]
+        indent, *values = args
+        if type(indent) is not int or not all(isinstance(value, str) for value in values):
+            return None
+        text = "".join(values)
+        # Text that starts with spaces (or spans several lines) can't be told apart from its indentation once merged.
+        if text.startswith(" ") or "\n" in text:
+            return None
+        return f"{' ' * indent}{text}\n"
+
+    def _end_block(self, code: Code, block: list[str]) -> None:
+        if not block:
+            return
+        code._contents[-1] = f"{GX.EMIT_BLOCK}({''.join(block)!r})"
+        block.clear()
+
     def _add_intro(self, gx: GX, code: str) -> str:
         intro: list[str] = []
-        # Add a comment with sources, mapping each GX ID to the configurations necessary to reconstruct it later: its
-        # template path and text, its origin path and line number, and its parent GX ID (if it has one).
-        sources: dict[str, Source] = {}
-        for line in self.lines:
-            if line.gx.id in sources:
-                continue
-            sources.update(self._collect_sources(line.gx))
-        if sources:
-            intro.append(f"{self.sources_comment_prefix}{json.dumps(sources)}\n")
+        if sources_comment := self._sources_comment():
+            intro.append(f"{sources_comment}\n")
         # Collect the files of any hooks mentioned in the generated code.
         paths: set[pathlib.Path] = set()
         for name in self._collect_global_references(code):
@@ -179,6 +310,20 @@ class Code:
             intro.append("")
         return "\n".join(intro) + code
 
+    def _sources_comment(self) -> str:
+        # A comment with sources, mapping each GX ID to the configurations necessary to reconstruct it later: its
+        # template path and text, its origin path and line number, and its parent GX ID (if it has one).
+        sources: dict[str, Source] = {}
+        for gx in self._gxs:
+            if gx.id in sources:
+                continue
+            sources.update(self._collect_sources(gx))
+        if not sources:
+            return ""
+        import json
+
+        return f"{self.sources_comment_prefix}{json.dumps(sources)}"
+
     def _collect_sources(self, gx: GX) -> dict[str, Source]:
         sources = {
             gx.id: Source(
@@ -208,6 +353,10 @@ class Code:
         paths: set[pathlib.Path],
     ) -> tuple[dict[str, str], dict[str, tuple[str, str | None]]]:
         # Use AST to collect all the hooks, definitions and imports.
+        import ast
+
+        from .definitions import DefinitionCollector
+
         hooks: dict[str, str] = {}
         defs: dict[str, str] = {}
         imps: dict[str, tuple[str, str | None]] = {}
@@ -246,10 +395,59 @@ class Code:
                 self._collect_dependencies(def_code, defs, imps, used_defs, used_imps)
 
 
+class CodeLines(Sequence["Line"]):
+    """
+    The lines of generated code, created as they're accessed.
+
+        >>> len(code.lines)
+        2
+        >>> code.lines[0].content
+        'for i in range(n):'
+        >>> [line.template_line_number for line in code.lines]
+        [1, 2]
+
+    Attributes:
+        code: The generated code.
+    """
+
+    def __init__(self, code: Code) -> None:
+        self.code = code
+
+    def __len__(self) -> int:
+        return len(self.code._contents)
+
+    @overload
+    def __getitem__(self, index: int) -> Line: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Line]: ...
+
+    def __getitem__(self, index: int | slice) -> Line | list[Line]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        code = self.code
+        return Line(
+            code._gxs[code._sources[index]],
+            code._template_line_numbers[index],
+            code._indents[index],
+            code._contents[index],
+        )
+
+    def __iter__(self) -> Iterator[Line]:
+        code = self.code
+        for source, template_line_number, indent, content in zip(
+            code._sources, code._template_line_numbers, code._indents, code._contents
+        ):
+            yield Line(code._gxs[source], template_line_number, indent, content)
+
+
 class Line:
     """
     A line of generated code.
 
+    Line objects are created when the lines of generated code are accessed (see CodeLines), so changing them doesn't
+    change the code.
+
     Attributes:
         gx: The generation/execution that generated the code.
         template_line_number: The template line number the code was generated on.
@@ -257,6 +455,8 @@ class Line:
         content: The code content.
     """
 
+    __slots__ = ("gx", "template_line_number", "indent", "content")
+
     def __init__(self, gx: GX, template_line_number: int, indent: int, content: str) -> None:
         self.gx = gx
         self.template_line_number = template_line_number
@@ -287,48 +487,5 @@ class Source(TypedDict):
     origin_gx: str | None
 
 
-class DefinitionCollector(ast.NodeTransformer):
-
-    def __init__(self) -> None:
-        # A mapping of hook names to their definitions.
-        self.hooks: dict[str, str] = {}
-        # A mapping of other names to their definitions.
-        self.defs: dict[str, str] = {}
-        # A mapping of what name is created (module or alias), what is imported (module or object), and from where from
-        # (module or None).
-        self.imps: dict[str, tuple[str, str | None]] = {}
-
-    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
-        # Collect definitions of hooks.
-        if node.name.startswith(GX.execution_prefix):
-            # Remove the execution prefix and the first argument (GX), which is passed implicitly; in standalone code it
-            # will be a global variable anyway.
-            node.name = node.name.removeprefix(GX.execution_prefix)
-            node.args.args = node.args.args[1:]
-            self.hooks[node.name] = ast.unparse(node)
-        # Collect other definitions, in case they are referenced by the hooks.
-        else:
-            self.defs[node.name] = ast.unparse(node)
-        return node
-
-    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
-        self.defs[node.name] = ast.unparse(node)
-        return node
-
-    def visit_Import(self, node: ast.Import) -> ast.Import:
-        for alias in node.names:
-            # import x      -> x: (x, None)
-            # import x as y -> y: (x, None)
-            self.imps[alias.asname or alias.name] = alias.name, None
-        return node
-
-    def visit_ImportFrom(self, node: ast.ImportFrom) -> ast.ImportFrom:
-        for alias in node.names:
-            # from x import y      -> y: (y, x)
-            # from x import y as z -> z: (y, x)
-            self.imps[alias.asname or alias.name] = alias.name, node.module
-        return node
-
-
 from .gx import GX
 from .origin import Origin
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from types import CodeType
+from typing import Any, Iterator
+
+
+class CompiledTemplate:
+    """
+    A template that was parsed, generated and compiled once, and can be rendered many times.
+
+        >>> template = CompiledTemplate(gx)
+        >>> print(template.render(n=2))
+        line 0
+        line 1
+        >>> print(template.render(n=3))
+        line 0
+        line 1
+        line 2
+
+    Each rendering runs the compiled code against a clone of the generation/execution, with a fresh execution namespace
+    and output, so renderings don't interfere with one another (even if they're concurrent).
+
+    If the generated code was already compiled (e.g. by another process, and loaded from a disk cache), its compiled
+    code can be passed in to skip the compilation.
+
+    Attributes:
+        gx: The generation/execution whose generated code is rendered.
+        code: The compiled generated code.
+    """
+
+    def __init__(self, gx: GX, code: CodeType | None = None) -> None:
+        self.gx = gx
+        if code is None:
+            self.code = gx.compile()
+        else:
+            self.code = gx._compile(gx.execution_file_suffix, gx.to_string(), "exec", code)
+
+    def __str__(self) -> str:
+        return f"compiled {self.gx}"
+
+    def __repr__(self) -> str:
+        return f"<{self}>"
+
+    def render(
+        self,
+        context: dict[str, Any] | None = None,
+        /,
+        *,
+        sink: Sink | None = None,
+        **context_kwargs: Any,
+    ) -> str:
+        """
+        Execute the compiled code.
+
+        Arguments:
+            context: Additional context to add to the execution namespace.
+            sink: Where to write the execution output as it's emitted, instead of returning it (see GX.execute).
+            **context_kwargs: Additional context to add to the execution namespace.
+
+        Returns:
+            The execution output (or an empty string, if it's written into a sink).
+        """
+        gx = self.gx.clone()
+        return gx._run(self.code, {**(context or {}), **context_kwargs}, sink)
+
+    def stream(self, context: dict[str, Any] | None = None, /, **context_kwargs: Any) -> Iterator[str]:
+        """
+        Execute the compiled code, yielding its output in chunks as it's emitted (see GX.execute_iter).
+
+        Arguments:
+            context: Additional context to add to the execution namespace.
+            **context_kwargs: Additional context to add to the execution namespace.
+
+        Returns:
+            An iterator over the execution output chunks.
+        """
+        gx = self.gx.clone()
+        return gx._iterate(self.code, {**(context or {}), **context_kwargs})
+
+
+from .gx import GX
+from .output import Sink
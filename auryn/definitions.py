@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import ast
+
+
+class DefinitionCollector(ast.NodeTransformer):
+
+    def __init__(self) -> None:
+        # A mapping of hook names to their definitions.
+        self.hooks: dict[str, str] = {}
+        # A mapping of other names to their definitions.
+        self.defs: dict[str, str] = {}
+        # A mapping of what name is created (module or alias), what is imported (module or object), and from where from
+        # (module or None).
+        self.imps: dict[str, tuple[str, str | None]] = {}
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
+        # Collect definitions of hooks.
+        if node.name.startswith(GX.execution_prefix):
+            # Remove the execution prefix and the first argument (GX), which is passed implicitly; in standalone code it
+            # will be a global variable anyway.
+            node.name = node.name.removeprefix(GX.execution_prefix)
+            node.args.args = node.args.args[1:]
+            self.hooks[node.name] = ast.unparse(node)
+        # Collect other definitions, in case they are referenced by the hooks.
+        else:
+            self.defs[node.name] = ast.unparse(node)
+        return node
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
+        self.defs[node.name] = ast.unparse(node)
+        return node
+
+    def visit_Import(self, node: ast.Import) -> ast.Import:
+        for alias in node.names:
+            # import x      -> x: (x, None)
+            # import x as y -> y: (x, None)
+            self.imps[alias.asname or alias.name] = alias.name, None
+        return node
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> ast.ImportFrom:
+        for alias in node.names:
+            # from x import y      -> y: (y, x)
+            # from x import y as z -> z: (y, x)
+            self.imps[alias.asname or alias.name] = alias.name, node.module
+        return node
+
+
+from .gx import GX
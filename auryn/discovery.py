@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import pathlib
+import threading
+from typing import TYPE_CHECKING, ClassVar, Iterable
+
+from .cache import DiskCache
+
+if TYPE_CHECKING:
+    import ast
+
+
+class PluginIndex:
+    """
+    An index of the macros and hooks defined by the plugin modules in a set of directories, so a plugin can be loaded
+    only once one of its names is needed, instead of eagerly.
+
+        >>> index = PluginIndex()
+        >>> index.find(["plugins"], "g_hello")
+        PosixPath('plugins/hello.py')
+
+    The names are found statically, by parsing the modules rather than executing them (so only top-level definitions,
+    assignments and imports count), and are cached on disk next to each module (similar to __pycache__), so the index is
+    cheap to build even for many modules; a module is only parsed again once its modification time or size change.
+
+    Attributes:
+        prefixes: The prefixes of the names to index.
+        disk_cache: Whether to cache the names of each module on disk.
+    """
+
+    default_prefixes: ClassVar[tuple[str, ...]] = ("g_", "x_")
+
+    def __init__(self, prefixes: Iterable[str] | None = None, disk_cache: bool = True) -> None:
+        if prefixes is None:
+            prefixes = self.default_prefixes
+        self.prefixes = tuple(prefixes)
+        self.disk_cache = disk_cache
+        self._indexes: dict[tuple[pathlib.Path, ...], dict[str, pathlib.Path]] = {}
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f"plugin index of {len(self._indexes)} directory sets"
+
+    def __repr__(self) -> str:
+        return f"<{self}>"
+
+    def find(self, directories: Iterable[pathlib.Path], name: str) -> pathlib.Path | None:
+        """
+        Find the plugin module that defines a name.
+
+        Arguments:
+            directories: The directories to look in, by order of precedence.
+            name: The name to look for (including its prefix, e.g. g_hello).
+
+        Returns:
+            The path of the first module that defines the name, or None if there's none.
+        """
+        return self.names(directories).get(name)
+
+    def names(self, directories: Iterable[pathlib.Path]) -> dict[str, pathlib.Path]:
+        """
+        Get the names defined by the plugin modules in a set of directories.
+
+        The index of a set of directories is built the first time it's needed; to pick up modules that were added,
+        changed or removed since then, call PluginIndex.refresh.
+
+        Arguments:
+            directories: The directories to look in, by order of precedence.
+
+        Returns:
+            A dictionary mapping each name to the path of the first module that defines it.
+        """
+        key = tuple(directories)
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = self._indexes[key] = self._build(key)
+        return index
+
+    def refresh(self) -> None:
+        """
+        Forget the indexes built so far, so they're built again the next time they're needed.
+        """
+        with self._lock:
+            self._indexes.clear()
+
+    def _build(self, directories: tuple[pathlib.Path, ...]) -> dict[str, pathlib.Path]:
+        index: dict[str, pathlib.Path] = {}
+        for directory in directories:
+            cache = DiskCache(directory / DiskCache.default_directory_name) if self.disk_cache else None
+            for path in sorted(directory.glob("*.py")):
+                for name in self._module_names(path, cache):
+                    index.setdefault(name, path)
+        return index
+
+    def _module_names(self, path: pathlib.Path, cache: DiskCache | None) -> list[str]:
+        # The index is built rarely, so the modules it needs are only imported once it is.
+        import ast
+        import hashlib
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return []
+        key = f"plugin_index_{hashlib.sha256(str(path.absolute()).encode()).hexdigest()}"
+        signature = [stat.st_mtime_ns, stat.st_size, list(self.prefixes)]
+        if cache:
+            entry = cache.get(key, validate=lambda entry: entry.get("signature") == signature)
+            if entry:
+                return entry["names"]
+        try:
+            module = ast.parse(path.read_text(), str(path))
+        except (OSError, SyntaxError, ValueError):
+            # Broken modules are reported when they're loaded, not when they're indexed.
+            return []
+        names = [name for name in _top_level_names(module) if name.startswith(self.prefixes)]
+        if cache:
+            cache[key] = {"signature": signature, "names": names}
+        return names
+
+
+def _top_level_names(module: ast.Module) -> Iterable[str]:
+    import ast
+
+    for node in module.body:
+        if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+            yield node.name
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                yield from _target_names(target)
+        elif isinstance(node, ast.AnnAssign | ast.AugAssign):
+            yield from _target_names(node.target)
+        elif isinstance(node, ast.Import | ast.ImportFrom):
+            for alias in node.names:
+                yield alias.asname or alias.name.split(".")[0]
+
+
+def _target_names(target: ast.expr) -> Iterable[str]:
+    import ast
+
+    if isinstance(target, ast.Name):
+        yield target.id
+    elif isinstance(target, ast.Tuple | ast.List):
+        for element in target.elts:
+            yield from _target_names(element)
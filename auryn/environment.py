@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import pathlib
+from typing import Any, ClassVar, Hashable, Iterator, NamedTuple
+
+from .cache import DiskCache, LRUCache
+from .utils import freeze, refers_to_file
+
+# The key in the generation state under which the files a generation depends on are collected.
+DEPENDENCIES = "dependencies"
+
+
+class Environment:
+    """
+    A shared configuration and cache for generations/executions, for long-running processes that use the same templates
+    over and over again.
+
+        >>> env = Environment(load="filesystem")
+        >>> output = env.execute("page.aur", title="Hello")  # Parsed, generated and compiled.
+        >>> output = env.execute("page.aur", title="World")  # Reused.
+
+    Parsed templates are cached by their path, and reused as long as their modification time or content hash haven't
+    changed; generated and compiled code is cached by the template, plugins and generation context, and reused as long
+    as the template and every file its generation read (e.g. with %include, %extend, %load or a filesystem source)
+    haven't changed.
+
+    With a cache directory, compiled templates of template files are also persisted to disk (along with their generated
+    code), so that other processes can reuse them, skipping parsing, generation and compilation entirely:
+
+        >>> env = Environment(cache_directory=".auryn_cache")
+
+    Entries are keyed by the template path, plugins, generation context and auryn version, and are reused as long as the
+    hashes of the template and every file its generation read haven't changed; generations that load plugins that
+    can't be loaded again from a name or path (e.g. dictionaries), or whose context isn't JSON-serializable, are not
+    persisted.
+
+    Attributes:
+        load: Additional plugins to load into every generation/execution.
+        load_core: Whether to load the core plugin (default is GX.load_core_by_default).
+        template_cache: The cache of parsed templates.
+        compiled_cache: The cache of compiled templates.
+        disk_cache: The cache of compiled templates on disk (if there's a cache directory).
+    """
+
+    default_cache_size: ClassVar[int] = 128
+
+    def __init__(
+        self,
+        *,
+        load: PluginArgument | None = None,
+        load_core: bool | None = None,
+        cache_size: int | None = None,
+        cache_directory: str | pathlib.Path | None = None,
+    ) -> None:
+        if cache_size is None:
+            cache_size = self.default_cache_size
+        self.load = load
+        self.load_core = load_core
+        self.template_cache: LRUCache[pathlib.Path, CachedFile] = LRUCache(cache_size)
+        self.compiled_cache: LRUCache[Hashable, CachedTemplate] = LRUCache(cache_size)
+        self.disk_cache = DiskCache(cache_directory) if cache_directory is not None else None
+
+    def __str__(self) -> str:
+        return f"environment ({len(self.template_cache)} templates, {len(self.compiled_cache)} compiled templates)"
+
+    def __repr__(self) -> str:
+        return f"<{self}>"
+
+    def read(self, path: str | pathlib.Path, gx: GX | None = None) -> str:
+        """
+        Read a file through the cache.
+
+        Arguments:
+            path: The file path.
+            gx: The generation/execution reading the file, if it's read during a generation (so that it's recorded as
+                one of its dependencies).
+
+        Returns:
+            The file contents.
+        """
+        return self._get(pathlib.Path(path), self._dependencies(gx)).text
+
+    def parse(self, template: TemplateArgument, gx: GX | None = None) -> Template:
+        """
+        Parse a template through the cache.
+
+        Arguments:
+            template: The template to parse.
+                If it's a template object, it's returned as is; if it's a path object or a string refering to a valid
+                file, its contents are parsed; otherwise, *it* is parsed.
+            gx: The generation/execution parsing the template, if it's parsed during a generation (so that it's recorded
+                as one of its dependencies).
+
+        Returns:
+            The parsed template.
+        """
+        if isinstance(template, Template):
+            return template
+        if not refers_to_file(template):
+            return Template.parse(template)
+        return self._parse(pathlib.Path(template), self._dependencies(gx))
+
+    def compile(
+        self,
+        template: TemplateArgument,
+        context: dict[str, Any] | None = None,
+        /,
+        *,
+        load: PluginArgument | None = None,
+        stack_level: int = 0,
+        **context_kwargs: Any,
+    ) -> CompiledTemplate:
+        """
+        Generate code from a template and compile it through the cache.
+
+        Arguments:
+            template: The template used as generation instructions.
+                If it's a template object, it's used as is (and not cached); if it's a path object or a string refering
+                to a valid file, its contents are parsed; otherwise, *it* is parsed.
+            context: Additional context to add to the generation namespace.
+            load: Additional plugins to load into the generation and execution (on top of the environment's).
+            stack_level: How many frames to ascend to infer the GX origin.
+            **context_kwargs: Additional context to add to the generation namespace.
+
+        Returns:
+            The compiled template.
+        """
+        context = {**(context or {}), **context_kwargs}
+        key = self._key(template, load, context)
+        if key is not None:
+            cached_template = self.compiled_cache.get(key, validate=lambda entry: self._is_fresh(entry.dependencies))
+            if cached_template:
+                return cached_template.compiled_template
+        disk_key = self._disk_key(template, load, context)
+        if disk_key is not None:
+            cached_template = self._load(disk_key, pathlib.Path(template), stack_level + 1)  # type: ignore
+            if cached_template:
+                if key is not None:
+                    self.compiled_cache[key] = cached_template
+                return cached_template.compiled_template
+        dependencies: dict[pathlib.Path, Signature] = {}
+        if isinstance(template, Template) or not refers_to_file(template):
+            parsed_template = Template.parse(template)
+        else:
+            parsed_template = self._parse(pathlib.Path(template), dependencies)
+        gx = GX.parse(parsed_template, load_core=self.load_core, stack_level=stack_level + 1)
+        gx.environment = self
+        gx.state[DEPENDENCIES] = dependencies
+        if self.load:
+            gx.load(self.load)
+        if load:
+            gx.load(load)
+        gx.generate(context)
+        compiled_template = CompiledTemplate(gx)
+        if key is not None:
+            self.compiled_cache[key] = CachedTemplate(compiled_template, dependencies)
+        if disk_key is not None:
+            self._store(disk_key, compiled_template, dependencies)
+        return compiled_template
+
+    def generate(
+        self,
+        template: TemplateArgument,
+        context: dict[str, Any] | None = None,
+        /,
+        *,
+        load: PluginArgument | None = None,
+        standalone: bool | None = None,
+        stack_level: int = 0,
+        **context_kwargs: Any,
+    ) -> str:
+        """
+        Generate code from a template through the cache.
+
+        See Environment.compile for the arguments; standalone determines whether the generated code should be able to
+        run on its own.
+
+        Returns:
+            The generated code.
+        """
+        compiled_template = self.compile(template, context, load=load, stack_level=stack_level + 1, **context_kwargs)
+        return compiled_template.gx.to_string(standalone=standalone)
+
+    def execute(
+        self,
+        template: TemplateArgument,
+        context: dict[str, Any] | None = None,
+        /,
+        *,
+        load: PluginArgument | None = None,
+        sink: Sink | None = None,
+        stack_level: int = 0,
+        **context_kwargs: Any,
+    ) -> str:
+        """
+        Generate code from a template through the cache, and execute it.
+
+        See Environment.compile for the arguments; as in execute, context names starting with g_ are added to the
+        generation namespace, and the rest are added to the execution namespace, and the output can be written into a
+        sink (see GX.execute).
+
+        Returns:
+            The execution output (or an empty string, if it's written into a sink).
+        """
+        g_context, x_context = _split_context({**(context or {}), **context_kwargs})
+        compiled_template = self.compile(template, g_context, load=load, stack_level=stack_level + 1)
+        return compiled_template.render(x_context, sink=sink)
+
+    def stream(
+        self,
+        template: TemplateArgument,
+        context: dict[str, Any] | None = None,
+        /,
+        *,
+        load: PluginArgument | None = None,
+        stack_level: int = 0,
+        **context_kwargs: Any,
+    ) -> Iterator[str]:
+        """
+        Generate code from a template through the cache, and execute it, yielding its output in chunks as it's emitted.
+
+        See Environment.execute for the arguments.
+
+        Returns:
+            An iterator over the execution output chunks.
+        """
+        g_context, x_context = _split_context({**(context or {}), **context_kwargs})
+        compiled_template = self.compile(template, g_context, load=load, stack_level=stack_level + 1)
+        return compiled_template.stream(x_context)
+
+    def invalidate(self, path: str | pathlib.Path | None = None) -> None:
+        """
+        Remove a file, and every compiled template that depends on it, from the cache.
+
+        Arguments:
+            path: The file path (if not provided, the entire cache is cleared).
+        """
+        if path is None:
+            self.template_cache.clear()
+            self.compiled_cache.clear()
+            if self.disk_cache:
+                self.disk_cache.clear()
+            return
+        path = pathlib.Path(path).absolute()
+        self.template_cache.pop(path)
+        for key, cached_template in self.compiled_cache.items():
+            if path in cached_template.dependencies:
+                self.compiled_cache.pop(key)
+
+    def _load(self, disk_key: str, path: pathlib.Path, stack_level: int) -> CachedTemplate | None:
+        assert self.disk_cache is not None
+        entry = self.disk_cache.get(
+            disk_key,
+            validate=lambda entry: self._is_fresh(_load_dependencies(entry["dependencies"])),
+        )
+        if not entry:
+            return None
+        # The generation is already complete, so the GX is restored without parsing its template: it only needs its text
+        # (to report errors), its generated code (restored from the dump), and its hooks (loaded without on_load, which
+        # only affects the generation).
+        dependencies = _load_dependencies(entry["dependencies"])
+        absolute_path = path.absolute()
+        template = Template(self.read(absolute_path), absolute_path)
+        gx = GX(Origin.infer(stack_level + 1), template, Code())
+        gx.environment = self
+        gx.state[DEPENDENCIES] = dependencies
+        gx.load(entry["plugins"], on_load=False)
+        gx.code, _ = Code.restore(entry["code"], stack_level=stack_level + 1)
+        return CachedTemplate(CompiledTemplate(gx, entry["bytecode"]), dependencies)
+
+    def _store(
+        self,
+        disk_key: str,
+        compiled_template: CompiledTemplate,
+        dependencies: dict[pathlib.Path, Signature],
+    ) -> None:
+        assert self.disk_cache is not None
+        gx = compiled_template.gx
+        # Plugins that can't be loaded again by name or path can't be restored in another process.
+        if None in gx._plugins:
+            return
+        self.disk_cache[disk_key] = {
+            "plugins": gx._plugins,
+            "dependencies": {str(path): tuple(signature) for path, signature in dependencies.items()},
+            "code": gx.code.dump(),
+            "bytecode": compiled_template.code,
+        }
+
+    def _parse(self, path: pathlib.Path, dependencies: dict[pathlib.Path, Signature] | None) -> Template:
+        cached_file = self._get(path, dependencies)
+        if cached_file.template is None:
+            cached_file.template = Template.from_text(cached_file.text, path)
+        # Templates are immutable, so the cached template can be shared by every generation.
+        return cached_file.template
+
+    def _get(self, path: pathlib.Path, dependencies: dict[pathlib.Path, Signature] | None) -> CachedFile:
+        absolute_path = path.absolute()
+        cached_file = self.template_cache.get(
+            absolute_path,
+            validate=lambda entry: self._is_fresh_file(absolute_path, entry),
+        )
+        if not cached_file:
+            text = absolute_path.read_text()
+            cached_file = CachedFile(Signature.of(absolute_path, text), text)
+            self.template_cache[absolute_path] = cached_file
+        if dependencies is not None:
+            dependencies[absolute_path] = cached_file.signature
+        return cached_file
+
+    def _dependencies(self, gx: GX | None) -> dict[pathlib.Path, Signature] | None:
+        if gx is None:
+            return None
+        return gx.state.setdefault(DEPENDENCIES, {})
+
+    def _is_fresh(self, dependencies: dict[pathlib.Path, Signature]) -> bool:
+        for path, signature in dependencies.items():
+            try:
+                stat = path.stat()
+            except OSError:
+                return False
+            # If the modification time and size are the same, the file is assumed not to have changed; otherwise, it's
+            # only considered changed if its content is actually different.
+            if (stat.st_mtime_ns, stat.st_size) == (signature.mtime, signature.size):
+                continue
+            current_signature = Signature.of(path, path.read_text())
+            if current_signature.digest != signature.digest:
+                return False
+            # If it's the same, its signature is updated, so it's not read again the next time (e.g. after a touch).
+            dependencies[path] = current_signature
+        return True
+
+    def _is_fresh_file(self, path: pathlib.Path, cached_file: CachedFile) -> bool:
+        dependencies = {path: cached_file.signature}
+        if not self._is_fresh(dependencies):
+            return False
+        cached_file.signature = dependencies[path]
+        return True
+
+    def _key(self, template: TemplateArgument, load: PluginArgument | None, context: dict[str, Any]) -> Hashable:
+        # Template objects may be modified after they're passed in, so they're not cached.
+        if isinstance(template, Template):
+            return None
+        if refers_to_file(template):
+            template_key: Hashable = pathlib.Path(template).absolute()
+        else:
+            template_key = str(template)
+        try:
+            return template_key, freeze(load), freeze(context)
+        except TypeError:
+            return None
+
+    def _disk_key(self, template: TemplateArgument, load: PluginArgument | None, context: dict[str, Any]) -> str | None:
+        # Only template files are persisted, since the meaning of a template string (e.g. of the relative paths in it)
+        # depends on where it's defined.
+        if not self.disk_cache or isinstance(template, Template) or not refers_to_file(template):
+            return None
+        import json
+
+        try:
+            key = json.dumps(
+                [
+                    _auryn_version(),
+                    str(pathlib.Path(template).absolute()),
+                    _plugin_key(self.load),
+                    self.load_core,
+                    _plugin_key(load),
+                    context,
+                ],
+                sort_keys=True,
+            )
+        except TypeError:
+            return None
+        return hashlib.sha256(key.encode()).hexdigest()
+
+
+class Signature(NamedTuple):
+    """
+    The state of a file when it was read, to know whether it changed since.
+
+    Attributes:
+        mtime: The file's modification time, in nanoseconds.
+        size: The file's size, in bytes.
+        digest: The SHA-256 hash of the file's contents (only compared if its modification time or size changed).
+    """
+
+    mtime: int
+    size: int
+    digest: str
+
+    @classmethod
+    def of(cls, path: pathlib.Path, text: str) -> Signature:
+        """
+        Create the signature of a file.
+
+        Arguments:
+            path: The file path.
+            text: The file contents, as they were read.
+
+        Returns:
+            The file signature.
+        """
+        stat = path.stat()
+        return cls(stat.st_mtime_ns, stat.st_size, hashlib.sha256(text.encode()).hexdigest())
+
+
+class CachedFile:
+    """
+    A file read through the environment cache.
+
+    Attributes:
+        signature: The file signature, updated when the file is found unchanged (e.g. after a touch).
+        text: The file contents.
+        template: The template parsed from the file, once it's parsed (or None).
+    """
+
+    def __init__(self, signature: Signature, text: str) -> None:
+        self.signature = signature
+        self.text = text
+        self.template: Template | None = None
+
+
+class CachedTemplate(NamedTuple):
+    """
+    A compiled template in the environment cache.
+
+    Attributes:
+        compiled_template: The compiled template.
+        dependencies: The signatures of the files its generation read, by path.
+    """
+
+    compiled_template: CompiledTemplate
+    dependencies: dict[pathlib.Path, Signature]
+
+
+@functools.cache
+def _auryn_version() -> str:
+    # Entries persisted to disk are only valid for the same version of auryn and of Python's bytecode; since auryn might
+    # be used from a source checkout, the modification times and sizes of its modules are considered as well.
+    import importlib.metadata
+    import importlib.util
+
+    version = [importlib.util.MAGIC_NUMBER.hex()]
+    try:
+        version.append(importlib.metadata.version("auryn"))
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    for path in sorted(pathlib.Path(__file__).parent.rglob("*.py")):
+        stat = path.stat()
+        version.append(f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha256("\n".join(version).encode()).hexdigest()
+
+
+def _split_context(context: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    g_context: dict[str, Any] = {}
+    x_context: dict[str, Any] = {}
+    for key, value in context.items():
+        if key.startswith(GX.generation_prefix):
+            g_context[key.removeprefix(GX.generation_prefix)] = value
+        else:
+            x_context[key] = value
+    return g_context, x_context
+
+
+def _plugin_key(plugin: PluginArgument | None) -> Any:
+    # Returns a JSON-serializable representation of the plugin, or raises a TypeError if there's none.
+    if plugin is None or isinstance(plugin, str):
+        return plugin
+    if isinstance(plugin, pathlib.Path):
+        return str(plugin.absolute())
+    if isinstance(plugin, dict):
+        raise TypeError(f"plugin {plugin!r} can't be persisted")
+    return [_plugin_key(item) for item in plugin]
+
+
+def _load_dependencies(dependencies: dict[str, tuple[int, int, str]]) -> dict[pathlib.Path, Signature]:
+    return {pathlib.Path(path): Signature(*signature) for path, signature in dependencies.items()}
+
+
+from .code import Code
+from .compiled import CompiledTemplate
+from .gx import GX, PluginArgument
+from .origin import Origin
+from .output import Sink
+from .template import Template, TemplateArgument
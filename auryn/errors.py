@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-import ast
+import linecache
 import pathlib
-import shutil
-import textwrap
+from types import TracebackType
 from typing import Any, ClassVar, Iterator
 
 from .utils import crop_lines
@@ -18,7 +17,7 @@ class StopExecution(Exception):
 class Error(Exception):
 
     message: ClassVar[str] = "Error on {gx}: {error}."
-    width: ClassVar[int] = shutil.get_terminal_size(fallback=(120, 30)).columns
+    width: ClassVar[int | None] = None  # Default is the terminal width when the report is created.
     slice_size: ClassVar[int] = 10
     reset: ClassVar[str] = "\x1b[0m"
     styles: ClassVar[dict[str, str]] = {
@@ -40,6 +39,10 @@ class Error(Exception):
         return self.message.format(gx=self.gx, error=str(self.error).strip("."))
 
     def report(self) -> str:
+        # Reports are rare, so the modules they need are only imported once they're created.
+        import shutil
+
+        self._width = self.width or shutil.get_terminal_size(fallback=(120, 30)).columns
         self._indent = 0
         self._output: list[str] = []
         self._add_text(f"{self}", style="error")
@@ -65,7 +68,7 @@ class Error(Exception):
             self._output.append(self.reset)
 
     def _add_title(self, title: str) -> None:
-        self._output.append(f"\n{self.styles['title']}{title.ljust(self.width)}{self.reset}\n")
+        self._output.append(f"\n{self.styles['title']}{title.ljust(self._width)}{self.reset}\n")
 
     def _add_context(self, context: dict[str, Any]) -> None:
         self._add_title("CONTEXT")
@@ -140,9 +143,14 @@ class Error(Exception):
         self._add_text("???", style="unknown")
 
     def _add_code(self, filename: str, line_number: int, dim: bool = False) -> None:
+        import ast
+
         self._indent += 4
         try:
-            code = pathlib.Path(filename).read_text()
+            # Dynamic code is only registered in linecache, so read files through it as well (making sure files that
+            # changed since they were cached are reloaded).
+            linecache.checkcache(filename)
+            code = "".join(linecache.getlines(filename))
             # Show the function definition in which this line is located.
             tree = ast.parse(code)
             for node in ast.walk(tree):
@@ -177,15 +185,15 @@ class Error(Exception):
         self._add_text("\n".join(lines[line_number + 1 : line_number + size]).rstrip(), dim=dim)
 
     def _location(self, filename: str, line_number: int) -> str:
-        # Dynamic code during generation is saved in temporary files with the name:
-        # <temporary-directory>/<temporary-prefix>.<filename>-<line-number>.g.py
+        # Dynamic code during generation is registered under the virtual filename:
+        # <auryn-<snippet-id>>.<filename>-<line-number>.g.py
         if filename.endswith(GX.generation_file_suffix):
-            location = self._parse_temp_location(GX.generation_file_suffix, filename)
+            location = self._parse_snippet_location(GX.generation_file_suffix, filename)
             return f"generation of GX {location}"
-        # Dynamic code during execution is saved in temporary files with the name:
-        # <temporary-directory>/<temporary-prefix>.<filename>-<line-number>.x.py
+        # Dynamic code during execution is registered under the virtual filename:
+        # <auryn-<snippet-id>>.<filename>-<line-number>.x.py
         if filename.endswith(GX.execution_file_suffix):
-            location = self._parse_temp_location(GX.execution_file_suffix, filename)
+            location = self._parse_snippet_location(GX.execution_file_suffix, filename)
             return f"execution of GX {location}"
         # Otherwise, make the path relative if possible, and use the full path if not.
         path, cwd = pathlib.Path(filename), pathlib.Path.cwd()
@@ -194,11 +202,13 @@ class Error(Exception):
         return f"{filename}:{line_number}"
 
     def _wrap(self, text: str, width_offset: int = 0) -> Iterator[str]:
+        import textwrap
+
         for line in text.splitlines():
-            for subline in textwrap.wrap(line, width=self.width - self._indent - width_offset):
+            for subline in textwrap.wrap(line, width=self._width - self._indent - width_offset):
                 yield " " * self._indent + subline
 
-    def _parse_temp_location(self, suffix: str, filename: str) -> str:
+    def _parse_snippet_location(self, suffix: str, filename: str) -> str:
         name = filename.removesuffix(suffix).rsplit(".", 1)[1]
         if "-" in name:
             return f"at {name.replace('-', ':')}"
@@ -220,24 +230,37 @@ class ExecutionError(Error):
     message: ClassVar[str] = "Failed to execute {gx}: {error}."
 
     def _report(self) -> None:
-        self._add_context(self.gx.x_globals)
+        context = self.gx.x_globals
+        # If the generated code was compiled into a function, its local variables are part of the context as well.
+        traceback = self._find_traceback()
+        if traceback and traceback.tb_frame.f_code.co_flags & CO_OPTIMIZED:
+            context = {**context, **traceback.tb_frame.f_locals}
+            context.pop(FUNCTION_NAMESPACE, None)
+        self._add_context(context)
         junk, line_number = self._find_source()
         if junk:
             self._add_template(junk, line_number)
         self._add_traceback()
 
     def _find_source(self) -> tuple[GX, int]:
-        first_line_number = self.gx.code.lines[0].template_line_number
-        # Dynamic code during execution is saved in temporary files with the name:
-        # <temporary-directory>/<temporary-prefix>.<filename>-<line-number>.x.py
+        # The generated code is compiled line by line, so its line numbers (starting from 1) index its lines.
+        line_number = 0
+        if traceback := self._find_traceback():
+            line_number = traceback.tb_frame.f_lineno - 1
+        line = self.gx.code.lines[line_number]
+        return line.gx, line.template_line_number
+
+    def _find_traceback(self) -> TracebackType | None:
+        # Dynamic code during execution is registered under the virtual filename:
+        # <auryn-<snippet-id>>.<filename>-<line-number>.x.py
+        # Generated code might call functions it defines (e.g. subroutines), so the innermost such frame is used.
+        found = None
         traceback = self.error.__traceback__
         while traceback:
             if traceback.tb_frame.f_code.co_filename.endswith(GX.execution_file_suffix):
-                line_number = traceback.tb_frame.f_lineno - first_line_number
-                break
+                found = traceback
             traceback = traceback.tb_next
-        line = self.gx.code.lines[line_number]
-        return line.gx, line.template_line_number
+        return found
 
 
-from .gx import GX
+from .gx import CO_OPTIMIZED, FUNCTION_NAMESPACE, GX
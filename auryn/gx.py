@@ -1,21 +1,46 @@
 from __future__ import annotations
 
+import collections
 import contextlib
-import os
+import contextvars
+import functools
+import itertools
+import linecache
 import pathlib
 import re
 import sys
-import tempfile
-import uuid
-from typing import Any, Callable, ClassVar, Iterable, Iterator, Self
+import threading
+import types
+from types import CodeType, GeneratorType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    Generator,
+    Iterable,
+    Iterator,
+    Mapping,
+    MutableMapping,
+    NamedTuple,
+    Self,
+)
 
+from .cache import LRUCache
+from .discovery import PluginIndex
 from .interpolate import interpolate as interpolate_
 from .interpolate import split
 from .utils import concat, crop_lines, refers_to_file
 
-type LineTransform = Callable[[GX, str], None]
+# Modules that are only needed for some features (e.g. optimization) are imported when they're first used, so importing
+# auryn stays cheap (e.g. for the CLI, or for workers that only execute standalone code).
+if TYPE_CHECKING:
+    import ast
+
+type Continuation = Lines | Generator[Lines, None, None] | None
+type LineTransform = Callable[[GX, str], Continuation]
 type PostProcessor = Callable[[GX], None]
-type PluginArgument = str | pathlib.Path | dict[str, Any] | Iterable[PluginArgument]
+type PluginArgument = str | pathlib.Path | dict[str, Any] | PluginBundle | Iterable[PluginArgument]
 
 MACRO_INVOCATION = re.compile(
     r"""
@@ -30,6 +55,36 @@ MACRO_INVOCATION = re.compile(
     """,
     flags=re.VERBOSE,
 )
+# An expression that evaluates macro arguments passed as code into positional and keyword arguments.
+MACRO_ARGUMENTS = "(lambda *args, **kwargs: (args, kwargs))({})"
+DEFINITION = re.compile(r"^(async\s+)?(def|class)\b")
+SIMPLE_EXPRESSION = re.compile(r"^[A-Za-z_][\w.]*$")
+# Generated code compiled into a function (see GX.compile) is compiled in this mode, into a function of this name, which
+# takes the execution namespace as an argument of this name.
+FUNCTION_MODE = "function"
+FUNCTION_NAME = "<template>"
+FUNCTION_NAMESPACE = "_x_globals"
+# The flag of code objects compiled into a function (same as inspect.CO_OPTIMIZED, without importing inspect).
+CO_OPTIMIZED = 0x1
+# A counter used to give dynamically executed code a unique virtual filename.
+SNIPPET_IDS = itertools.count(1)
+# The bundles of builtin plugins, by plugin name and naming conventions, with the size of the plugin namespace and the
+# items they were bundled from when they were bundled (to know whether it changed since).
+PLUGIN_BUNDLES: dict[tuple[str, str, str, str], tuple[int, tuple[tuple[str, Any], ...], PluginBundle]] = {}
+# A sentinel for names missing from a layer of a namespace.
+NAMESPACE_MISSING = object()
+
+
+def _forget_snippet(key: tuple[str, str, str, frozenset[str]], code: CodeType) -> None:
+    # When compiled dynamic code is evicted from the cache, it can be removed from linecache as well.
+    linecache.cache.pop(code.co_filename, None)
+
+
+def _rename_code(code: CodeType, filename: str) -> CodeType:
+    # Code objects keep their filename in nested code objects (e.g. of functions) as well, so they're renamed
+    # recursively.
+    consts = tuple(_rename_code(const, filename) if isinstance(const, CodeType) else const for const in code.co_consts)
+    return code.replace(co_filename=filename, co_consts=consts)
 
 
 class GX:
@@ -44,7 +99,7 @@ class GX:
         >>> code = gx.to_string()
         >>> print(code)
         for i in range(n):
-            emit(0, 'line ', i)
+            emit_text(0, f'line {i!s}')
         >>> output = gx.execute(n=3)
         >>> print(output)
         line 0
@@ -57,12 +112,14 @@ class GX:
         code: The generated code.
         line_transforms: A map of prefixes to transformations applied to lines starting with that prefix.
         g_globals: The namespace used during generation.
-        g_locals: The local namespace used during generation.
+        g_locals: The local namespace used during generation (a Namespace layered over the including one, in GXs that
+            continue its generation or are included by it).
         x_globals: The namespace used during execution (since the generated code is a module, its globals and locals
             coincide).
         state: An out-of-scope stash for values that don't belong in an explicit namespace (e.g. blocks shared between
             %define and %insert or bookmarks extended with %append).
         postprocessors: Functions called after the generation to post-process it (e.g. in %extend).
+        environment: The environment whose cache is used to read files and parse templates (if any).
         interpolation: The delimiters used for interpolation.
         inline: Whether to inline generated code or not.
         output: The execution output.
@@ -87,9 +144,27 @@ class GX:
     default_interpolation: ClassVar[str] = "{ }"
     crop_text_by_default: ClassVar[bool] = False
     interpolate_by_default: ClassVar[bool] = True
+    optimize_by_default: ClassVar[bool] = False
+    function_scope_by_default: ClassVar[bool] = False
+    cache_includes_by_default: ClassVar[bool] = False
+    subroutines_by_default: ClassVar[bool] = False
+    reload_plugins_by_default: ClassVar[bool] = False
+    discover_plugins: ClassVar[bool] = True
+    stream_buffer_size: ClassVar[int] = 64
+
+    # Caching:
+    code_cache: ClassVar[LRUCache[tuple[str, str, str, frozenset[str]], CodeType]] = LRUCache(
+        4096,
+        on_evict=_forget_snippet,
+    )
+    plugin_cache: ClassVar[LRUCache[tuple[str, str, str, str], tuple[Signature, PluginBundle]]] = LRUCache(256)
+    plugin_index: ClassVar[PluginIndex] = PluginIndex([generation_prefix, execution_prefix])
 
     # Runtime:
     EMIT: ClassVar[str] = "emit"
+    EMIT_TEXT: ClassVar[str] = "emit_text"
+    EMIT_NEWLINE: ClassVar[str] = "emit_newline"
+    EMIT_BLOCK: ClassVar[str] = "emit_block"
     INDENT: ClassVar[str] = "indent"
     STOP_EXECUTION: ClassVar[str] = "StopExecution"
 
@@ -102,36 +177,43 @@ class GX:
         self.origin = origin
         self.template = template
         self.code = code
-        self.line_transforms: dict[str, LineTransform] = {
-            self.code_prefix: self.transform_code,
-            self.macro_prefix: self.transform_macro,
-            "": self.transform_text,  # Default line transform.
-        }
+        self.line_transforms = LineTransforms(
+            {
+                self.code_prefix: self.transform_code,
+                self.macro_prefix: self.transform_macro,
+                "": self.transform_text,  # Default line transform.
+            }
+        )
         self.g_globals: dict[str, Any] = {
             "gx": self,
             "load": self._load,
         }
-        self.g_locals: dict[str, Any] = {}
+        self.g_locals: MutableMapping[str, Any] = {}
         self.x_globals: dict[str, Any] = {
             "gx": self,
             self.EMIT: self.emit,
+            self.EMIT_TEXT: self.emit_text,
+            self.EMIT_NEWLINE: self.emit_newline,
+            self.EMIT_BLOCK: self.emit_block,
             self.INDENT: self._indent,
             self.STOP_EXECUTION: StopExecution,
         }
         self.state: dict[str, Any] = {}
         self.postprocessors: list[tuple[Line, PostProcessor]] = []
+        self.environment: Environment | None = None
         self.interpolation: str = self.default_interpolation
         self.inline: bool = False
         self.code_indent: int = 0
         self.text_indent: int = 0
         self.output: list[Any] = []
         self.output_indent = 0
-        # A unique ID, used to reconstruct the GX as a source in standalone generated code.
-        self.id = str(uuid.uuid4())
+        # A unique ID, created when it's first needed (see GX.id).
+        self._id: str | None = None
         # The lines currently in use by the generation.
         self._lines: list[Line] = []
-        # Temporary files for dynamically executed code (so it's included in the traceback).
-        self._temp_files: list[pathlib.Path] = []
+        # The plugins loaded into the GX, by name or absolute path, so they can be loaded again (e.g. when restoring it
+        # from a disk cache); None stands for a plugin that can't, like a dictionary.
+        self._plugins: list[str | None] = []
 
     def __str__(self) -> str:
         output = ["GX"]
@@ -143,10 +225,22 @@ class GX:
     def __repr__(self) -> str:
         return f"<{self}>"
 
-    def __del__(self) -> None:
-        # If the GX is being deleted, then it's not part of any traceback, and we can remove its temporary files.
-        for file in self._temp_files:
-            file.unlink()
+    @property
+    def id(self) -> str:
+        """
+        A unique ID, used to reconstruct the GX as a source in standalone generated code.
+
+        It's only created when it's first needed, since most GXs (e.g. of included templates) are never reconstructed.
+        """
+        if self._id is None:
+            import uuid
+
+            self._id = str(uuid.uuid4())
+        return self._id
+
+    @id.setter
+    def id(self, id: str) -> None:
+        self._id = id
 
     @classmethod
     def add_plugins_directory(cls, directory: str | pathlib.Path) -> None:
@@ -159,7 +253,14 @@ class GX:
         cls.plugin_directories.append(pathlib.Path(directory))
 
     @classmethod
-    def parse(cls, template: TemplateArgument, *, load_core: bool | None = None, stack_level: int = 0) -> Self:
+    def parse(
+        cls,
+        template: TemplateArgument,
+        *,
+        load_core: bool | None = None,
+        origin: Origin | None = None,
+        stack_level: int = 0,
+    ) -> Self:
         """
         Create a generation/execution from a template.
 
@@ -169,6 +270,8 @@ class GX:
                 file, its contents are parsed; otherwise, *it* is parsed.
             load_core: Whether to load the core plugin, containing the default macros and hooks (e.g. %include and
                 concat; default is GX.load_core_by_default).
+            origin: The origin of the generation/execution (by default, it's inferred from the stack, which code that
+                creates many of them can skip by passing the same origin to all of them).
             stack_level: How many frames to ascend to infer the origin.
 
         Returns:
@@ -176,7 +279,8 @@ class GX:
         """
         if load_core is None:
             load_core = cls.load_core_by_default
-        origin = Origin.infer(stack_level + 1)
+        if origin is None:
+            origin = Origin.infer(stack_level + 1)
         template = Template.parse(template)
         code = Code()
         gx = cls(origin, template, code)
@@ -185,7 +289,7 @@ class GX:
         return gx
 
     @classmethod
-    def restore(cls, code: CodeArgument, *, stack_level: int = 0) -> Self:
+    def restore(cls, code: CodeArgument, *, origin: Origin | None = None, stack_level: int = 0) -> Self:
         """
         Create a generation/execution from standalone generated code.
 
@@ -193,12 +297,14 @@ class GX:
             code: The standalone generated code to restore.
                 If it's a code object, it's used as is; if it's a path object or a string refering to a valid
                 file, its contents are restored; otherwise, *it* is restored.
+            origin: The origin of the generation/execution (by default, it's inferred from the stack; see GX.parse).
             stack_level: How many frames to ascend to infer the origin.
 
         Returns:
             The created generation/execution.
         """
-        origin = Origin.infer(stack_level + 1)
+        if origin is None:
+            origin = Origin.infer(stack_level + 1)
         template = Template()
         code, intro = Code.restore(code)
         gx = cls(origin, template, code)
@@ -216,6 +322,22 @@ class GX:
             return self.template.path.parent
         return self.origin.path.parent
 
+    @property
+    def line_transforms(self) -> LineTransforms:
+        """
+        A map of prefixes to transformations applied to lines starting with that prefix.
+
+        It can be modified in place or replaced with any dictionary (e.g. with patch), which is converted to a
+        LineTransforms object.
+        """
+        return self._line_transforms
+
+    @line_transforms.setter
+    def line_transforms(self, line_transforms: dict[str, LineTransform]) -> None:
+        if not isinstance(line_transforms, LineTransforms):
+            line_transforms = LineTransforms(line_transforms)
+        self._line_transforms = line_transforms
+
     @property
     def line(self) -> Line:
         """
@@ -225,23 +347,37 @@ class GX:
             raise RuntimeError(f"{self} is not in generation")
         return self._lines[-1]
 
-    def load(self, plugin: PluginArgument) -> None:
+    def load(self, plugin: PluginArgument, *, on_load: bool = True, reload: bool | None = None) -> None:
         """
         Load additional macros and hooks into the GX.
 
         Arguments:
             plugin: The additional macros and hooks to load.
                 If it's a string or a path object, it is imported as a module; if it's a dictionary, it is traversed; if
-                it's a list, each of its items is loaded recursively.
+                it's a plugin bundle, it's used as is; if it's a list, each of its items is loaded recursively.
                 In any case, names starting with g_ are added to the generation namespaces, names starting with x_ are
                 added to the execution namespace, and on_load is called after the plugin loads.
-        """
-        # If the plugin is a dictionary, use it as a namespace.
-        if isinstance(plugin, dict):
-            namespace = plugin
-        # If the plugin is a name of a builtin, use its namespace.
+            on_load: Whether to call on_load (default is True); this is used to restore the hooks of a GX whose
+                generation is already complete.
+            reload: Whether to execute file plugins even if they haven't changed since they were last loaded (default
+                is GX.reload_plugins_by_default).
+                Otherwise, they're bundled once (see GX.plugin_cache), so their module-level state is shared by all the
+                GXs they're loaded into; on_load is still called for each of them.
+        """
+        if reload is None:
+            reload = self.reload_plugins_by_default
+        # If the plugin is a bundle, use it as is.
+        if isinstance(plugin, PluginBundle):
+            bundle = plugin
+            self._plugins.append(None)
+        # If the plugin is a dictionary, bundle it.
+        elif isinstance(plugin, dict):
+            bundle = self._bundle(plugin)
+            self._plugins.append(None)
+        # If the plugin is a name of a builtin, use its bundle.
         elif isinstance(plugin, str) and plugin in plugins:
-            namespace = plugins[plugin]
+            bundle = self._builtin_bundle(plugin)
+            self._plugins.append(plugin)
         # If the plugin is a string or path object, import it as a module.
         elif isinstance(plugin, str | pathlib.Path):
             path = self.root / plugin
@@ -261,37 +397,95 @@ class GX:
                         f"unable to load {plugin!r} ({path} does not exist and available plugins are "
                         f"{concat(sorted(available_plugins))})"
                     )
-            # Add the directory containing the module to sys.path to allow for relative imports.
-            sys_path = sys.path.copy()
-            sys.path.append(str(path.parent))
-            try:
-                text = path.read_text()
-                code = compile(text, str(path), "exec")
-                namespace = {}
-                exec(code, namespace)
-            finally:
-                sys.path = sys_path
+            # Since file plugins are loaded over and over (e.g. with %include's load=...), they're only executed again
+            # if their contents have changed (or if they're explicitly reloaded); like in the environment, they're only
+            # read if their modification time or size changed, and only executed if their digest changed as well.
+            key = (str(path.absolute()), self.generation_prefix, self.execution_prefix, self.on_load_name)
+            cached = None if reload else self.plugin_cache.get(key)
+            stat = path.stat()
+            if cached and (stat.st_mtime_ns, stat.st_size) == (cached[0].mtime, cached[0].size):
+                bundle = cached[1]
+                # The environment still records the plugin as a dependency of the generation.
+                if self.environment:
+                    self.read(path)
+            else:
+                text = self.read(path)
+                signature = Signature.of(path, text)
+                if cached and signature.digest == cached[0].digest:
+                    bundle = cached[1]
+                else:
+                    # Add the directory containing the module to sys.path to allow for relative imports.
+                    sys_path = sys.path.copy()
+                    sys.path.append(str(path.parent))
+                    try:
+                        code = compile(text, str(path), "exec")
+                        namespace: dict[str, Any] = {}
+                        exec(code, namespace)
+                    finally:
+                        sys.path = sys_path
+                    bundle = self._bundle(namespace)
+                # Either way, the signature is updated, so the plugin isn't read again next time (e.g. after a touch).
+                self.plugin_cache[key] = signature, bundle
+            self._plugins.append(key[0])
         # If the plugin is an iterable, load each of its items recursively.
         else:
             for item in plugin:
-                self.load(item)
+                self.load(item, on_load=on_load, reload=reload)
             return
-        # Finally, extract any macros and hooks from the namespace.
+        # Finally, add the macros, bind the hooks, and if there is an on_load function, call it.
+        self.g_globals.update(bundle.g_globals)
+        for name, hook in bundle.x_hooks:
+            self.x_globals[name] = hook.__get__(self, type(self))
+        if on_load and bundle.on_load:
+            bundle.on_load(self)
+
+    @classmethod
+    def bundle(
+        cls,
+        namespace: dict[str, Any],
+        *,
+        generation_prefix: str | None = None,
+        execution_prefix: str | None = None,
+        on_load_name: str | None = None,
+    ) -> PluginBundle:
+        """
+        Bundle a plugin namespace, so it can be loaded into GXs without being traversed again.
+
+            >>> bundle = GX.bundle({"g_hello": g_hello, "x_world": x_world})
+            >>> gx.load(bundle)
+
+        Note that the bundle is a snapshot of the namespace, so changes to the namespace don't affect it.
+
+        Arguments:
+            namespace: The plugin namespace (see GX.load).
+            generation_prefix: The prefix of macros (default is GX.generation_prefix).
+            execution_prefix: The prefix of hooks (default is GX.execution_prefix).
+            on_load_name: The name of the function to call when the plugin loads (default is GX.on_load_name).
+
+        Returns:
+            The plugin bundle.
+        """
+        if generation_prefix is None:
+            generation_prefix = cls.generation_prefix
+        if execution_prefix is None:
+            execution_prefix = cls.execution_prefix
+        if on_load_name is None:
+            on_load_name = cls.on_load_name
+        g_globals: list[tuple[str, Any]] = []
+        x_hooks: list[tuple[str, Callable[..., Any]]] = []
         for key, value in namespace.items():
-            if key.startswith(self.generation_prefix):
-                name = key.removeprefix(self.generation_prefix)
-                self.g_globals[name] = value
-            if key.startswith(self.execution_prefix):
-                name = key.removeprefix(self.execution_prefix)
-                self.x_globals[name] = value.__get__(self, type(self))
-        # If there is an on_load function, call it.
-        if self.on_load_name in namespace:
-            namespace[self.on_load_name](self)
+            if key.startswith(generation_prefix):
+                g_globals.append((key.removeprefix(generation_prefix), value))
+            if key.startswith(execution_prefix):
+                x_hooks.append((key.removeprefix(execution_prefix), value))
+        return PluginBundle(tuple(g_globals), tuple(x_hooks), namespace.get(on_load_name))
 
     def generate(self, context: dict[str, Any] | None = None, /, **context_kwargs: Any) -> None:
         """
         Generate code from the template.
 
+        If GX.optimize_by_default is true, the generated code is optimized as well (see GX.optimize).
+
         Arguments:
             context: Additional context to add to the generation namespace.
             **context_kwargs: Additional context to add to the generation namespace.
@@ -302,11 +496,22 @@ class GX:
             for line, postprocessor in self.postprocessors:
                 with self._line(line):
                     postprocessor(self)
+            if self.optimize_by_default:
+                self.optimize()
         except GenerationError:
             raise
         except Exception as error:
             raise GenerationError(self, error)
 
+    def optimize(self) -> None:
+        """
+        Optimize the generated code, so that static text is emitted in blocks rather than line by line (see
+        Code.optimize).
+
+        This should be done once the generation is complete, and before the generated code is compiled.
+        """
+        self.code.optimize()
+
     def to_string(self, standalone: bool | None = None) -> str:
         """
         Return the generated code.
@@ -322,28 +527,125 @@ class GX:
             standalone = self.generate_standalone_by_default
         return self.code.to_string(self, standalone=standalone)
 
-    def execute(self, context: dict[str, Any] | None = None, /, **context_kwargs: Any) -> str:
+    def execute(
+        self,
+        context: dict[str, Any] | None = None,
+        /,
+        *,
+        sink: Sink | None = None,
+        **context_kwargs: Any,
+    ) -> str:
         """
         Execute the generated code.
 
+            >>> with open("output.txt", "w") as file:
+            ...     gx.execute(n=3, sink=file)
+
         Arguments:
             context: Additional context to add to the execution namespace.
+            sink: Where to write the execution output as it's emitted, instead of returning it: a text file object, a
+                binary file object or a socket (in which case the output is UTF-8 encoded), a function, or a Writer (to
+                configure the encoding or buffer size).
             **context_kwargs: Additional context to add to the execution namespace.
 
         Returns:
-            The execution output.
+            The execution output (or an empty string, if it's written into a sink).
         """
-        self.x_globals.update(**(context or {}), **context_kwargs)
-        code = self.to_string()
-        try:
-            self.x_exec(code)
-        except StopExecution:
-            pass
-        except ExecutionError:
-            raise
-        except Exception as error:
-            raise ExecutionError(self, error)
-        return "".join(map(str, self.output)).rstrip()
+        return self._run(self.compile(), {**(context or {}), **context_kwargs}, sink)
+
+    def execute_iter(self, context: dict[str, Any] | None = None, /, **context_kwargs: Any) -> Iterator[str]:
+        """
+        Execute the generated code, yielding its output in chunks as it's emitted.
+
+            >>> for chunk in gx.execute_iter(n=3):
+            ...     sys.stdout.write(chunk)
+
+        The chunks add up to the same output execute would return; output emitted after a bookmark is held back until
+        the bookmark can no longer be appended to. The execution runs in a separate thread, at most
+        GX.stream_buffer_size chunks ahead of the iteration, and is stopped if the iteration is; its errors are raised
+        by the iteration. Hooks that rely on the thread they run in (e.g. with sqlite connections, thread-locals or
+        signal handlers) should be executed with a sink instead (see GX.execute).
+
+        Arguments:
+            context: Additional context to add to the execution namespace.
+            **context_kwargs: Additional context to add to the execution namespace.
+
+        Returns:
+            An iterator over the execution output chunks.
+        """
+        return self._iterate(self.compile(), {**(context or {}), **context_kwargs})
+
+    def compile(self, function_scope: bool | None = None) -> CodeType:
+        """
+        Compile the generated code.
+
+        Compiled code is cached, so this is cheap for code that was already compiled.
+
+        With function_scope=True, the generated code is compiled into the body of a function rather than a module, so
+        names assigned during the execution (e.g. loop variables) are fast local variables rather than entries in the
+        execution namespace, and so are the hooks it uses. The execution behaves the same, except that:
+
+        - Names assigned during the execution are not added to the execution namespace (e.g. for x_eval to see).
+        - Names that are read before they're assigned are looked up in the execution namespace once, when the execution
+          starts, rather than whenever they're read.
+
+        Code that can't be compiled into a function (e.g. because it uses from ... import *) is compiled as a module.
+
+        Arguments:
+            function_scope: Whether to compile the generated code into a function (default is
+                GX.function_scope_by_default).
+
+        Returns:
+            The compiled code, which can be executed into the execution namespace.
+        """
+        if function_scope is None:
+            function_scope = self.function_scope_by_default
+        return self._compile(self.execution_file_suffix, self.to_string(), FUNCTION_MODE if function_scope else "exec")
+
+    def clone(self, template: TemplateArgument | None = None) -> GX:
+        """
+        Create a copy of this generation/execution that shares its template and generated code, but has its own
+        namespaces, state and output.
+
+        This is used to execute the same generated code many times, possibly concurrently (see CompiledTemplate).
+
+        Alternatively, if a template is passed, the copy is a new generation of that template, with the same plugins
+        and configuration; this way, a prototype GX with its plugins already loaded can stamp out GXs cheaply:
+
+            >>> prototype = GX.parse(Template())
+            >>> prototype.load(plugin)
+            >>> gx = prototype.clone(template)
+            >>> gx.generate()
+
+        Arguments:
+            template: The template of the new generation (default is to share this one's template and generated code).
+                Since it's meant for new generations, it should be cloned before the prototype generates anything.
+
+        Returns:
+            The cloned generation/execution.
+        """
+        if template is None:
+            gx = type(self)(self.origin, self.template, self.code)
+            gx.id = self.id
+        else:
+            gx = type(self)(self.origin, Template.parse(template), Code())
+        gx.line_transforms = self.line_transforms.copy()
+        gx.g_globals = {**self.g_globals, "gx": gx}
+        gx.g_locals = self.g_locals.copy()
+        gx.state = self.state.copy()
+        gx.postprocessors = self.postprocessors.copy()
+        gx.environment = self.environment
+        gx._plugins = self._plugins.copy()
+        gx.interpolation = self.interpolation
+        gx.inline = self.inline
+        for key, value in self.x_globals.items():
+            # Hooks (and standard parts of the GX object, like EMIT) are bound to the GX they were loaded into, so they
+            # have to be rebound to the clone.
+            if getattr(value, "__self__", None) is self:
+                value = value.__func__.__get__(gx, type(gx))
+            gx.x_globals[key] = value
+        gx.x_globals["gx"] = gx
+        return gx
 
     def transform(self, lines: Lines | None = None) -> None:
         """
@@ -357,26 +659,75 @@ class GX:
             ...     # Or, to continue with the same indentation:
             ...     gx.transform(gx.line.children.snap())
 
+        Line transforms and macros can also continue the generation without recursing, by returning the lines to
+        transform next (a continuation); or, if they have more to do once those lines are transformed, by yielding them:
+
+            >>> def g_macro(gx):
+            ...     gx.add_code("with context():")
+            ...     with gx.increased_code_indent():
+            ...         yield gx.line.children.snap()
+
+        The lines are then transformed as part of the same loop, with an explicit stack of the lines being transformed
+        and the generators waiting for them, so the nesting of templates is only limited by memory (and not by Python's
+        recursion limit). If transforming the lines fails, the error is raised in the generators waiting for them.
+
         Arguments:
             lines: The lines to transform.
                 If not provided, the children of the current line are used.
         """
         if lines is None:
             lines = self.line.children
-        for line in lines:
-            with self._line(line):
-                for prefix, transform in sorted(
-                    self.line_transforms.items(),
-                    key=lambda x: len(x[0]),
-                    reverse=True,
-                ):
-                    if line.content.startswith(prefix):
-                        content = line.content.removeprefix(prefix).lstrip()
-                        transform(self, content)
-                        break
-                else:
-                    transforms = [f"{func.__name__} ({prefix})" for prefix, func in self.line_transforms.items()]
-                    raise ValueError(f"unable to transform {line} (considered {concat(sorted(transforms))})")
+        # Each frame holds the lines being transformed, and the generator waiting for them (if any); the first frame
+        # holds the lines passed in, and the rest hold continuations of the lines being transformed.
+        stack: list[tuple[Iterator[Line], Generator[Lines, None, None] | None]] = [(iter(lines), None)]
+        error: Exception | None = None
+        while stack:
+            frame_lines, generator = stack[-1]
+            try:
+                if error is None:
+                    line = next(frame_lines, None)
+                    if line is not None:
+                        # The line is pushed, and only popped if its transform succeeds (so it's still available for
+                        # the traceback otherwise).
+                        self._lines.append(line)
+                        # The line transforms are looked up for every line, since they might be changed by the previous
+                        # one.
+                        match = self._line_transforms.match(line.content)
+                        if match is None:
+                            transforms = [
+                                f"{func.__name__} ({prefix})" for prefix, func in self._line_transforms.items()
+                            ]
+                            raise ValueError(f"unable to transform {line} (considered {concat(sorted(transforms))})")
+                        prefix, transform = match
+                        continuation = transform(self, line.content[len(prefix) :].lstrip())
+                        if type(continuation) is GeneratorType:
+                            # The generator is started like it's resumed, once its (non-existent) lines are transformed.
+                            stack.append((iter(()), continuation))
+                        elif isinstance(continuation, Lines) and continuation:
+                            stack.append((iter(continuation), None))
+                        else:
+                            self._lines.pop()
+                        continue
+                # The frame is done: either its lines are transformed, or one of them failed.
+                stack.pop()
+                if generator is None:
+                    # If these were lines returned by a transform (rather than passed in), the transform is complete.
+                    if stack and error is None:
+                        self._lines.pop()
+                    continue
+                try:
+                    if error is None:
+                        next_lines = generator.send(None)
+                    else:
+                        next_lines, error = generator.throw(error), None
+                except StopIteration:
+                    self._lines.pop()
+                    continue
+                stack.append((iter(next_lines), generator))
+            except Exception as exception:
+                error = exception
+        if error is not None:
+            raise error
 
     def line_transform(self, transform: LineTransform, prefix: str = "") -> None:
         """
@@ -421,6 +772,11 @@ class GX:
             code: The raw code to add.
                 Multi-line code blocks are cropped.
         """
+        # Most code is a single line (and cropping it only strips it).
+        if "\n" not in code and "\t" not in code:
+            if code := code.strip():
+                self.code.append(self, self.line.number, self.code_indent, code)
+            return
         for _, line in crop_lines(code):
             self.code.append(self, self.line.number, self.code_indent, line)
 
@@ -490,14 +846,19 @@ class GX:
         # Otherwise, interpolate if necessary and add code that calls the EMIT hook during execution, passing directives
         # on newlines and inlining via keyword arguments.
         if not interpolate:
-            args = [repr(text)]
+            snippets = ((text, False),)
         else:
-            args = []
-            for snippet, is_code in interpolate_(text, self.interpolation):
-                if is_code:
-                    args.append(f"{snippet}")
-                else:
-                    args.append(repr(snippet))
+            snippets = tuple(interpolate_(text, self.interpolation))
+        # Most lines are emitted with a newline, in which case the text (if there's any) can be formatted in place, and
+        # emitted with a more specialized hook.
+        if newline and not self.inline:
+            if not text:
+                self.add_code(f"{self.EMIT_NEWLINE}({indent})")
+                return
+            if indent is not None and (formatted_text := _format_text(snippets)):
+                self.add_code(f"{self.EMIT_TEXT}({indent}, {formatted_text})")
+                return
+        args = [snippet if is_code else repr(snippet) for snippet, is_code in snippets]
         if not newline:
             args.append("newline=False")
         if self.inline:
@@ -556,8 +917,66 @@ class GX:
             return template
         if refers_to_file(template):
             template = self.root / self.g_interpolate(str(template))
+        if self.environment:
+            return self.environment.parse(template, self)
         return Template.parse(template)
 
+    def read(self, path: pathlib.Path) -> str:
+        """
+        Read a file (through the environment cache, if there is one).
+
+        This is used in macros to read files during generation:
+
+            >>> def g_raw_file(gx, path):
+            ...     text = gx.read(gx.root / path)
+            ...     gx.add_text(0, text, crop=True, interpolate=False)
+
+        Arguments:
+            path: The file path.
+
+        Returns:
+            The file contents.
+        """
+        if self.environment:
+            return self.environment.read(path, self)
+        return path.read_text()
+
+    def invoke(self, name: str, *args: Any, code: str | None = None) -> Any:
+        """
+        Invoke a macro.
+
+        This is used in line transforms to invoke macros directly, rather than by executing code that calls them:
+
+            >>> def transform_hello(gx, content):
+            ...     # %hello: name punctuation="!"
+            ...     return gx.invoke("hello", code=content)
+
+        Arguments:
+            name: The macro name, looked up in the generation namespace.
+            *args: Arguments to pass to the macro (after the GX).
+            code: Additional arguments to pass to the macro, as code that's evaluated in the generation namespace (e.g.
+                "x, y=1").
+
+        Returns:
+            The macro's return value (e.g. its continuation; see GX.transform).
+        """
+        # Macros are looked up the same way the code that calls them would, first in the local namespace and then in
+        # the global one, so functions defined during the generation are available too.
+        macro = self.g_locals.get(name)
+        if not callable(macro):
+            macro = self.g_globals.get(name)
+        # If it's not there, it might be defined by a plugin in the plugin directories that wasn't loaded yet.
+        if not callable(macro) and self._discover(self.generation_prefix + name):
+            macro = self.g_globals.get(name)
+        if not callable(macro):
+            macros = {name for name, value in self.g_globals.items() if callable(value)}
+            macros |= {name for name, value in self.g_locals.items() if callable(value)}
+            raise ValueError(f"unknown macro {name!r} on {self.line} (available macros are {concat(sorted(macros))})")
+        if not code:
+            return macro(self, *args)
+        code_args, code_kwargs = self.g_eval(MACRO_ARGUMENTS.format(code))
+        return macro(self, *args, *code_args, **code_kwargs)
+
     def derive(self, template: TemplateArgument, continue_generation: bool = False) -> GX:
         """
         Create a new generation/execution based on this one.
@@ -581,12 +1000,17 @@ class GX:
         template = self.resolve_template(template)
         code = Code()
         gx = type(self)(origin, template, code)
+        gx.environment = self.environment
         gx.state = self.state
+        # The new generation is nested in this one, so its text is indented like this one's.
+        gx.text_indent = self.text_indent
         if continue_generation:
             gx.line_transforms = self.line_transforms
             gx.g_globals = self.g_globals.copy()
             gx.g_globals["gx"] = gx
-            gx.g_locals = self.g_locals.copy()
+            # The generation namespace might be large (e.g. a model passed as context), so rather than being copied,
+            # it's layered over this one.
+            gx.g_locals = Namespace.layer(self.g_locals)
         return gx
 
     def extend(self, gx: GX) -> None:
@@ -601,8 +1025,7 @@ class GX:
         Arguments:
             gx: The generation/execution to extend the generated code with.
         """
-        for line in gx.code.lines:
-            self.code.append(line.gx, line.template_line_number, self.code_indent + line.indent, line.content)
+        self.code.extend(gx.code, self.code_indent)
 
     @contextlib.contextmanager
     def patch(self, **attributes: Any) -> Iterator[None]:
@@ -636,6 +1059,33 @@ class GX:
             for key, value in prev_attributes.items():
                 setattr(self, key, value)
 
+    @contextlib.contextmanager
+    def redirect_output(self, sink: Sink, *, lstrip: bool = False) -> Iterator[None]:
+        """
+        Temporarily redirect the execution output into a sink, writing it as it's emitted.
+
+        This is used in hooks to write (part of) the execution output somewhere else:
+
+            >>> @contextlib.contextmanager
+            ... def x_file(gx, name):
+            ...     with open(name, "w") as file, gx.redirect_output(file):
+            ...         yield
+
+        Arguments:
+            sink: Where to write the execution output (see GX.execute).
+            lstrip: Whether to strip leading whitespace from the output (trailing whitespace is always stripped).
+        """
+        writer = sink if isinstance(sink, Writer) else Writer(sink)
+        output = Output(writer, lstrip=lstrip)
+        try:
+            with self.patch(output=output):
+                yield
+            output.close()
+        finally:
+            # Even if the execution fails, the previous output is restored (by patch), and whatever was written so far
+            # is flushed into the sink, so it isn't written into later (e.g. once it's closed).
+            writer.flush()
+
     def g_interpolate(self, text: str) -> str:
         """
         Interpolate a string in the generation namespace.
@@ -737,33 +1187,233 @@ class GX:
             # Otherwise (even if indent=0), add the current output indentation.
             else:
                 indent += self.output_indent
-            self.output.append(f'{" " * indent}{text}{end}')
+            self.output.append(f"{INDENTATION[indent]}{text}{end}")
+
+    def emit_text(self, indent: int, text: str) -> None:
+        """
+        Emit a line of text during execution.
+
+        This is called when generated code invokes the EMIT_TEXT hook, which it does instead of invoking the EMIT hook
+        for lines whose text is already a string (either literal or formatted in place), and is emitted with a newline;
+        since that's most lines, it skips everything else EMIT does.
+
+        Arguments:
+            indent: The indentation of the output.
+            text: The text to emit.
+        """
+        self.output.append(f"{INDENTATION[indent + self.output_indent]}{text}\n")
+
+    def emit_newline(self, indent: int | None = None) -> None:
+        """
+        Emit an empty line during execution.
+
+        This is called when generated code invokes the EMIT_NEWLINE hook, which it does instead of invoking the EMIT
+        hook with no text.
+
+        Arguments:
+            indent: The indentation of the output (default is None, which signifies no indentation).
+        """
+        if indent is None:
+            self.output.append("\n")
+        else:
+            self.output.append(f"{INDENTATION[indent + self.output_indent]}\n")
+
+    def emit_block(self, text: str) -> None:
+        """
+        Emit a block of literal text during execution.
+
+        This is called when optimized generated code invokes the EMIT_BLOCK hook, instead of invoking the EMIT hook for
+        each line in the block (see Code.optimize).
+
+        Arguments:
+            text: The lines to emit, each with its own indentation and newline.
+        """
+        # Like emit, add the current output indentation to every line (or, if it's negative, remove it).
+        if self.output_indent > 0:
+            indent = INDENTATION[self.output_indent]
+            body = text[:-1].replace("\n", "\n" + indent)
+            text = f"{indent}{body}\n"
+        elif self.output_indent < 0:
+            text = "".join(
+                line[min(-self.output_indent, len(line) - len(line.lstrip(" "))) :]
+                for line in text.splitlines(keepends=True)
+            )
+        self.output.append(text)
 
     def _execute(
         self,
         suffix: str,
         text: str,
         globals: dict[str, Any],
-        locals: dict[str, Any] | None = None,
+        locals: Mapping[str, Any] | None = None,
         *,
         expression: bool = False,
     ) -> Any:
-        # Before executing code, write it to a temporary file to make sure it's available in tracebacks.
+        code = self._compile(suffix, text, "eval" if expression else "exec")
+        if expression:
+            return eval(code, globals, locals)
+        else:
+            exec(code, globals, locals)
+
+    def _compile(self, suffix: str, text: str, mode: str, code: CodeType | None = None) -> CodeType:
         if self.template.path:
             name = self.template.path.stem
         else:
             name = f"{self.origin.path.stem}-{self.origin.line_number}"
-        fd, name = tempfile.mkstemp(suffix=f".{name}{suffix}")
-        os.close(fd)
-        path = pathlib.Path(name)
-        path.write_text(text)
-        # Collect any temporary files, to be removed when the GX is deleted.
-        self._temp_files.append(path)
-        code = compile(text, str(path), "eval" if expression else "exec")
-        if expression:
-            return eval(code, globals, locals)
+        # The same snippets recur across lines, loop iterations and GXs, so their compiled code is cached; the name is
+        # part of the key, so that errors are still reported in the right location.
+        # Code that was already compiled into a function is cached as such.
+        if code is not None and code.co_flags & CO_OPTIMIZED:
+            mode = FUNCTION_MODE
+        # Code compiled into a function binds the global names it reads that are in the execution namespace when it's
+        # compiled (e.g. hooks) to locals, so those names are part of the key as well; code that was already compiled
+        # into a function binds those that are its locals.
+        bound_names: frozenset[str] = frozenset()
+        if mode == FUNCTION_MODE:
+            namespace = code.co_varnames if code is not None else self.x_globals
+            bound_names = frozenset(name for name in _function_global_names(text) if name in namespace)
+        key = (text, mode, f".{name}{suffix}", bound_names)
+        cached_code = self.code_cache.get(key)
+        if cached_code is None:
+            # Register the code in linecache under a virtual filename to make sure it's available in tracebacks without
+            # touching the disk.
+            filename = f"<auryn-{next(SNIPPET_IDS)}>{key[2]}"
+            # Code that was already compiled (e.g. by another process, and loaded from a disk cache) is adopted under
+            # the new filename, since its original one is meaningless here.
+            if code is not None:
+                code = _rename_code(code, filename)
+            elif mode == FUNCTION_MODE:
+                code = _compile_function(text, filename, bound_names)
+            else:
+                code = compile(text, filename, mode)
+            self.code_cache[key] = code
         else:
-            exec(code, globals, locals)
+            code = cached_code
+        filename = code.co_filename
+        if filename not in linecache.cache:
+            linecache.cache[filename] = (len(text), None, text.splitlines(keepends=True), filename)
+        return code
+
+    def _run(self, code: CodeType, context: dict[str, Any], sink: Sink | None = None) -> str:
+        if sink is None:
+            self._exec(code, context, [])
+            return "".join(map(str, self.output)).rstrip()
+        writer = sink if isinstance(sink, Writer) else Writer(sink)
+        try:
+            self._stream(code, context, writer)
+        finally:
+            writer.flush()
+        return ""
+
+    def _stream(self, code: CodeType, context: dict[str, Any], write: Callable[[str], None]) -> None:
+        output = Output(write)
+        self._exec(code, context, output)
+        output.close()
+
+    def _iterate(self, code: CodeType, context: dict[str, Any]) -> Iterator[str]:
+        # The execution can't yield from inside the generated code, so it runs in a thread that passes chunks through a
+        # bounded queue (followed by None if it completes, or the error if it fails).
+        import queue
+
+        chunks: queue.Queue[str | BaseException | None] = queue.Queue(self.stream_buffer_size)
+        stopped = threading.Event()
+
+        def write(chunk: str) -> None:
+            # If the iteration was stopped, so is the execution.
+            if stopped.is_set():
+                raise StopExecution()
+            chunks.put(chunk)
+
+        def run() -> None:
+            try:
+                self._stream(code, context, write)
+            except BaseException as error:
+                chunks.put(error)
+            else:
+                chunks.put(None)
+
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+        thread.start()
+        try:
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            # Keep draining the queue, so that the execution isn't blocked on it, until it notices it was stopped.
+            stopped.set()
+            while thread.is_alive():
+                with contextlib.suppress(queue.Empty):
+                    chunks.get(timeout=0.01)
+
+    def _exec(self, code: CodeType, context: dict[str, Any], output: list[Any]) -> None:
+        self.x_globals.update(context)
+        if self.discover_plugins:
+            self._discover_hooks(code)
+        # Every execution starts with a fresh output, so executing the same GX twice doesn't concatenate the results.
+        self.output = output
+        self.output_indent = 0
+        try:
+            # Code compiled into a function is called with the execution namespace as its globals (see GX.compile).
+            if code.co_flags & CO_OPTIMIZED:
+                types.FunctionType(code, self.x_globals)(self.x_globals)
+            else:
+                exec(code, self.x_globals)
+        except StopExecution:
+            pass
+        except ExecutionError:
+            raise
+        except Exception as error:
+            raise ExecutionError(self, error)
+
+    def _bundle(self, namespace: dict[str, Any]) -> PluginBundle:
+        # Bundles a plugin namespace with this GX's naming conventions (which might differ from its class').
+        return self.bundle(
+            namespace,
+            generation_prefix=self.generation_prefix,
+            execution_prefix=self.execution_prefix,
+            on_load_name=self.on_load_name,
+        )
+
+    def _builtin_bundle(self, plugin: str) -> PluginBundle:
+        # Builtins are loaded over and over (e.g. the core plugin, into every included template), so they're only
+        # bundled again if their module changed since they were last bundled (e.g. if a macro was patched or added).
+        namespace = plugins[plugin]
+        key = (plugin, self.generation_prefix, self.execution_prefix, self.on_load_name)
+        cached = PLUGIN_BUNDLES.get(key)
+        if cached is not None:
+            size, items, bundle = cached
+            if size == len(namespace) and all(namespace.get(name, NAMESPACE_MISSING) is value for name, value in items):
+                return bundle
+        bundle = self._bundle(namespace)
+        items = tuple(
+            (name, value)
+            for name, value in namespace.items()
+            if name.startswith((self.generation_prefix, self.execution_prefix)) or name == self.on_load_name
+        )
+        PLUGIN_BUNDLES[key] = len(namespace), items, bundle
+        return bundle
+
+    def _discover(self, name: str) -> bool:
+        # Loads the plugin in the plugin directories that defines a name, unless there's none, or it's already loaded
+        # (in which case the name is only defined conditionally, and loading it again won't help).
+        if not self.discover_plugins:
+            return False
+        path = self.plugin_index.find(self.plugin_directories, name)
+        if path is None or str(path.absolute()) in self._plugins:
+            return False
+        self.load(path)
+        return True
+
+    def _discover_hooks(self, code: CodeType) -> None:
+        # Loads the plugins that define hooks the code refers to, but that weren't loaded yet. The names are found
+        # statically, so some of them might be attributes rather than global names; at worst, this loads a plugin that
+        # isn't actually needed.
+        if not self.plugin_index.names(self.plugin_directories):
+            return
+        for name in _global_names(code):
+            if name not in self.x_globals:
+                self._discover(self.execution_prefix + name)
 
     @contextlib.contextmanager
     def _indent(self, indent: int) -> Iterator[None]:
@@ -788,7 +1438,7 @@ class GX:
     # first argument; as such, they shouldn't be implicitly bound, and are defined as static methods instead.
 
     @staticmethod
-    def transform_text(gx: GX, content: str) -> None:
+    def transform_text(gx: GX, content: str) -> Continuation:
         """
         Generate a text line.
 
@@ -802,10 +1452,10 @@ class GX:
         """
         if content:
             gx.add_text(gx.line.indent, content)
-        gx.transform()
+        return gx.line.children
 
     @staticmethod
-    def transform_code(gx: GX, content: str) -> None:
+    def transform_code(gx: GX, content: str) -> Continuation:
         """
         Generate a code line.
 
@@ -834,27 +1484,36 @@ class GX:
         """
         # Ignore comment lines or blocks.
         if content.startswith(gx.comment_prefix):
-            return
+            return None
         # If the content is empty, this is a code block: add its contents as-is.
         if not content:
             code = gx.line.children.to_string()
             gx.add_code(code)
-            return
+            return None
         # Otherwise, this is a code line. Previous code lines should have discarded any indentation significant to the
-        # code itself, so any remaining indentation is to be applied during execution.
-        indent = gx.line.indent
-        if indent:
-            gx.add_code(f"with {gx.INDENT}({indent}):")
+        # code itself, so any remaining indentation (along with that of any code lines it's nested in) is to be applied
+        # to its output. Usually, that's the output of its children, whose indentation is known during generation, and
+        # is added to any text they emit; but if the line might emit output on its own (e.g. by calling a function
+        # defined in the template), it's applied during execution instead.
+        code_indent = gx.code_indent
+        text_indent = gx.text_indent + gx.line.indent
+        if text_indent and _might_emit(content):
+            gx.add_code(f"with {gx.INDENT}({text_indent}):")
             gx.increase_code_indent()
+            text_indent = 0
+        # The body of a function or a class emits its output wherever it's called, so it doesn't inherit any
+        # indentation.
+        if DEFINITION.match(content):
+            text_indent = 0
         gx.add_code(content)
+        if not gx.line.children:
+            gx.code_indent = code_indent
+            return None
         # Indentation significant to the code is managed explicitly, so children indentation is discarded entirely.
-        with gx.increased_code_indent():
-            gx.transform(gx.line.children.snap(0))
-        if indent:
-            gx.decrease_code_indent()
+        return _transform_nested(gx, gx.line.children.snap(0), code_indent, text_indent)
 
     @staticmethod
-    def transform_macro(gx: GX, content: str) -> None:
+    def transform_macro(gx: GX, content: str) -> Continuation:
         """
         Generate a macro line.
 
@@ -897,7 +1556,7 @@ class GX:
         # If the content is empty, it means there should be an empty line of output, so we emit empty text.
         if not content:
             gx.add_text(0, "")
-            return
+            return None
         # If the content starts with the code prefix, this is code to execute during generation.
         if content.startswith(gx.code_prefix):
             code = content.removeprefix(gx.code_prefix).lstrip()
@@ -905,49 +1564,368 @@ class GX:
             if not code:
                 code = gx.line.children.snap(0).to_string()
                 gx.g_exec(code)
-                return
+                return None
             # Otherwise, this is a code line. If it has no children, execute it as-is.
             if not gx.line.children:
                 gx.g_exec(code)
-                return
+                return None
             # Otherwise, execute it with a nested transform invocation, so generation continues recursively.
             code += "\n    gx.transform(gx.line.children.snap())"
             gx.g_exec(code)
-            return
+            return None
         # Otherwise, this is a macro invocation.
-        match = MACRO_INVOCATION.match(content)
-        if not match:
+        invocation = _parse_macro_invocation(content)
+        if not invocation:
             raise ValueError(
                 f"expected macro on {gx.line} to be '<macro> [argument]', '<macro>: <arguments>' or "
                 f"'<macro>:: <arguments>', but got {content!r}"
             )
-        name, invocation_type, arg = match.groups()
-        # Collect all the macros available in this scope.
-        macros = {name for name, value in gx.g_globals.items() if callable(value)}
-        macros |= {name for name, value in gx.g_locals.items() if callable(value)}
-        if name not in macros:
-            raise ValueError(f"unknown macro {name!r} on {gx.line} (available macros are {concat(sorted(macros))})")
-        # There are three ways to call macros:
-        # 1. <macro> [argument] - called with 0-1 arguments, passed in as a string;
-        # 2. <macro>: <arguments> - called with arguments split by whitespace, respecting quoted strings;
-        # 3. <macro>:: <arguments> - called with arguments as-is.
-        if not arg:
-            code = f"{name}(gx)"
-        elif not invocation_type:
-            code = f"{name}(gx, {arg!r})"
-        elif invocation_type == ":":
-            code = f"{name}(gx, {', '.join(split(arg))})"
-        else:  # invocation_type == "::"
-            code = f"{name}(gx, {arg})"
-        gx.g_exec(code)
+        name, args, code = invocation
+        return gx.invoke(name, *args, code=code)
 
     @staticmethod
     def _load(gx: GX, plugin: PluginArgument) -> None:
         gx.load(plugin)
 
 
+def _transform_nested(gx: GX, lines: Lines, code_indent: int, text_indent: int) -> Generator[Lines, None, None]:
+    # Transforms the children of a code line nested in its code, with their text indentation, and restores the code
+    # indentation (from before the code line) and text indentation once they're transformed (or fail).
+    prev_text_indent = gx.text_indent
+    gx.code_indent += 4
+    gx.text_indent = text_indent
+    try:
+        yield lines
+    finally:
+        gx.code_indent = code_indent
+        gx.text_indent = prev_text_indent
+
+
+@functools.lru_cache(maxsize=4096)
+def _global_names(code: CodeType) -> frozenset[str]:
+    # The names code refers to, including the code nested in it (e.g. functions and comprehensions); these are looked
+    # up once per code object, rather than once per execution.
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            names |= _global_names(constant)
+    return frozenset(names)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_macro_invocation(content: str) -> tuple[str, tuple[str, ...], str | None] | None:
+    # The same macro lines recur across templates and includes, so they're parsed once into the macro name, its string
+    # arguments and its code arguments.
+    match = MACRO_INVOCATION.match(content)
+    if not match:
+        return None
+    name, invocation_type, arg = match.groups()
+    # There are three ways to call macros:
+    # 1. <macro> [argument] - called with 0-1 arguments, passed in as a string;
+    # 2. <macro>: <arguments> - called with arguments split by whitespace, respecting quoted strings;
+    # 3. <macro>:: <arguments> - called with arguments as-is.
+    if not arg:
+        return name, (), None
+    if not invocation_type:
+        return name, (arg,), None
+    if invocation_type == ":":
+        return name, (), ", ".join(split(arg))
+    return name, (), arg  # invocation_type == "::"
+
+
+def _format_text(snippets: tuple[tuple[str, bool], ...]) -> str | None:
+    # Returns an expression that formats the interpolated text in place (as a string literal, or an f-string that calls
+    # str on every value, just like emit would), or None if it can't be done.
+    if not any(is_code for _, is_code in snippets):
+        return repr("".join(snippet for snippet, _ in snippets))
+    output: list[str] = []
+    for snippet, is_code in snippets:
+        if is_code:
+            if "\n" in snippet or not _is_single_expression(snippet):
+                return None
+            # Only parenthesize expressions that need it, like {x if y else z} or {{"a": 1}["a"]}.
+            if not SIMPLE_EXPRESSION.match(snippet):
+                snippet = f"({snippet})"
+            output.append(f"{{{snippet}!s}}")
+        else:
+            literal = repr(snippet)
+            # The f-string is always single-quoted, so literals repr'ed with double quotes have their quotes escaped.
+            if literal.startswith('"'):
+                escaped = literal[1:-1].replace("'", "\\'")
+                literal = f"'{escaped}'"
+            output.append(literal[1:-1].replace("{", "{{").replace("}", "}}"))
+    return f"f'{''.join(output)}'"
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_single_expression(code: str) -> bool:
+    # EMIT is passed interpolated code as arguments, so code like {x, y} or {*x} emits several values; and since it
+    # can't be formatted in place, neither can code that isn't valid (so that errors are reported as they would be).
+    import ast
+
+    try:
+        call = ast.parse(f"_({code})", mode="eval").body
+    except SyntaxError:
+        return False
+    if not isinstance(call, ast.Call) or call.keywords or len(call.args) != 1:
+        return False
+    return not isinstance(call.args[0], ast.Starred | ast.GeneratorExp)
+
+
+@functools.lru_cache(maxsize=4096)
+def _function_global_names(text: str) -> frozenset[str]:
+    # The global names read by code compiled into a function (before any of them are bound to locals).
+    import ast
+
+    try:
+        module = ast.parse(text)
+        if not module.body:
+            return frozenset()
+        return frozenset(_function_code(module.body, "<auryn>").co_names)
+    except SyntaxError:
+        return frozenset()
+
+
+def _compile_function(text: str, filename: str, bound_names: frozenset[str]) -> CodeType:
+    # Rather than adding a function definition to the generated code, which would offset its line numbers, its syntax
+    # tree is wrapped in one.
+    import ast
+
+    module = ast.parse(text, filename)
+    if not module.body:
+        return compile(module, filename, "exec")
+    try:
+        code = _function_code(module.body, filename)
+        # Once we know which names are local (or used in nested functions), they're copied from the execution namespace
+        # when the function starts, in case they're read before they're assigned; and so are the hooks it uses.
+        names = {*code.co_varnames, *code.co_cellvars, *bound_names}
+        names.discard(FUNCTION_NAMESPACE)
+        prologue = ast.parse(
+            "\n".join(
+                f"if {name!r} in {FUNCTION_NAMESPACE}: {name} = {FUNCTION_NAMESPACE}[{name!r}]"
+                for name in sorted(names)
+            )
+        )
+        for node in ast.walk(prologue):
+            if isinstance(node, ast.stmt | ast.expr):
+                node.lineno = node.end_lineno = module.body[0].lineno
+        return _function_code([*prologue.body, *module.body], filename)
+    except SyntaxError:
+        return compile(module, filename, "exec")
+
+
+def _function_code(body: list[ast.stmt], filename: str) -> CodeType:
+    import ast
+
+    function = ast.FunctionDef(
+        name=FUNCTION_NAME,
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(FUNCTION_NAMESPACE)],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        ),
+        body=body,
+        decorator_list=[],
+        type_params=[],
+    )
+    module = ast.Module(body=[function], type_ignores=[])
+    ast.fix_missing_locations(ast.copy_location(function, body[0]))
+    code = compile(module, filename, "exec")
+    return next(const for const in code.co_consts if isinstance(const, CodeType))
+
+
+@functools.lru_cache(maxsize=4096)
+def _might_emit(content: str) -> bool:
+    # The header of a compound statement (e.g. a for loop) doesn't emit output itself, and neither does a statement that
+    # doesn't call anything (e.g. an assignment); anything else (including invalid code, to be safe) might.
+    if content.endswith(":"):
+        return False
+    import ast
+
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return True
+    return any(isinstance(node, ast.Call) for node in ast.walk(tree))
+
+
+class Indentation(dict[int, str]):
+    """
+    A cache of indentation prefixes by width, so they're not created over and over during execution.
+
+        >>> INDENTATION[4]
+        '    '
+    """
+
+    def __missing__(self, width: int) -> str:
+        self[width] = indentation = " " * width
+        return indentation
+
+
+INDENTATION = Indentation()
+
+
+class PluginBundle(NamedTuple):
+    """
+    A plugin's macros and hooks, extracted from its namespace (see GX.bundle).
+
+    Attributes:
+        g_globals: The names added to the generation namespace (without their prefix) and their values.
+        x_hooks: The names added to the execution namespace (without their prefix) and their functions, which are bound
+            to the GX they're loaded into.
+        on_load: The function called after the plugin loads (if any).
+    """
+
+    g_globals: tuple[tuple[str, Any], ...]
+    x_hooks: tuple[tuple[str, Callable[..., Any]], ...]
+    on_load: Callable[[GX], None] | None
+
+
+class Namespace(collections.ChainMap[str, Any]):
+    """
+    A generation namespace layered over other namespaces, so it can be derived from them without copying them: names are
+    looked up in its own layer and then in the others, and are assigned (or deleted) in its own layer only.
+
+        >>> namespace = Namespace.layer({"x": 1, "y": 2})
+        >>> namespace["x"] = 3
+        >>> namespace["x"], namespace["y"]
+        (3, 2)
+        >>> namespace.maps
+        [{'x': 3}, {'x': 1, 'y': 2}]
+    """
+
+    # Names are looked up in every generation-time expression, mostly in the bottom layers or not at all (e.g.
+    # builtins), so unlike in ChainMap, lookups don't raise and catch KeyError for every layer that doesn't have it.
+
+    def __getitem__(self, name: str) -> Any:
+        for mapping in self.maps:
+            value = mapping.get(name, NAMESPACE_MISSING)
+            if value is not NAMESPACE_MISSING:
+                return value
+        raise KeyError(name)
+
+    def __contains__(self, name: object) -> bool:
+        for mapping in self.maps:
+            if name in mapping:
+                return True
+        return False
+
+    def get(self, name: str, default: Any = None) -> Any:  # type: ignore
+        for mapping in self.maps:
+            value = mapping.get(name, NAMESPACE_MISSING)
+            if value is not NAMESPACE_MISSING:
+                return value
+        return default
+
+    @classmethod
+    def layer(cls, *namespaces: Mapping[str, Any]) -> Self:
+        """
+        Create a namespace with an empty layer over other namespaces.
+
+        Arguments:
+            *namespaces: The namespaces to layer over, from the first to the last looked up (layered namespaces are
+                flattened, so lookups don't go through more than one of them, unless they're of a subclass, which might
+                override lookups).
+
+        Returns:
+            The layered namespace.
+        """
+        maps: list[MutableMapping[str, Any]] = [{}]
+        for namespace in namespaces:
+            if type(namespace) in (Namespace, collections.ChainMap):
+                maps.extend(namespace.maps)
+            else:
+                maps.append(namespace)  # type: ignore
+        return cls(*maps)
+
+
+class LineTransforms(dict[str, LineTransform]):
+    """
+    A map of prefixes to line transforms, which dispatches lines to the transform of their longest matching prefix.
+
+        >>> line_transforms = LineTransforms({"!": transform_code, "!!": transform_raw, "": transform_text})
+        >>> line_transforms.match("!! x")
+        ('!!', transform_raw)
+
+    Rather than sorting the prefixes for every line, they're grouped by their first character (from the longest to the
+    shortest) into a dispatch table, which is only rebuilt after the map changes; so a line is usually matched with a
+    single lookup and a single startswith, regardless of how many line transforms there are.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._table: dict[str, list[tuple[str, LineTransform]]] | None = None
+
+    def __setitem__(self, prefix: str, transform: LineTransform) -> None:
+        super().__setitem__(prefix, transform)
+        self._table = None
+
+    def __delitem__(self, prefix: str) -> None:
+        super().__delitem__(prefix)
+        self._table = None
+
+    def __ior__(self, other: Any) -> Self:
+        super().__ior__(other)
+        self._table = None
+        return self
+
+    def clear(self) -> None:
+        super().clear()
+        self._table = None
+
+    def pop(self, *args: Any) -> Any:
+        self._table = None
+        return super().pop(*args)
+
+    def popitem(self) -> tuple[str, LineTransform]:
+        self._table = None
+        return super().popitem()
+
+    def setdefault(self, prefix: str, transform: LineTransform) -> LineTransform:  # type: ignore
+        self._table = None
+        return super().setdefault(prefix, transform)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        super().update(*args, **kwargs)
+        self._table = None
+
+    def copy(self) -> LineTransforms:
+        return LineTransforms(self)
+
+    def match(self, content: str) -> tuple[str, LineTransform] | None:
+        """
+        Find the line transform of the longest prefix a line starts with.
+
+        Arguments:
+            content: The line content.
+
+        Returns:
+            The prefix and its line transform, or None if no prefix matches (and there's no default transform).
+        """
+        table = self._table
+        if table is None:
+            table = self._table = self._build()
+        for prefix, transform in table.get(content[:1], ()):
+            if content.startswith(prefix):
+                return prefix, transform
+        # The default line transform (with an empty prefix) is kept under an empty key, which no content starts with.
+        if "" in table:
+            return table[""][0]
+        return None
+
+    def _build(self) -> dict[str, list[tuple[str, LineTransform]]]:
+        table: dict[str, list[tuple[str, LineTransform]]] = {}
+        for prefix, transform in sorted(self.items(), key=lambda item: len(item[0]), reverse=True):
+            table.setdefault(prefix[:1], []).append((prefix, transform))
+        return table
+
+
 from .code import Code, CodeArgument
+from .environment import Environment, Signature
 from .errors import ExecutionError, GenerationError, StopExecution
 from .origin import Origin
+from .output import Output, Sink, Writer
 from .plugins import plugins
 from .template import Line, Lines, Template, TemplateArgument
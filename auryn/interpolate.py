@@ -1,5 +1,10 @@
+import functools
+import re
 from typing import Iterator
 
+SPLIT_PATTERN = re.compile(r"[ '\"]")
+STRING_PATTERNS = {quote: re.compile(rf"[{quote}\\]") for quote in ["'", '"']}
+
 
 def interpolate(text: str, delimiters: str) -> Iterator[tuple[str, bool]]:
     """
@@ -13,6 +18,10 @@ def interpolate(text: str, delimiters: str) -> Iterator[tuple[str, bool]]:
         (' = ', False)
         ('x + y', True)
 
+    Rather than walking the string one character at a time, the scanner jumps between delimiters and quotes; and since
+    the same strings are interpolated over and over (e.g. the lines of a template that's included in a loop), results
+    are cached.
+
     Arguments:
         text: The string to interpolate.
         delimiters: The delimiters to use.
@@ -20,47 +29,7 @@ def interpolate(text: str, delimiters: str) -> Iterator[tuple[str, bool]]:
     Returns:
         An iterator over snippets and booleans indicating whether they are code.
     """
-    if delimiters.count(" ") != 1:
-        raise ValueError(f"invalid delimiters: {delimiters!r} (expected a space-separated pair)")
-    start, end = delimiters.split(" ")
-    if not start or not end or start == end:
-        raise ValueError(f"invalid delimiters: {delimiters!r} (delimiters must be non-empty and distinct)")
-    # If the text is a single delimiter, or doesn't contain both delimiters, there's nothing to do.
-    if text == start or text == end or (start not in text and end not in text):
-        yield text, False
-        return
-    text_len, start_len, end_len = len(text), len(start), len(end)
-    i = 0
-    snippet: list[str] = []
-    while i < text_len:
-        if text[i : i + start_len] == start:
-            # If the start delimiter appears twice, escape it.
-            if text[i + start_len : i + 2 * start_len] == start:
-                snippet.append(start)
-                i += 2 * start_len
-            # Otherwise, return the snippet that accumulated so far and the code that follows.
-            else:
-                fr = i + start_len
-                to = _skip_expression(text, start, end, fr)
-                code = text[fr:to].strip()
-                if snippet:
-                    yield "".join(snippet), False
-                    snippet.clear()
-                yield code, True
-                i = to + end_len
-        elif text[i : i + end_len] == end:
-            # If the end delimiter appears twice, escape it.
-            if text[i + end_len : i + 2 * end_len] == end:
-                snippet.append(end)
-                i += 2 * end_len
-            # Otherwise, we have an unmatched end delimiter.
-            else:
-                raise ValueError(f"unable to interpolate {text!r}: unmatched {end!r} at offset {i}")
-        else:
-            snippet.append(text[i])
-            i += 1
-    if snippet:
-        yield "".join(snippet), False
+    yield from _interpolate(text, delimiters)
 
 
 def split(text: str) -> Iterator[str]:
@@ -79,64 +48,121 @@ def split(text: str) -> Iterator[str]:
     Returns:
         An iterator over snippets.
     """
-    text_len, i = len(text), 0
+    yield from _split(text)
+
+
+@functools.lru_cache(maxsize=4096)
+def _interpolate(text: str, delimiters: str) -> tuple[tuple[str, bool], ...]:
+    start, end = _parse_delimiters(delimiters)
+    # If the text is a single delimiter, or doesn't contain both delimiters, there's nothing to do.
+    if text == start or text == end or (start not in text and end not in text):
+        return ((text, False),)
+    start_len, end_len = len(start), len(end)
+    delimiter_pattern = _delimiter_patterns(start, end)[0]
+    snippets: list[tuple[str, bool]] = []
+    snippet: list[str] = []
+    i = 0
+    while match := delimiter_pattern.search(text, i):
+        j = match.start()
+        snippet.append(text[i:j])
+        # The start delimiter is matched first, so it takes precedence if both delimiters match at the same offset.
+        if match.lastindex == 1:
+            # If the start delimiter appears twice, escape it.
+            if text.startswith(start, j + start_len):
+                snippet.append(start)
+                i = j + 2 * start_len
+            # Otherwise, add the snippet that accumulated so far and the code that follows.
+            else:
+                fr = j + start_len
+                to = _skip_expression(text, start, end, fr)
+                code = text[fr:to].strip()
+                if any(snippet):
+                    snippets.append(("".join(snippet), False))
+                snippet.clear()
+                snippets.append((code, True))
+                i = to + end_len
+        else:
+            # If the end delimiter appears twice, escape it.
+            if text.startswith(end, j + end_len):
+                snippet.append(end)
+                i = j + 2 * end_len
+            # Otherwise, we have an unmatched end delimiter.
+            else:
+                raise ValueError(f"unable to interpolate {text!r}: unmatched {end!r} at offset {j}")
+    snippet.append(text[i:])
+    if any(snippet):
+        snippets.append(("".join(snippet), False))
+    return tuple(snippets)
+
+
+@functools.lru_cache(maxsize=4096)
+def _split(text: str) -> tuple[str, ...]:
+    # Since quoted strings are skipped as a whole, every snippet is a contiguous part of the text.
     snippets: list[str] = []
-    while i < text_len:
-        if text[i] == " ":
-            if snippets:
-                yield "".join(snippets)
-                snippets.clear()
-            i += 1
-        elif text[i] in ["'", '"']:
-            to = _skip_string(text, i)
-            snippets.append(text[i:to])
-            i = to
+    fr = i = 0
+    while match := SPLIT_PATTERN.search(text, i):
+        j = match.start()
+        if text[j] == " ":
+            if j > fr:
+                snippets.append(text[fr:j])
+            fr = i = j + 1
         else:
-            snippets.append(text[i])
-            i += 1
-    if snippets:
-        yield "".join(snippets)
+            i = _skip_string(text, j)
+    if len(text) > fr:
+        snippets.append(text[fr:])
+    return tuple(snippets)
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_delimiters(delimiters: str) -> tuple[str, str]:
+    if delimiters.count(" ") != 1:
+        raise ValueError(f"invalid delimiters: {delimiters!r} (expected a space-separated pair)")
+    start, end = delimiters.split(" ")
+    if not start or not end or start == end:
+        raise ValueError(f"invalid delimiters: {delimiters!r} (delimiters must be non-empty and distinct)")
+    return start, end
+
+
+@functools.lru_cache(maxsize=64)
+def _delimiter_patterns(start: str, end: str) -> tuple[re.Pattern[str], re.Pattern[str]]:
+    # Alternatives are tried in order, so when several of them match at the same offset, the earlier one wins (just
+    # like checking the start delimiter, then the end delimiter, then quotes one character at a time).
+    start, end = re.escape(start), re.escape(end)
+    return re.compile(f"({start})|({end})"), re.compile(f"({start})|({end})|(['\"])")
 
 
 def _skip_expression(text: str, start: str, end: str, i: int) -> int:
-    text_len, start_len, end_len, offset = len(text), len(start), len(end), i
+    start_len, end_len, offset = len(start), len(end), i
+    expression_pattern = _delimiter_patterns(start, end)[1]
     depth = 1
-    while i < text_len:
+    while match := expression_pattern.search(text, i):
+        j = match.start()
         # Whenever the start delimiter is encountered, increase the depth.
-        if text[i : i + start_len] == start:
+        if match.lastindex == 1:
             depth += 1
-            i += start_len
+            i = j + start_len
         # Whenever the end delimiter is encountered, decrease the depth.
-        elif text[i : i + end_len] == end:
+        elif match.lastindex == 2:
             depth -= 1
             # If the depth reaches 0, we're done.
             if depth == 0:
-                break
-            i += end_len
+                return j
+            i = j + end_len
         # If a quote is encountered, skip the string to ignore any delimiters it might contain.
-        elif text[i] in ["'", '"']:
-            i = _skip_string(text, i)
         else:
-            i += 1
+            i = _skip_string(text, j)
     # If the depth never reached 0, we have an unmatched start delimiter.
-    if depth > 0:
-        raise ValueError(f"unable to interpolate {text!r}: unmatched {start!r} at offset {offset - start_len}")
-    return i
+    raise ValueError(f"unable to interpolate {text!r}: unmatched {start!r} at offset {offset - start_len}")
 
 
 def _skip_string(text: str, i: int) -> int:
     text_len, offset = len(text), i
-    quote = text[i]
+    string_pattern = STRING_PATTERNS[text[i]]
     i += 1
-    while i < text_len:
-        if text[i] == quote:
-            i += 1
-            break
+    while i < text_len and (match := string_pattern.search(text, i)):
+        j = match.start()
+        if text[j] != "\\":
+            return j + 1
         # If a backslash is encountered, skip the next character to ignore escaped quotes.
-        if text[i] == "\\":
-            i += 2
-        else:
-            i += 1
-    else:
-        raise ValueError(f"unable to interpolate {text!r}: unterminated quote at offset {offset}")
-    return i
+        i = j + 2
+    raise ValueError(f"unable to interpolate {text!r}: unterminated quote at offset {offset}")
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-import inspect
+import functools
 import pathlib
 
 
@@ -42,12 +42,14 @@ class Origin:
         Returns:
             The inferred origin.
         """
+        import inspect
+
         frame = inspect.currentframe()
         for _ in range(stack_level + 1):
             frame = frame and frame.f_back
         if not frame:
             raise RuntimeError("unable to infer origin")
-        path = pathlib.Path(frame.f_code.co_filename)
+        path = _path(frame.f_code.co_filename)
         line_number = frame.f_lineno
         return cls(path, line_number, None)
 
@@ -76,4 +78,11 @@ class Origin:
         return cls(path, line_number, gx)
 
 
+@functools.cache
+def _path(filename: str) -> pathlib.Path:
+    # Origins are inferred whenever a GX is created, mostly from the same few files, so their paths are only created
+    # once.
+    return pathlib.Path(filename)
+
+
 from .gx import GX
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import io
+import sys
+from typing import IO, TYPE_CHECKING, Any, Callable, ClassVar, Iterable
+
+if TYPE_CHECKING:
+    import socket
+
+type Sink = IO[str] | IO[bytes] | socket.socket | Callable[[str], Any] | Writer
+
+
+class Output(list[Any]):
+    """
+    An execution output that writes its items as soon as they're complete, instead of keeping them until the execution
+    is over.
+
+        >>> chunks = []
+        >>> output = Output(chunks.append)
+        >>> output.append("line 1\\n")
+        >>> output.append("line 2\\n")  # Completes line 1.
+        >>> chunks
+        ['line 1']
+        >>> output.close()
+        >>> chunks
+        ['line 1', '\\nline 2']
+
+    The written chunks add up to the same text as joining the items and stripping the result, so some items are held
+    back until they're complete:
+
+    - The last item, which might still change (e.g. with %strip).
+    - Trailing whitespace, which might turn out to be the end of the output (and be stripped).
+    - Items other than strings (e.g. bookmarks) whose is_open attribute is true, since they might still grow; and since
+      order matters, every item after them.
+
+    Attributes:
+        write: The function the output is written to.
+        lstrip: Whether to strip leading whitespace as well (e.g. when writing files).
+    """
+
+    def __init__(self, write: Callable[[str], None], lstrip: bool = False) -> None:
+        super().__init__()
+        self.write = write
+        self.lstrip = lstrip
+        self._whitespace = ""
+
+    def append(self, item: Any) -> None:
+        super().append(item)
+        self._flush(len(self) - 1)
+
+    def extend(self, items: Iterable[Any]) -> None:
+        super().extend(items)
+        self._flush(len(self) - 1)
+
+    def close(self) -> None:
+        """
+        Write the rest of the output, once the execution is over.
+        """
+        self._flush(len(self), closing=True)
+
+    def _flush(self, end: int, closing: bool = False) -> None:
+        count = 0
+        chunks: list[str] = [self._whitespace]
+        while count < end:
+            item = self[count]
+            if not closing and not isinstance(item, str) and getattr(item, "is_open", False):
+                break
+            chunks.append(str(item))
+            count += 1
+        if not count:
+            return
+        del self[:count]
+        text = "".join(chunks)
+        if self.lstrip:
+            text = text.lstrip()
+        chunk = text.rstrip()
+        self._whitespace = "" if closing else text[len(chunk) :]
+        if chunk:
+            self.lstrip = False
+            self.write(chunk)
+
+
+class Writer:
+    """
+    A buffered writer of execution output into a sink.
+
+        >>> with open("output.txt", "w") as file:
+        ...     writer = Writer(file)
+        ...     writer("hello ")
+        ...     writer("world")
+        ...     writer.flush()
+
+    The sink can be a text file object, a binary file object or a socket (in which case the output is encoded), or a
+    function that's called with the output; either way, it's written in chunks of at least the buffer size, so the
+    output is never kept in memory in its entirety.
+
+    Attributes:
+        sink: The sink the output is written to.
+        encoding: The encoding of the output, if the sink is binary (default is Writer.default_encoding).
+        buffer_size: The number of characters to buffer before writing them (default is Writer.default_buffer_size).
+    """
+
+    default_encoding: ClassVar[str] = "utf-8"
+    default_buffer_size: ClassVar[int] = 2**16
+
+    def __init__(self, sink: Sink, *, encoding: str | None = None, buffer_size: int | None = None) -> None:
+        if buffer_size is None:
+            buffer_size = self.default_buffer_size
+        self.sink = sink
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self._write = self._resolve(sink)
+        self._buffer: list[str] = []
+        self._size = 0
+
+    def __str__(self) -> str:
+        return f"writer into {self.sink!r}"
+
+    def __repr__(self) -> str:
+        return f"<{self}>"
+
+    def __call__(self, text: str) -> None:
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write the buffered output into the sink (and flush it, if it's a file object or another writer).
+        """
+        if self._buffer:
+            self._write("".join(self._buffer))
+            self._buffer.clear()
+            self._size = 0
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()  # type: ignore
+
+    def _resolve(self, sink: Sink) -> Callable[[str], Any]:
+        if isinstance(sink, Writer):
+            return sink
+        # If the socket module wasn't imported, the sink can't be a socket (and there's no need to import it).
+        socket = sys.modules.get("socket")
+        if socket and isinstance(sink, socket.socket):
+            return lambda text: sink.sendall(self._encode(text))
+        if hasattr(sink, "write"):
+            # Binary file objects are either explicitly binary, or opened in binary mode; the rest are text.
+            if (
+                self.encoding is not None
+                or isinstance(sink, io.RawIOBase | io.BufferedIOBase)
+                or (not isinstance(sink, io.TextIOBase) and "b" in getattr(sink, "mode", ""))
+            ):
+                return lambda text: sink.write(self._encode(text))  # type: ignore
+            return sink.write  # type: ignore
+        if callable(sink):
+            if self.encoding is not None:
+                return lambda text: sink(self._encode(text))
+            return sink
+        raise ValueError(f"invalid sink: {sink!r} (expected a file object, a socket or a function)")
+
+    def _encode(self, text: str) -> bytes:
+        return text.encode(self.encoding or self.default_encoding)
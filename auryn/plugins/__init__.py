@@ -1,8 +1,37 @@
-from . import core, filesystem
+import importlib
+from typing import Any, Iterator, Mapping
 
-plugins = {
-    "core": vars(core),
-    "filesystem": vars(filesystem),
-}
+
+class Plugins(Mapping[str, dict[str, Any]]):
+    """
+    The namespaces of the builtin plugins, by name.
+
+    Each plugin module is only imported once its namespace is first needed (e.g. filesystem, when it's loaded), so
+    importing auryn doesn't import all of them (and the modules they depend on).
+    """
+
+    def __init__(self, names: list[str]) -> None:
+        self._names = names
+        self._namespaces: dict[str, dict[str, Any]] = {}
+
+    def __getitem__(self, name: str) -> dict[str, Any]:
+        namespace = self._namespaces.get(name)
+        if namespace is None:
+            if name not in self._names:
+                raise KeyError(name)
+            namespace = self._namespaces[name] = vars(importlib.import_module(f".{name}", __name__))
+        return namespace
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._names
+
+
+plugins = Plugins(["core", "filesystem"])
 
 __all__ = ["plugins"]
@@ -1,16 +1,30 @@
+import collections
 import contextlib
 import pathlib
-from typing import Any, Iterator
+import re
+from typing import Any, Hashable, Iterable, Iterator, MutableMapping
 
 from ..code import Code
-from ..gx import GX
-from ..template import Lines, TemplateArgument
-from ..utils import concat
+from ..code import Line as CodeLine
+from ..environment import DEPENDENCIES
+from ..gx import GX, Namespace
+from ..template import Line, Lines, Template, TemplateArgument
+from ..utils import concat, freeze, refers_to_file
 
 UNDEFINED = object()
+UNFROZEN = object()
 DEFINITIONS = "definitions"
 PARAMETERS = "parameters"
 BOOKMARKS = "bookmarks"
+APPENDING = "appending"
+CLOSING_BOOKMARKS = "closing_bookmarks"
+INCLUDES = "includes"
+SUBROUTINES = "subroutines"
+# The prefix of generated subroutine names, and the name of their output indentation parameter.
+SUBROUTINE_PREFIX = "_subroutine_"
+SUBROUTINE_INDENT = "_output_indent"
+BLOCK_CONTINUATION = re.compile(r"^(elif\b|else\s*:|except\b|finally\s*:)")
+LOOP_OR_DEFINITION = re.compile(r"^(async\s+)?(for|while|def|class)\b")
 
 
 def g_eval(gx: GX, code: str) -> None:
@@ -73,6 +87,8 @@ def g_include(
     generate: bool = True,
     interpolate: bool = True,
     continue_generation: bool = False,
+    cache: bool | None = None,
+    subroutine: bool | None = None,
 ) -> None:
     """
     Emit the text or generated code of another template.
@@ -90,6 +106,16 @@ def g_include(
 
     %include macros must not have children.
 
+    Within a generation, included template files are read and parsed once. With cache=True, their generated code is
+    also reused when they're included again (e.g. in a loop, or recursively) with the same plugins and indentation, as
+    long as the names their generation read from the generation namespace still have the same values as when they were
+    first read. Generations that use the state (e.g. %define, %insert or %bookmark) or change the values they read (e.g.
+    append to a list) are not reused, and neither are ones that continue the current generation; but since other side
+    effects (e.g. of calling a function) can't be detected, caching is opt-in.
+
+    With subroutine=True, the generated code is defined once as a function at the beginning of the generated code, and
+    the inclusion is replaced with a call to it (see Subroutines).
+
     Arguments:
         template: The template to include.
             If it's a template object, it's returned as is; if it's a path object or a string refering to a valid file,
@@ -105,23 +131,338 @@ def g_include(
         interpolate: Whether to interpolate the template text (default is True); if generate=True, this is ignored.
         continue_generation: Whether to carry over the current line transforms and generation namespace (default is
             False); note that the generation state is always shared.
+        cache: Whether to reuse the generated code of identical inclusions (default is GX.cache_includes_by_default,
+            which is False).
+        subroutine: Whether to generate the included template as a shared function (default is
+            GX.subroutines_by_default).
     """
     if load_core is None:
         load_core = gx.load_core_by_default
+    if cache is None:
+        cache = gx.cache_includes_by_default
+    if subroutine is None:
+        subroutine = gx.subroutines_by_default
     if gx.line.children:
         raise RuntimeError("%include macro must not have children")
     if not generate:
         template = gx.resolve_template(template)
         gx.add_text(gx.line.indent, template.text, crop=True, interpolate=interpolate)
         return
+    # Subroutines are generated without indentation, and called with the inclusion's indentation instead.
+    indent = 0 if subroutine else gx.line.indent
+    includes: IncludeCache = gx.state.setdefault(INCLUDES, IncludeCache())
+    template = includes.resolve(gx, template)
+    key: Hashable = None
+    if cache and not continue_generation:
+        key = includes.key(template, load, load_core, indent if subroutine else gx.text_indent + indent)
+    if key is not None:
+        code = includes.get(gx, key)
+        if code is not None:
+            if subroutine:
+                Subroutines.call(gx, code)
+            else:
+                gx.code.extend(code, gx.code_indent)
+            return
     included_gx = gx.derive(template, continue_generation=continue_generation)
+    if key is not None:
+        # Record what the generation reads from the state, to know whether it can be reused.
+        included_gx.state = RecordingState(gx.state)  # type: ignore
     if load_core:
         included_gx.load(gx.core_plugin_name)
     if load:
         included_gx.load(load)
-    included_gx.template.lines.snap(gx.line.indent)
-    included_gx.generate(gx.g_locals)
-    gx.extend(included_gx)
+    if subroutine:
+        included_gx.text_indent = 0
+    included_gx.template = included_gx.template.snap(indent)
+    if not continue_generation:
+        # The generation namespace is layered over this one instead of being copied into it (and over anything plugins
+        # added to it when they loaded); if the inclusion might be reused, what the generation reads from this one is
+        # recorded, to know when.
+        namespaces = [gx.g_locals, included_gx.g_locals] if included_gx.g_locals else [gx.g_locals]
+        namespace_type = RecordingNamespace if key is not None else Namespace
+        included_gx.g_locals = namespace_type.layer(*namespaces)
+    included_gx.generate()
+    if subroutine:
+        Subroutines.call(gx, included_gx.code)
+    else:
+        gx.extend(included_gx)
+    if key is not None:
+        includes.add(gx, key, included_gx)
+
+
+class IncludeCache:
+    """
+    The templates and generated code of %include'd templates, shared by a generation and its inclusions.
+
+    Attributes:
+        templates: The parsed templates, by path.
+        codes: The generated code, by template, plugins and indentation; since the same template might generate
+            different code depending on the generation namespace, each key maps to a list of inputs (the values of the
+            names its generation read) and the code they generated.
+    """
+
+    def __init__(self) -> None:
+        self.templates: dict[pathlib.Path, Template] = {}
+        self.codes: dict[Hashable, list[tuple[dict[str, Hashable], Code]]] = {}
+
+    def resolve(self, gx: GX, template: TemplateArgument) -> TemplateArgument:
+        """
+        Resolve a template file through the cache (other templates are returned as is).
+
+        Arguments:
+            gx: The including generation/execution.
+            template: The template to resolve.
+
+        Returns:
+            The resolved template.
+        """
+        if isinstance(template, Template) or not refers_to_file(template):
+            return template
+        path = gx.root / gx.g_interpolate(str(template))
+        if path not in self.templates:
+            self.templates[path] = gx.resolve_template(path)
+        return self.templates[path]
+
+    def key(self, template: TemplateArgument, load: Any, load_core: bool, indent: int) -> Hashable:
+        """
+        Return the cache key of an inclusion.
+
+        Arguments:
+            template: The resolved template (see IncludeCache.resolve).
+            load: The additional plugins loaded into the inclusion.
+            load_core: Whether the core plugin is loaded into the inclusion.
+            indent: The indentation of the generated text.
+
+        Returns:
+            The cache key, or None if the inclusion can't be cached (e.g. if its plugins aren't hashable).
+        """
+        # Generated text is indented by the template line's indentation, so unlike the code indentation (which is added
+        # when the code is spliced), it's part of the key.
+        try:
+            return template, freeze(load), load_core, indent
+        except TypeError:
+            return None
+
+    def get(self, gx: GX, key: Hashable) -> Code | None:
+        """
+        Look up the generated code of an inclusion.
+
+        Arguments:
+            gx: The including generation/execution.
+            key: The inclusion's cache key.
+
+        Returns:
+            The generated code, or None if it's missing.
+        """
+        for inputs, code in self.codes.get(key, ()):
+            try:
+                if all(freeze(gx.g_locals.get(name, UNDEFINED)) == value for name, value in inputs.items()):
+                    return code
+            except TypeError:
+                continue
+        return None
+
+    def add(self, gx: GX, key: Hashable, included_gx: GX) -> None:
+        """
+        Add the generated code of an inclusion, if it can be reused (i.e. its generation didn't use the state, and the
+        values it read can be frozen and didn't change since it read them).
+
+        Arguments:
+            gx: The including generation/execution.
+            key: The inclusion's cache key.
+            included_gx: The included generation/execution.
+        """
+        if included_gx.state.accessed:  # type: ignore
+            return
+        inputs: dict[str, Hashable] = included_gx.g_locals.reads  # type: ignore
+        for name, value in inputs.items():
+            if value is UNFROZEN or _snapshot(gx.g_locals.get(name, UNDEFINED)) != value:
+                return
+        self.codes.setdefault(key, []).append((inputs, included_gx.code))
+
+
+class Subroutines:
+    """
+    The functions generated by %include and %insert with subroutine=True, shared by a generation and its inclusions.
+
+        >>> code = generate('''
+        ...     %define block
+        ...         <p>{x}</p>
+        ...     %insert: "block" subroutine=True
+        ...     <div>
+        ...         %insert: "block" subroutine=True
+        ...     </div>
+        ... ''')
+        >>> print(code)
+        def _subroutine_0(_output_indent):
+            with indent(_output_indent):
+                emit_text(0, f'<p>{x!s}</p>')
+        _subroutine_0(0)
+        emit_text(0, '<div>')
+        _subroutine_0(4)
+        emit_text(0, '</div>')
+
+    Each distinct generated code (of the same template) becomes one function, defined at the beginning of the outermost
+    generation's code (so it's available wherever it's called), which takes the output indentation of its call site.
+    Names assigned in it during execution are declared global, so like in inlined code, they're available after it's
+    called.
+
+    Attributes:
+        code: The function definitions.
+        names: The function names, by their generated code.
+    """
+
+    def __init__(self, gx: GX) -> None:
+        self.code = Code()
+        self.names: dict[Hashable, str] = {}
+        # The definitions are added once the outermost generation is complete, so they're not discarded with its code
+        # (e.g. by %extend).
+        while gx.origin.gx is not None:
+            gx = gx.origin.gx
+        gx.on_complete(self._add_definitions)
+
+    @classmethod
+    def call(cls, gx: GX, code: Code) -> None:
+        """
+        Generate a call to the function of some generated code, defining it if necessary.
+
+        Arguments:
+            gx: The generation/execution the call is generated in.
+            code: The generated code of the function body, indented as if its output indentation were 0.
+        """
+        subroutines: Subroutines | None = gx.state.get(SUBROUTINES)
+        if subroutines is None:
+            subroutines = gx.state[SUBROUTINES] = cls(gx)
+        lines = code.lines
+        # Identical code generated from different templates is not shared, so its lines are attributed to their own
+        # source.
+        key = tuple(
+            (line.gx.template.path, line.gx.template.text, line.template_line_number, line.indent, line.content)
+            for line in lines
+        )
+        name = subroutines.names.get(key)
+        if name is None:
+            name = subroutines.names[key] = f"{SUBROUTINE_PREFIX}{len(subroutines.names)}"
+            # The definition is attributed to the line that first calls it, and its body to its own source.
+            subroutines.code.append(gx, gx.line.number, 0, f"def {name}({SUBROUTINE_INDENT}):")
+            global_names = _assigned_names(line.to_string(add_source_comment=False) for line in lines)
+            if global_names:
+                subroutines.code.append(gx, gx.line.number, 4, f"global {', '.join(global_names)}")
+            subroutines.code.append(gx, gx.line.number, 4, f"with {gx.INDENT}({SUBROUTINE_INDENT}):")
+            if lines:
+                subroutines.code.extend(code, 8)
+            else:
+                subroutines.code.append(gx, gx.line.number, 8, "pass")
+        gx.add_code(f"{name}({gx.text_indent + gx.line.indent})")
+
+    def _add_definitions(self, gx: GX) -> None:
+        # Other post-processors might replace the code, so the definitions are only added after the last one.
+        if gx.postprocessors[-1][1] != self._add_definitions:
+            gx.on_complete(self._add_definitions)
+            return
+        code = Code()
+        code.extend(self.code)
+        code.extend(gx.code)
+        gx.code = code
+
+
+class RecordingNamespace(Namespace):
+    """
+    A layered generation namespace that records the names read from the namespaces under its own layer (i.e. before
+    they're assigned), and their values when they were first read.
+
+    The values are frozen (see freeze) as soon as they're read, so that changes made to them afterwards (e.g. by the
+    generation itself) are not mistaken for its inputs.
+
+    Attributes:
+        reads: The frozen values of the names read (UNDEFINED if they were missing, and UNFROZEN if they couldn't be
+            frozen), by name.
+    """
+
+    def __init__(self, *maps: MutableMapping[str, Any]) -> None:
+        super().__init__(*maps)
+        self.reads: dict[str, Hashable] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        self._read(name)
+        return super().__getitem__(name)
+
+    def __contains__(self, name: object) -> bool:
+        self._read(name)
+        return super().__contains__(name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        self._read(name)
+        return super().get(name, default)
+
+    def _read(self, name: object) -> None:
+        if isinstance(name, str) and name not in self.maps[0] and name not in self.reads:
+            self.reads[name] = _snapshot(super().get(name, UNDEFINED))
+
+
+def _assigned_names(code_lines: Iterable[str]) -> list[str]:
+    # The names bound at the top level of some generated code (e.g. by assignments, loops, definitions or imports).
+    import symtable
+
+    try:
+        table = symtable.symtable("\n".join(code_lines), "<subroutine>", "exec")
+    except SyntaxError:
+        return []
+    return sorted(symbol.get_name() for symbol in table.get_symbols() if symbol.is_assigned() or symbol.is_imported())
+
+
+def _snapshot(value: Any) -> Hashable:
+    try:
+        return freeze(value)
+    except TypeError:
+        return UNFROZEN
+
+
+class RecordingState(collections.UserDict[str, Any]):
+    """
+    A view of the generation state that records whether it was used.
+
+    The state is shared rather than copied, and since its view may itself be recorded (i.e. in a nested inclusion),
+    using it is recorded there as well; looking up the include cache and file dependencies doesn't count.
+
+    Attributes:
+        accessed: Whether the state was used.
+    """
+
+    IGNORED: set[str] = {INCLUDES, DEPENDENCIES, CLOSING_BOOKMARKS}
+
+    def __init__(self, state: MutableMapping[str, Any]) -> None:
+        super().__init__()
+        self.data = state  # type: ignore
+        self.accessed = False
+
+    def __getitem__(self, key: str) -> Any:
+        self._access(key)
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._access(key)
+        self.data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        self._access(key)
+        del self.data[key]
+
+    def __contains__(self, key: object) -> bool:
+        self._access(key)
+        return key in self.data
+
+    def __iter__(self) -> Iterator[str]:
+        self._access(None)
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        self._access(None)
+        return len(self.data)
+
+    def _access(self, key: object) -> None:
+        if key not in self.IGNORED:
+            self.accessed = True
 
 
 def g_define(gx: GX, name: str) -> None:
@@ -222,7 +563,7 @@ def g_ifndef(gx: GX, name: str) -> None:
         gx.transform(gx.line.children.snap())
 
 
-def g_insert(gx: GX, name: str, required: bool = False) -> None:
+def g_insert(gx: GX, name: str, required: bool = False, subroutine: bool | None = None) -> None:
     """
     Insert a block previously defined with %define.
 
@@ -239,11 +580,20 @@ def g_insert(gx: GX, name: str, required: bool = False) -> None:
     Arguments:
         name: The name of the block to insert.
         required: Whether the block is required (default is False).
+        subroutine: Whether to generate the block as a shared function (default is GX.subroutines_by_default; see
+            Subroutines).
     """
+    if subroutine is None:
+        subroutine = gx.subroutines_by_default
     if required and gx.line.children:
         raise RuntimeError("%insert macro must not have children when required=True")
     definitions: dict[str, Lines] = gx.state.get(DEFINITIONS, {})
-    if name in definitions:
+    if name in definitions and subroutine:
+        with gx.patch(code=Code(), code_indent=0, text_indent=0):
+            gx.transform(definitions[name].snap(0))
+            code = gx.code
+        Subroutines.call(gx, code)
+    elif name in definitions:
         gx.transform(definitions[name].snap(gx.line.indent))
     else:
         if required:
@@ -292,8 +642,8 @@ def g_extend(gx: GX, template: TemplateArgument) -> None:
         # This way, there's nothing to replace; it's enough to include the extending template, as blocks are defined
         # in a shared state and will be available for it to insert. We only need to remove the children, since include
         # macros shouldn't have any.
-        gx.line.children = Lines()
-        g_include(gx, template)
+        with gx._line(Line(gx.line.number, gx.line.indent, gx.line.content)):
+            g_include(gx, template)
         return
 
     def replace_code(gx: GX) -> None:
@@ -376,7 +726,7 @@ def g_raw(gx: GX) -> None:
 
 
 def no_transform(gx: GX, content: str) -> None:
-    gx.add_code(f"{gx.EMIT}({gx.line.indent}, {content!r})")
+    gx.add_code(f"{gx.EMIT_TEXT}({gx.text_indent + gx.line.indent}, {content!r})")
     gx.transform()
 
 
@@ -572,10 +922,20 @@ class Bookmark:
     def __init__(self, indent: int) -> None:
         self.indent = indent
         self.lines: list[Any] = []
+        # A bookmark is closed once it can no longer be appended to (see _close_bookmarks), or once another bookmark
+        # takes its name; until then, and while it's being appended to or any bookmark nested in it is open, streamed
+        # output is held back at it.
+        self.closed = False
+        self.appending = 0
+        self.bookmarks: list[Bookmark] = []
 
     def __str__(self) -> str:
         return "".join(map(str, self.lines))
 
+    @property
+    def is_open(self) -> bool:
+        return not self.closed or self.appending > 0 or any(bookmark.is_open for bookmark in self.bookmarks)
+
 
 def g_bookmark(gx: GX, name: str) -> None:
     """
@@ -596,6 +956,9 @@ def g_bookmark(gx: GX, name: str) -> None:
 
     Bookmark children are transformed as its initial content.
 
+    When streaming, output after a bookmark is held back until it's closed: after the last %append to it in its block,
+    if that can be determined statically (see x_close_bookmark), or once another bookmark takes its name.
+
     Arguments:
         name: The bookmark name.
     """
@@ -603,6 +966,12 @@ def g_bookmark(gx: GX, name: str) -> None:
         gx.transform(gx.line.children.snap())
     # Add a hook to define a bookmark into which the %append hook will inject output.
     gx.add_code(f"bookmark({gx.interpolated(name)}, {gx.line.indent})")
+    # Once the outermost generation is complete, add hooks to close the bookmarks after their last %append.
+    if not gx.state.get(CLOSING_BOOKMARKS):
+        gx.state[CLOSING_BOOKMARKS] = True
+        while gx.origin.gx is not None:
+            gx = gx.origin.gx
+        gx.on_complete(_close_bookmarks)
 
 
 def x_bookmark(gx: GX, name: str, indent: int) -> None:
@@ -615,7 +984,14 @@ def x_bookmark(gx: GX, name: str, indent: int) -> None:
     """
     bookmark = Bookmark(indent)
     bookmarks: dict[str, Bookmark] = gx.state.setdefault(BOOKMARKS, {})
+    if name in bookmarks:
+        bookmarks[name].closed = True
     bookmarks[name] = bookmark
+    # If the bookmark is created while appending to another bookmark, it's nested in it.
+    for parent in reversed(gx.state.get(APPENDING, [])):
+        if parent.lines is gx.output:
+            parent.bookmarks.append(bookmark)
+            break
     # Add the bookmark object to the output; when concatenated, it will be converted to a string containing all the
     # content that was appended to it.
     gx.output.append(bookmark)
@@ -634,7 +1010,8 @@ def g_append(gx: GX, name: str) -> None:
         raise RuntimeError("%append macro must have children")
     # Add a hook to temporarily redirect the execution output into the bookmark.
     gx.add_code(f"with append({gx.interpolated(name)}, {str(gx.line)!r}):")
-    with gx.increased_code_indent():
+    # The bookmark determines the output indentation, so the children don't inherit any.
+    with gx.increased_code_indent(), gx.patch(text_indent=0):
         gx.transform(gx.line.children.snap(0))
 
 
@@ -652,8 +1029,130 @@ def x_append(gx: GX, name: str, line: str) -> Iterator[None]:
             f"missing bookmark {name!r} referenced on {line} (available bookmarks are {concat(sorted(bookmarks))})"
         )
     bookmark = bookmarks[name]
-    with gx.patch(output=bookmark.lines, output_indent=bookmark.indent):
-        yield
+    appending: list[Bookmark] = gx.state.setdefault(APPENDING, [])
+    appending.append(bookmark)
+    bookmark.appending += 1
+    try:
+        with gx.patch(output=bookmark.lines, output_indent=bookmark.indent):
+            yield
+    finally:
+        bookmark.appending -= 1
+        appending.pop()
+
+
+def x_close_bookmark(gx: GX, name: str) -> None:
+    """
+    Close a bookmark once it can no longer be appended to, so streamed output is no longer held back at it.
+
+    This hook is added to the generated code after the last %append that might refer to the bookmark.
+
+    Arguments:
+        name: The name of the bookmark to close.
+    """
+    bookmarks: dict[str, Bookmark] = gx.state.get(BOOKMARKS, {})
+    if name in bookmarks:
+        bookmarks[name].closed = True
+
+
+def _close_bookmarks(gx: GX) -> None:
+    # Other post-processors might change the code (e.g. %extend), so the hooks are only added after the last one (except
+    # for the subroutine definitions, which are checked as they are).
+    last = gx.postprocessors[-1][1]
+    if last is not _close_bookmarks and not isinstance(getattr(last, "__self__", None), Subroutines):
+        gx.on_complete(_close_bookmarks)
+        return
+    subroutines: Subroutines | None = gx.state.get(SUBROUTINES)
+    if subroutines and any(_bookmark_reference(line.content)[0] for line in subroutines.code.lines):
+        return
+    lines = list(gx.code.lines)
+    references: list[tuple[int, str | None]] = []
+    for index, line in enumerate(lines):
+        refers, name = _bookmark_reference(line.content)
+        if refers:
+            references.append((index, name))
+    # The hooks are attributed to the bookmarks' lines, by the index of the line they're added before.
+    closes: dict[int, list[tuple[CodeLine, str]]] = {}
+    for position, (index, name) in enumerate(references):
+        line = lines[index]
+        if name is None or not line.content.startswith("bookmark("):
+            continue
+        # A bookmark is closed after the last reference to it (or to a bookmark whose name isn't known statically) in
+        # its block, unless there are references to it after its block, or references before it that might execute
+        # after it (i.e. in definitions, or in loops around it).
+        indent = line.indent
+        end = next((i for i in range(index + 1, len(lines)) if lines[i].indent < indent), len(lines))
+        later = [i for i, other in references[position + 1 :] if other is None or other == name]
+        if later and (later[-1] >= end or any(_may_execute_after(lines, i, len(lines)) for i in later)):
+            continue
+        if any(
+            _may_execute_after(lines, i, index) for i, other in references[:position] if other is None or other == name
+        ):
+            continue
+        closes.setdefault(_statement_end(lines, later[-1] if later else index, indent), []).append(
+            (line, f"close_bookmark({name!r})")
+        )
+    if not closes:
+        return
+    code = Code()
+    for index in range(len(lines) + 1):
+        for bookmark_line, content in closes.get(index, []):
+            code.append(bookmark_line.gx, bookmark_line.template_line_number, bookmark_line.indent, content)
+        if index < len(lines):
+            line = lines[index]
+            code.append(line.gx, line.template_line_number, line.indent, line.content)
+    gx.code = code
+
+
+def _bookmark_reference(content: str) -> tuple[bool, str | None]:
+    # Returns whether a line of generated code defines or appends to a bookmark, and if so, its name (or None if it
+    # can't be known statically, e.g. if it's interpolated); names are passed through the s hook (see
+    # GX.interpolated), so literal names look like s('name').
+    if content.startswith("bookmark("):
+        expression = content
+    elif content.startswith("with append(") and content.endswith(":"):
+        expression = content.removeprefix("with ").removesuffix(":")
+    else:
+        return False, None
+    import ast
+
+    try:
+        argument = ast.parse(expression, mode="eval").body.args[0]  # type: ignore
+        if isinstance(argument, ast.Call) and isinstance(argument.func, ast.Name) and argument.func.id == "s":
+            name = "".join(ast.literal_eval(snippet) for snippet in argument.args)
+        else:
+            name = ast.literal_eval(argument)
+    except (SyntaxError, ValueError, TypeError, AttributeError, IndexError):
+        return True, None
+    return True, name if isinstance(name, str) else None
+
+
+def _may_execute_after(lines: list[CodeLine], index: int, after: int) -> bool:
+    # Returns whether a line of generated code might execute after a later one, i.e. if it's in a definition, or in a
+    # loop around both of them.
+    indent = lines[index].indent
+    for i in range(index - 1, -1, -1):
+        if lines[i].indent >= indent:
+            continue
+        indent = lines[i].indent
+        if LOOP_OR_DEFINITION.match(lines[i].content):
+            if lines[i].content.startswith(("def", "async def", "class")):
+                return True
+            end = next((j for j in range(i + 1, len(lines)) if lines[j].indent <= indent), len(lines))
+            if end > after:
+                return True
+    return False
+
+
+def _statement_end(lines: list[CodeLine], index: int, indent: int) -> int:
+    # Returns the index of the line after the statement at some indentation that contains a line of generated code
+    # (including any clauses that continue it, like else).
+    index += 1
+    while index < len(lines) and (
+        lines[index].indent > indent
+        or (lines[index].indent == indent and BLOCK_CONTINUATION.match(lines[index].content))
+    ):
+        index += 1
+    return index
 
 
 def x_camel_case(gx: GX, name: str) -> str:
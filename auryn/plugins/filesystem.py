@@ -2,10 +2,10 @@ import contextlib
 import os
 import pathlib
 import re
-import subprocess
+import threading
 from typing import Iterator
 
-from ..gx import GX, LineTransform
+from ..gx import GX, LineTransform, Namespace
 from ..interpolate import split
 
 PATH_INVOCATION = re.compile(
@@ -93,14 +93,13 @@ def transform_path(gx: GX, content: str) -> None:
     # 2. <path>: <arguments> - called with arguments split by whitespace, respecting quoted strings;
     # 3. <path>:: <arguments> - called with arguments as-is.
     if not arg:
-        code = f"{macro}(gx, {path!r})"
+        gx.invoke(macro, path)
     elif not invocation_type:
-        code = f"{macro}(gx, {path!r}, {arg!r})"
+        gx.invoke(macro, path, arg)
     elif invocation_type == ":":
-        code = f"{macro}(gx, {path!r}, {', '.join(split(arg))})"
+        gx.invoke(macro, path, code=", ".join(split(arg)))
     else:  # invocation_type == "::"
-        code = f"{macro}(gx, {path!r}, {arg})"
-    gx.g_exec(code)
+        gx.invoke(macro, path, code=arg)
 
 
 def transform_shell(gx: GX, content: str) -> None:
@@ -138,12 +137,11 @@ def transform_shell(gx: GX, content: str) -> None:
     # 2. $<command> # <keywords> - called with keyword arguments split by whitespace, respecting quoted strings;
     # 3. $<command> ## <keywords> - called with keyword arguments as-is.
     if not invocation_type:
-        code = f"shell(gx, {command!r})"
+        gx.invoke("shell", command)
     elif invocation_type == "#":
-        code = f"shell(gx, {command!r}, {', '.join(split(arg))})"
+        gx.invoke("shell", command, code=", ".join(split(arg)))
     else:  # invocation_type == "##"
-        code = f"shell(gx, {command!r}, {arg})"
-    gx.g_exec(code)
+        gx.invoke("shell", command, code=arg)
 
 
 def g_directory(
@@ -233,10 +231,11 @@ def g_file(
             path = gx.root / gx.g_interpolate(str(source))
             if generate:
                 source_gx = gx.derive(path)
-                source_gx.generate(gx.g_locals)
+                source_gx.g_locals = Namespace.layer(gx.g_locals)
+                source_gx.generate()
                 gx.extend(source_gx)
             else:
-                source_text = path.read_text()
+                source_text = gx.read(path)
                 gx.add_text(0, source_text, interpolate=interpolate)
         elif gx.line.children:
             with gx.patch(line_transforms=core_line_transforms):
@@ -252,10 +251,18 @@ def x_file(gx: GX, name: str) -> Iterator[None]:
     """
     path = pathlib.Path(name)
     path.parent.mkdir(parents=True, exist_ok=True)
-    output: list[str] = []
-    with gx.patch(output=output):
-        yield
-        path.write_text("".join(output).strip())
+    # The file content is written as it's emitted, rather than collected and written at once; so it's written into a
+    # temporary file that replaces the file only once it's complete, so that a failed execution leaves it untouched.
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with temp_path.open("w") as file, gx.redirect_output(file, lstrip=True):
+            yield
+        # Keep the permissions of the file being replaced (e.g. of executable scripts).
+        with contextlib.suppress(FileNotFoundError):
+            os.chmod(temp_path, path.stat().st_mode)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
 
 
 def g_shell(
@@ -316,6 +323,8 @@ def x_shell(
     """
     The corresponding hook to the %shell macro ($).
     """
+    import subprocess
+
     result = subprocess.run(command, shell=True, capture_output=True, timeout=timeout)
     if strict and result.returncode:
         raise RuntimeError(f"failed to run {command!r}: " f"[{result.returncode}] {result.stderr.decode()}")
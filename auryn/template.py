@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import itertools
 import pathlib
-from typing import ClassVar, Iterator, Self
+from typing import Any, ClassVar, Iterable, Iterator
 
-from .utils import crop_lines, refers_to_file, split_indent
+from .utils import LEADING_EMPTY_LINES, refers_to_file
 
 type TemplateArgument = str | pathlib.Path | Template
 
@@ -29,21 +30,31 @@ class Template:
         >>> template.lines[0].children[0]
         <line 2: 4 | b>
 
+    Templates are immutable, so once parsed, they can be cached and shared (e.g. between GXs and threads); aligning
+    their lines to some indentation returns a new template instead (see Lines.snap).
+
     Attributes:
         text: The template text.
         path: The template path (or None if it's a string).
         lines: The root lines of the template (see Lines).
     """
 
+    __slots__ = ("text", "path", "lines")
+
     # How much of the template's content is included in its string representation.
     preview_length: ClassVar[int] = 60
+    # Whether templates are parsed lazily by default (see Template.from_text).
+    lazy_by_default: ClassVar[bool] = False
 
     def __init__(self, text: str = "", path: pathlib.Path | None = None, lines: Lines | None = None) -> None:
         if lines is None:
             lines = Lines()
-        self.text = text
-        self.path = path
-        self.lines = lines
+        _set(self, "text", text)
+        _set(self, "path", path)
+        _set(self, "lines", lines)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
 
     def __str__(self) -> str:
         output = ["template"]
@@ -58,8 +69,20 @@ class Template:
             output.append(f": {preview}...")
         return f"<{''.join(output)}>"
 
+    def snap(self, to: int) -> Template:
+        """
+        Return the template with its lines aligned to a given indentation (see Lines.snap).
+
+        Arguments:
+            to: The indentation to align to.
+
+        Returns:
+            The aligned template.
+        """
+        return type(self)(self.text, self.path, self.lines.snap(to))
+
     @classmethod
-    def parse(cls, template: TemplateArgument) -> Template:
+    def parse(cls, template: TemplateArgument, *, lazy: bool | None = None) -> Template:
         """
         Parse a template from a string, a path, or another template object.
 
@@ -67,6 +90,8 @@ class Template:
             template: The template to parse.
                 If it's a template object, it's returned as is; if it's a path object or a string refering to a valid
                 file, its contents are parsed; otherwise, *it* is parsed.
+            lazy: Whether to create the lines nested in other lines only once they're accessed (default is
+                Template.lazy_by_default; see Template.from_text).
 
         Returns:
             The parsed template.
@@ -79,28 +104,35 @@ class Template:
         else:
             path = None
             text = str(template)
-        # Line numbers should start at 1, but crop_lines returns 0-indexed numbers. This works for strings where the
-        # first line is empty (e.g. """\n...\n"""), but for files it should be offset by 1.
-        offset = 1 if path else 0
-        lines = Lines()
-        stack: list[Line] = []
-        for number, line_text in crop_lines(text):
-            number += offset
-            indent, content = split_indent(line_text)
-            # If the line is empty, use the indentation of the previous line.
-            if not content:
-                indent = stack[-1].indent if stack else 0
-            # Find the last line with greater or equal indentation.
-            while stack and stack[-1].indent >= indent:
-                stack.pop()
-            # If the stack is not empty, this line is a child of the last line in the stack.
-            if stack:
-                line = stack[-1].children.append(number, indent, content)
-            # Otherwise, it's a root line.
-            else:
-                line = lines.append(number, indent, content)
-            stack.append(line)
-        return cls(text, path, lines)
+        return cls.from_text(text, path, lazy=lazy)
+
+    @classmethod
+    def from_text(cls, text: str, path: pathlib.Path | None = None, *, lazy: bool | None = None) -> Template:
+        """
+        Parse a template from its text.
+
+        The text is cropped like crop_lines does, and every line is split into its indentation and content; then, the
+        lines are organized into parents and children. If lazy=True, only the root lines are created at first, and the
+        lines nested in each line are created once its children are first accessed, so the cost of parsing huge
+        templates is proportional to how much of them is actually transformed (e.g. blocks that are never inserted,
+        or branches that are never taken, are never created).
+
+        Arguments:
+            text: The template text.
+            path: The path the text was read from (or None if it's a string).
+            lazy: Whether to create the lines nested in other lines only once they're accessed (default is
+                Template.lazy_by_default).
+
+        Returns:
+            The parsed template.
+        """
+        if lazy is None:
+            lazy = cls.lazy_by_default
+        rows = _Rows(text, path)
+        if lazy:
+            lines = Lines._from_block(_Block(rows, 0, len(rows.indents)), None) if rows.indents else Lines()
+            return cls(text, path, lines)
+        return cls(text, path, rows.build())
 
 
 class Lines:
@@ -142,18 +174,38 @@ class Lines:
         >>> children[1]
         line 3: 4 | c
 
+    Lines are immutable: snapping them to some indentation returns a view of the same lines, shifted by an offset.
+
+    Arguments:
+        lines: The lines.
+        parent: The line under which these lines are nested (or None for root lines).
+
     Attributes:
         parent: The line under which these lines are nested (or None for root lines).
     """
 
-    def __init__(self, parent: Line | None = None) -> None:
-        self.parent = parent
-        self._lines: list[Line] = []
+    __slots__ = ("parent", "_lines", "_block", "_offset", "_to", "_aligned")
+
+    def __init__(self, lines: Iterable[Line] = (), parent: Line | None = None) -> None:
+        _set(self, "parent", parent)
+        # The original lines (or, if they're parsed lazily, the block of template lines they're created from once
+        # they're first accessed), and how to align them: either shifted by an offset, or snapped to an indentation.
+        _set(self, "_lines", tuple(lines))
+        _set(self, "_block", None)
+        _set(self, "_offset", 0)
+        _set(self, "_to", None)
+        # The aligned lines, created when they're first accessed.
+        _set(self, "_aligned", self._lines)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
 
     def __str__(self) -> str:
-        if not self._lines:
+        if not self:
             return "no lines"
-        first, last = self._lines[0], self._lines[-1]
+        lines = self._original()
+        first, last = lines[0], lines[-1]
+        # Line numbers are the same in the original lines, so there's no need to align them.
         while last.children:
             last = last.children[-1]
         if self.parent:
@@ -164,51 +216,37 @@ class Lines:
         return f"<{self}>"
 
     def __bool__(self) -> bool:
-        return bool(self._lines)
+        # Blocks are never empty, so there's no need to parse them to tell.
+        return self._lines is None or bool(self._lines)
 
     def __len__(self) -> int:
-        return len(self._lines)
+        return len(self._original())
 
     def __iter__(self) -> Iterator[Line]:
-        yield from self._lines
+        yield from self._align()
 
     def __getitem__(self, index: int) -> Line:
-        return self._lines[index]
+        return self._align()[index]
 
-    def append(self, number: int, indent: int, content: str) -> Line:
+    def snap(self, to: int | None = None) -> Lines:
         """
-        Append a line.
-
-        Arguments:
-            number: The line number.
-            indent: The line indentation.
-            content: The line content.
+        Return the lines aligned to a given indentation.
 
-        Returns:
-            The appended line.
-        """
-        line = Line(number, indent, content)
-        self._lines.append(line)
-        return line
-
-    def snap(self, to: int | None = None) -> Self:
-        """
-        Align the lines to a given indentation.
-
-            >>> lines = Lines('''
-            ...      a
+            >>> lines = Template.parse('''
+            ...     a
             ...         b
-            ... ''')
-            >>> lines[0][0]
+            ... ''').lines
+            >>> lines[0].children[0]
             line 2: 4 | b  # Line 2 indentation is 4.
-            >>> lines.snap(2)[0][0]
+            >>> lines.snap(2)[0].children[0]
             line 2: 6 | b  # Line 1 was aligned to 2, so Line 2's indentation is now 6.
-            >>> lines[0].children.snap()
-            >>> lines[0][0]
-            line 2: 2 | b  # Line 1's children were aligned to its indentation, so Line 2's indentation is now 2.
-            >>> lines.snap()
-            >>> lines[0][0]
-            line 1: 0 | b  # Line 1's indentation was aligned to 0, so Line 2's indentation is now 0 as well.
+            >>> lines[0].children.snap()[0]
+            line 2: 0 | b  # Line 1's children were aligned to its indentation, so Line 2's indentation is now 0.
+            >>> lines[0].children[0]
+            line 2: 4 | b  # The original lines are unchanged.
+
+        Snapping doesn't change or copy any lines: it returns a view of the same lines, which aligns them (and their
+        children) as they're accessed, so it takes constant time regardless of how many lines are nested.
 
         Arguments:
             to: The indentation to align to.
@@ -216,16 +254,14 @@ class Lines:
                 If there is no parent, the lines are aligned to 0.
 
         Returns:
-            This lines object, for chaining.
+            The aligned lines.
         """
         if to is None:
             if self.parent:
                 to = self.parent.indent
             else:
                 to = 0
-        for line in self._lines:
-            line._dedent(line.indent - to)
-        return self
+        return self._view(self.parent, to=to)
 
     def to_string(self) -> str:
         """
@@ -249,12 +285,59 @@ class Lines:
             The lines as a string.
         """
         output: list[str] = []
-        for line in self._lines:
+        for line in self._align():
             output.append(" " * line.indent + line.content)
             if line.children:
                 output.append(line.children.to_string())
         return "\n".join(output)
 
+    @classmethod
+    def _from_block(cls, block: _Block, parent: Line | None) -> Lines:
+        lines = object.__new__(cls)
+        _set(lines, "parent", parent)
+        _set(lines, "_lines", None)
+        _set(lines, "_block", block)
+        _set(lines, "_offset", 0)
+        _set(lines, "_to", None)
+        _set(lines, "_aligned", None)
+        return lines
+
+    def _original(self) -> tuple[Line, ...]:
+        if self._lines is None:
+            _set(self, "_lines", self._block.parse())  # type: ignore
+        return self._lines  # type: ignore
+
+    def _view(self, parent: Line | None, offset: int = 0, to: int | None = None) -> Lines:
+        # There's nothing to align in no lines (which are shared by all the lines without children).
+        if not self:
+            return self
+        # Views always refer to the original lines, so views of views are as cheap to access.
+        if to is None:
+            if self._to is None:
+                offset += self._offset
+            else:
+                to = self._to + offset
+        lines = object.__new__(type(self))
+        _set(lines, "parent", parent)
+        _set(lines, "_lines", self._lines)
+        _set(lines, "_block", self._block)
+        _set(lines, "_offset", offset)
+        _set(lines, "_to", to)
+        _set(lines, "_aligned", None if to is not None or offset else self._lines)
+        return lines
+
+    def _align(self) -> tuple[Line, ...]:
+        if self._aligned is None:
+            lines = self._original()
+            if self._to is not None:
+                aligned = tuple(line._shift(self._to - line.indent) for line in lines)
+            elif self._offset:
+                aligned = tuple(line._shift(self._offset) for line in lines)
+            else:
+                aligned = lines
+            _set(self, "_aligned", aligned)
+        return self._aligned
+
 
 class Line:
     """
@@ -285,17 +368,27 @@ class Line:
         >>> line.children
         <children 2-3 of line 1>
 
+    Like templates, lines are immutable; and since most lines have no children, they share the same (parentless) empty
+    lines object.
+
     Arguments:
         number: The line number.
         indent: The indentation level.
         content: The content of the line.
+        children: The lines nested under this line.
     """
 
-    def __init__(self, number: int, indent: int, content: str) -> None:
-        self.number = number
-        self.indent = indent
-        self.content = content
-        self.children = Lines(parent=self)
+    __slots__ = ("number", "indent", "content", "children")
+
+    def __init__(self, number: int, indent: int, content: str, children: Iterable[Line] = ()) -> None:
+        children = tuple(children)
+        _set(self, "number", number)
+        _set(self, "indent", indent)
+        _set(self, "content", content)
+        _set(self, "children", Lines(children, parent=self) if children else NO_LINES)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} objects are immutable")
 
     def __str__(self) -> str:
         return f"line {self.number}"
@@ -303,8 +396,134 @@ class Line:
     def __repr__(self) -> str:
         return f"<{self}: {self.indent} | {self.content}>"
 
-    def _dedent(self, offset: int) -> Self:
-        self.indent = max(self.indent - offset, 0)
-        for line in self.children:
-            line._dedent(offset)
-        return self
+    def _shift(self, offset: int) -> Line:
+        if not offset:
+            return self
+        line = object.__new__(type(self))
+        _set(line, "number", self.number)
+        _set(line, "indent", max(self.indent + offset, 0))
+        _set(line, "content", self.content)
+        _set(line, "children", self.children._view(line, offset))
+        return line
+
+
+# Template objects are immutable, so their attributes are set directly.
+_set = object.__setattr__
+
+NO_LINES = Lines()
+
+
+def _complete(line: Line, indent: int, children: list[Line]) -> None:
+    if not children:
+        _set(line, "children", NO_LINES)
+        return
+    lines = object.__new__(Lines)
+    _set(lines, "parent", line)
+    _set(lines, "_lines", tuple(children))
+    _set(lines, "_block", None)
+    _set(lines, "_offset", 0)
+    _set(lines, "_to", None)
+    _set(lines, "_aligned", lines._lines)
+    _set(line, "children", lines)
+
+
+class _Rows:
+    # The indentations and contents of a template's lines, before they're organized into parents and children.
+
+    __slots__ = ("first_number", "indents", "contents", "_ends")
+
+    def __init__(self, text: str, path: pathlib.Path | None) -> None:
+        # The same as crop_lines and split_indent, but with string methods rather than regular expressions per line.
+        # Line numbers should start at 1, but crop_lines counts from 0. This works for strings where the first line is
+        # empty (e.g. """\n...\n"""), but for files it should be offset by 1.
+        match = LEADING_EMPTY_LINES.match(text)
+        skipped_lines = match.group().count("\n") if match else 0
+        if match:
+            text = text[match.end() :]
+        rows = text.rstrip().expandtabs().splitlines()
+        self.first_number = skipped_lines + (1 if path else 0)
+        self.contents = [row.lstrip() for row in rows]
+        self.indents: list[int] = []
+        self._ends: list[int] | None = None
+        crop: int | None = None
+        indent = 0
+        for number, (row, content) in enumerate(zip(rows, self.contents)):
+            whitespace = len(row) - len(content)
+            # The first line determines the indentation to crop off.
+            if crop is None:
+                crop = whitespace
+            # Empty lines have the indentation of the previous line.
+            if content:
+                if whitespace < crop:
+                    prefix = row[:crop]
+                    number += skipped_lines
+                    raise ValueError(f"expected line {number} to start with {crop!r} spaces, but got {prefix!r}")
+                indent = whitespace - crop
+            self.indents.append(indent)
+
+    def build(self) -> Lines:
+        # Returns the root lines, with all their nested lines. Since this happens for every line in the template, lines
+        # are created directly (rather than with Line and Lines); the stack holds every line that might still have more
+        # children, with its indentation and children so far, and its children are set once it's complete.
+        root_lines: list[Line] = []
+        stack: list[tuple[Line, int, list[Line]]] = []
+        siblings = root_lines
+        for number, indent, content in zip(itertools.count(self.first_number), self.indents, self.contents):
+            while stack and stack[-1][1] >= indent:
+                _complete(*stack.pop())
+            siblings = stack[-1][2] if stack else root_lines
+            line = object.__new__(Line)
+            _set(line, "number", number)
+            _set(line, "indent", indent)
+            _set(line, "content", content)
+            siblings.append(line)
+            stack.append((line, indent, []))
+        while stack:
+            _complete(*stack.pop())
+        return Lines(root_lines)
+
+    def end(self, index: int) -> int:
+        # Returns the index after the last line nested in a line; these are computed for all the lines at once, with a
+        # stack of the lines that might still have more nested lines.
+        if self._ends is None:
+            ends = [len(self.indents)] * len(self.indents)
+            stack: list[int] = []
+            for i, indent in enumerate(self.indents):
+                while stack and self.indents[stack[-1]] >= indent:
+                    ends[stack.pop()] = i
+                stack.append(i)
+            self._ends = ends
+        return self._ends[index]
+
+
+class _Block:
+    # A (non-empty) range of lines, whose lines are created when they're first accessed (see Template.from_text).
+
+    __slots__ = ("rows", "start", "stop", "lines")
+
+    def __init__(self, rows: _Rows, start: int, stop: int) -> None:
+        self.rows = rows
+        self.start = start
+        self.stop = stop
+        self.lines: tuple[Line, ...] | None = None
+
+    def parse(self) -> tuple[Line, ...]:
+        if self.lines is not None:
+            return self.lines
+        rows = self.rows
+        lines: list[Line] = []
+        index = self.start
+        while index < self.stop:
+            end = rows.end(index)
+            line = object.__new__(Line)
+            _set(line, "number", rows.first_number + index)
+            _set(line, "indent", rows.indents[index])
+            _set(line, "content", rows.contents[index])
+            if end > index + 1:
+                _set(line, "children", Lines._from_block(_Block(rows, index + 1, end), line))
+            else:
+                _set(line, "children", NO_LINES)
+            lines.append(line)
+            index = end
+        self.lines = tuple(lines)
+        return self.lines
@@ -1,6 +1,6 @@
 import pathlib
 import re
-from typing import Any, Iterable, Iterator, TypeGuard
+from typing import Any, Hashable, Iterable, Iterator, TypeGuard
 
 LEADING_EMPTY_LINES = re.compile(r"^([ \t]*\r?\n)+")
 INDENT_AND_CONTENT = re.compile(r"^(\s*)(.*)$", flags=re.DOTALL)
@@ -118,3 +118,31 @@ def refers_to_file(arg: str | pathlib.Path) -> TypeGuard[pathlib.Path]:
         Whether the argument refers to a file.
     """
     return isinstance(arg, pathlib.Path) or "\n" not in arg
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Convert a value into a hashable equivalent, so it can be used as (part of) a cache key.
+
+        >>> freeze({"x": [1, 2], "y": {3}})
+        (<class 'dict'>, frozenset({('x', (<class 'list'>, (1, 2))), ('y', frozenset({3}))}))
+
+    Note that other hashable objects are used as-is, so objects that hash by identity are compared by identity.
+
+    Arguments:
+        value: The value to convert.
+
+    Returns:
+        The hashable equivalent.
+
+    Raises:
+        TypeError: If the value (or any value it contains) is not hashable.
+    """
+    if isinstance(value, dict):
+        return dict, frozenset((freeze(key), freeze(item)) for key, item in value.items())
+    if isinstance(value, list | tuple):
+        return type(value), tuple(freeze(item) for item in value)
+    if isinstance(value, set | frozenset):
+        return frozenset(freeze(item) for item in value)
+    hash(value)
+    return value
@@ -0,0 +1,56 @@
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable
+
+
+def measure(name: str, func: Callable[[], Any], *, number: int = 10, unit: str = "runs", scale: int = 1) -> float:
+    """
+    Measure and report the throughput of a function.
+
+    Arguments:
+        name: The name to report the measurement under.
+        func: The function to measure.
+        number: How many times to call the function (the best time is reported).
+        unit: The unit of work the function performs.
+        scale: How many units of work each call performs.
+
+    Returns:
+        The best time per call, in seconds.
+    """
+    func()  # Warm up.
+    best = float("inf")
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<40} {best * 1000:>10.3f} ms {scale / best:>14,.0f} {unit}/s")
+    return best
+
+
+def measure_memory(name: str, func: Callable[[], Any], *, unit: str = "objects", scale: int = 1) -> int:
+    """
+    Measure and report the memory retained by the result of a function, as traced by tracemalloc.
+
+    Arguments:
+        name: The name to report the measurement under.
+        func: The function to measure, which returns the objects whose memory is retained.
+        unit: The unit of work the function performs.
+        scale: How many units of work the call performs.
+
+    Returns:
+        The retained memory, in bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    size = after - before
+    print(f"{name:<40} {size / 2**20:>10.1f} MB {size / scale:>10,.0f} bytes/{unit} (peak {peak / 2**20:,.1f} MB)")
+    return size
@@ -0,0 +1,51 @@
+"""
+Generation throughput of nested inclusions (5 levels deep, 100 times) with a large generation context (10k names); and
+of generation-time code in an included template, which reads its names through the layered namespace.
+
+    $ python -m benchmarks.derive
+"""
+
+import auryn
+
+from . import measure
+
+CONTEXT = {f"field_{i}": i for i in range(10_000)}
+DEPTH = 5
+INCLUDES = 100
+LEVEL = """
+<p>{depth}</p>
+%!if depth:
+    %!depth -= 1
+    %include: level cache=False
+"""
+TEMPLATE = f"""
+%!for _ in range({INCLUDES}):
+    %include: level cache=False
+"""
+CODE = """
+%!total = 0
+%!for i in range(10_000):
+    %!total += field_1 + i
+%emit {total}
+"""
+
+
+def main() -> None:
+    measure(
+        "nested includes (10k names)",
+        lambda: auryn.generate(TEMPLATE, CONTEXT, level=LEVEL, depth=DEPTH),
+        number=5,
+        unit="includes",
+        scale=INCLUDES * (DEPTH + 1),
+    )
+    measure(
+        "included generation-time code",
+        lambda: auryn.generate("\n%include: code cache=False\n", CONTEXT, code=CODE),
+        number=5,
+        unit="iterations",
+        scale=10_000,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Throughput of generating and executing a template that uses one of many plugins, when all of them are loaded eagerly
+and when only the one it uses is discovered in the plugin directories.
+
+    $ python -m benchmarks.discovery
+"""
+
+import pathlib
+import tempfile
+
+import auryn
+
+from . import measure
+
+PLUGINS = 50
+MACROS = 10
+TEMPLATE = """
+%macro_0_0 hello
+{hook_0_0("world")}
+"""
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        paths: list[pathlib.Path] = []
+        for i in range(PLUGINS):
+            path = pathlib.Path(directory) / f"plugin_{i}.py"
+            definitions = []
+            for j in range(MACROS):
+                definitions.append(f"def g_macro_{i}_{j}(gx, text):\n    gx.add_text(0, text)\n")
+                definitions.append(f"def x_hook_{i}_{j}(gx, text):\n    return text\n")
+            path.write_text("\n".join(definitions))
+            paths.append(path)
+        auryn.GX.discover_plugins = False
+        measure("eager loading", lambda: auryn.execute(TEMPLATE, load=paths), number=200, unit="executions")
+        auryn.GX.discover_plugins = True
+        auryn.GX.add_plugins_directory(directory)
+        measure("discovery", lambda: auryn.execute(TEMPLATE), number=200, unit="executions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Per-line emit overhead: the generic EMIT hook against the specialized EMIT_TEXT and EMIT_NEWLINE hooks, with the code
+generated for a literal line, an interpolated line and an empty line; and a 100k-line render that uses them.
+
+    $ python -m benchmarks.emit
+"""
+
+import auryn
+
+from . import measure
+
+N = 100_000
+
+
+def main() -> None:
+    gx = auryn.GX.parse("\n")
+    for name, line in [
+        ("emit (literal)", "emit(4, 'line')"),
+        ("emit_text (literal)", "emit_text(4, 'line')"),
+        ("emit (interpolated)", "emit(4, 'line ', i)"),
+        ("emit_text (interpolated)", "emit_text(4, f'line {i!s}')"),
+        ("emit (newline)", "emit(None, '')"),
+        ("emit_newline", "emit_newline(None)"),
+    ]:
+        code = compile(f"for i in range({N}):\n    {line}", name, "exec")
+        measure(name, lambda: exec(code, {**gx.x_globals}) or gx.output.clear(), number=5, unit="lines", scale=N)
+    template = auryn.compile(
+        """
+        !for i in range(n):
+            line {i}
+        """
+    )
+    measure("render (100k lines)", lambda: template.render(n=N), number=5, unit="lines", scale=N)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Generation throughput of a macro-heavy template, where every line goes through dynamically executed code.
+
+    $ python -m benchmarks.generation
+"""
+
+import auryn
+
+from . import measure
+
+TEMPLATE = """
+%!for i in range(n):
+    %!x = i * 2
+    %emit line {i}
+    %eval y = {x}
+    !z = {i}
+    line {z}
+"""
+N = 1000
+
+
+def main() -> None:
+    measure("generate (macro-heavy)", lambda: auryn.generate(TEMPLATE, n=N), unit="iterations", scale=N)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Creation throughput of GX objects: parsing a template (inferring the origin, and with a given one), and stamping one out
+of a prototype with its plugins already loaded.
+
+    $ python -m benchmarks.gx
+"""
+
+import auryn
+
+from . import measure
+
+TEMPLATE = """
+!for i in range(n):
+    line {i}
+"""
+
+
+def main() -> None:
+    origin = auryn.Origin.infer(0)
+    prototype = auryn.GX.parse(auryn.Template())
+    measure("parse", lambda: auryn.GX.parse(TEMPLATE), number=20_000, unit="GXs")
+    measure("parse (given origin)", lambda: auryn.GX.parse(TEMPLATE, origin=origin), number=20_000, unit="GXs")
+    measure("clone prototype", lambda: prototype.clone(TEMPLATE), number=20_000, unit="GXs")
+
+
+if __name__ == "__main__":
+    main()
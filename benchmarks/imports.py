@@ -0,0 +1,58 @@
+"""
+Startup time of importing auryn, as reported by -X importtime (best of several fresh interpreters), with the modules
+that take the longest to import; and a check that the modules auryn defers until they're needed aren't imported.
+
+    $ python -m benchmarks.imports
+"""
+
+import subprocess
+import sys
+
+RUNS = 10
+TOP = 10
+DEFERRED = [
+    "ast",
+    "importlib.metadata",
+    "inspect",
+    "json",
+    "queue",
+    "shutil",
+    "socket",
+    "subprocess",
+    "tempfile",
+    "textwrap",
+    "uuid",
+    "auryn.plugins.core",
+    "auryn.plugins.filesystem",
+]
+
+
+def import_times() -> dict[str, int]:
+    # Each line of the report is "import time: <self us> | <cumulative us> | <indented module name>".
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import auryn"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+    return times
+
+
+def main() -> None:
+    runs = [import_times() for _ in range(RUNS)]
+    best = min(runs, key=lambda times: times["auryn"])
+    print(f"{'import auryn':<40} {best['auryn'] / 1000:>10.3f} ms")
+    for module, time in sorted(best.items(), key=lambda item: -item[1])[1 : TOP + 1]:
+        print(f"  {module:<38} {time / 1000:>10.3f} ms")
+    imported = [module for module in DEFERRED if module in best]
+    if imported:
+        raise SystemExit(f"deferred modules were imported: {', '.join(imported)}")
+
+
+if __name__ == "__main__":
+    main()
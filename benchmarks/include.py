@@ -0,0 +1,49 @@
+"""
+Generation throughput of a template that includes a partial once per model field, with and without reusing the
+generated code of identical inclusions.
+
+    $ python -m benchmarks.include
+"""
+
+import pathlib
+import tempfile
+
+import auryn
+
+from . import measure
+
+FIELDS = 1000
+TYPES = ["int", "str", "float", "bool"]
+PARTIAL = """
+%!if type == "str":
+    value = str(value).strip()
+%!if type != "str":
+    value = {type}(value)
+!if value is None:
+    raise ValueError("missing value")
+record.append(value)
+"""
+TEMPLATE = """
+%!for type in types:
+    %include: partial
+"""
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        partial = pathlib.Path(directory) / "partial.aur"
+        partial.write_text(PARTIAL)
+        types = [TYPES[i % len(TYPES)] for i in range(FIELDS)]
+        for cache in [False, True]:
+            auryn.GX.cache_includes_by_default = cache
+            measure(
+                f"include per field ({'cached' if cache else 'uncached'})",
+                lambda: auryn.generate(TEMPLATE, partial=partial, types=types),
+                number=5,
+                unit="includes",
+                scale=FIELDS,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Interpolation throughput of long text lines with a few expressions each, both when they're scanned for the first time
+and when they recur (e.g. in an included template).
+
+    $ python -m benchmarks.interpolate
+"""
+
+from auryn import interpolate
+from auryn.interpolate import _interpolate
+
+from . import measure
+
+LINES = [
+    f'<tr class="row-{i}"><td>{{name}}</td><td>{{ {{"a": {i}}}["a"] }}</td><td>{{{{escaped}}}}</td></tr>'
+    for i in range(1000)
+]
+
+
+def main() -> None:
+    def scan() -> None:
+        _interpolate.cache_clear()
+        for line in LINES:
+            list(interpolate(line, "{ }"))
+
+    def rescan() -> None:
+        for line in LINES:
+            list(interpolate(line, "{ }"))
+
+    measure("interpolate (first time)", scan, number=20, unit="lines", scale=len(LINES))
+    measure("interpolate (recurring)", rescan, number=20, unit="lines", scale=len(LINES))
+
+
+if __name__ == "__main__":
+    main()
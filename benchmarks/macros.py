@@ -0,0 +1,37 @@
+"""
+Generation throughput of a macro-dense layout, with hundreds of %include and %insert invocations.
+
+    $ python -m benchmarks.macros
+"""
+
+import auryn
+
+from . import measure
+
+PARTIAL = """
+<li>{item}</li>
+"""
+TEMPLATE = """
+%define header
+    <h1>{title}</h1>
+<ul>
+    %!for i in range(n):
+        %insert header
+        %include: partial
+        %include:: partial, continue_generation=False
+</ul>
+"""
+N = 200
+
+
+def main() -> None:
+    measure(
+        "generate (macro-dense)",
+        lambda: auryn.generate(TEMPLATE, n=N, partial=PARTIAL),
+        unit="macros",
+        scale=3 * N,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Memory retained by a parsed 500k-line template and by the code generated from it, as traced by tracemalloc.
+
+    $ python -m benchmarks.memory
+"""
+
+import auryn
+
+from . import measure_memory
+
+LINES = 500_000
+TEMPLATE = "\n".join(
+    f"!for i in range({i}):" if i % 5 == 0 else f"    <li class=\"item\">{{i}} of {i}</li>" for i in range(LINES)
+)
+
+
+def main() -> None:
+    measure_memory("template (500k lines)", lambda: auryn.Template.parse(TEMPLATE), unit="line", scale=LINES)
+    template = auryn.Template.parse(TEMPLATE)
+
+    def generate() -> auryn.Code:
+        gx = auryn.GX(auryn.Origin.infer(0), template, auryn.Code())
+        gx.load(gx.core_plugin_name)
+        gx.generate()
+        return gx.code
+
+    measure_memory("code (500k lines)", generate, unit="line", scale=LINES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Rendering throughput of a mostly-static template (a page of boilerplate HTML around a short loop), with and without
+optimizing the generated code.
+
+    $ python -m benchmarks.optimize
+"""
+
+import auryn
+
+from . import measure
+
+STATIC = "\n".join(f"<p class=\"static\">paragraph {i}</p>" for i in range(200))
+TEMPLATE = f"""
+<html>
+    <body>
+        {STATIC.replace("\n", "\n        ")}
+        !for i in range(3):
+            <p>{{i}}</p>
+        {STATIC.replace("\n", "\n        ")}
+    </body>
+</html>
+"""
+N = 100
+
+
+def main() -> None:
+    for optimize in [False, True]:
+        gx = auryn.GX.parse(TEMPLATE)
+        gx.generate()
+        if optimize:
+            gx.optimize()
+        template = auryn.CompiledTemplate(gx)
+        measure(
+            f"render ({'optimized' if optimize else 'unoptimized'})",
+            lambda: [template.render() for _ in range(N)],
+            number=5,
+            unit="renders",
+            scale=N,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Parsing throughput of a 100k-line template, eagerly and lazily; and generation throughput of a template whose lines are
+mostly in a block that's never inserted, parsed lazily, so they're never created.
+
+    $ python -m benchmarks.parse
+"""
+
+import auryn
+
+from . import measure
+
+LINES = 100_000
+TEMPLATE = "\n".join(
+    f"!for i in range({i}):" if i % 5 == 0 else f"    <li class=\"item\">{{i}} of {i}</li>" for i in range(LINES)
+)
+UNUSED_TEMPLATE = "\n".join(
+    [
+        "%define unused",
+        *(f"    <li>{i}</li>" if i % 5 else "    <ul>" for i in range(LINES)),
+        "line",
+    ]
+)
+
+
+def main() -> None:
+    measure("parse (eager)", lambda: auryn.Template.parse(TEMPLATE), number=5, unit="lines", scale=LINES)
+    measure("parse (lazy)", lambda: auryn.Template.parse(TEMPLATE, lazy=True), number=5, unit="lines", scale=LINES)
+    for lazy in [False, True]:
+        measure(
+            f"generate unused block ({'lazy' if lazy else 'eager'})",
+            lambda: auryn.generate(auryn.Template.parse(UNUSED_TEMPLATE, lazy=lazy)),
+            number=5,
+            unit="lines",
+            scale=LINES,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Generation throughput of a template that includes a partial once per item, loading a file plugin into each inclusion,
+with and without reusing the plugin module across loads.
+
+    $ python -m benchmarks.plugins
+"""
+
+import pathlib
+import tempfile
+
+import auryn
+
+from . import measure
+
+INCLUDES = 500
+PLUGIN = """
+import re
+
+WORD = re.compile(r"\\w+")
+
+
+def g_title(gx, text):
+    gx.add_text(0, " ".join(word.capitalize() for word in WORD.findall(text)))
+
+
+def x_shout(gx, text):
+    return text.upper()
+"""
+TEMPLATE = f"""
+%!for i in range({INCLUDES}):
+    %include: partial load=plugin cache=False
+"""
+PARTIAL = """
+%title item number {i}
+{shout("done")}
+"""
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        plugin = pathlib.Path(directory) / "plugin.py"
+        plugin.write_text(PLUGIN)
+        for reload in [True, False]:
+            auryn.GX.reload_plugins_by_default = reload
+            measure(
+                f"include with plugin ({'reloaded' if reload else 'cached'})",
+                lambda: auryn.generate(TEMPLATE, partial=PARTIAL, plugin=str(plugin)),
+                number=5,
+                unit="includes",
+                scale=INCLUDES,
+            )
+
+
+if __name__ == "__main__":
+    main()
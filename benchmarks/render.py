@@ -0,0 +1,42 @@
+"""
+Rendering throughput of the same template, with and without compiling it once.
+
+    $ python -m benchmarks.render
+"""
+
+import auryn
+
+from . import measure
+
+TEMPLATE = """
+<ul>
+    !for item in items:
+        <li>
+            {item['name']}: {item['price']}
+        </li>
+</ul>
+"""
+ITEMS = [{"name": f"item {i}", "price": i} for i in range(10)]
+N = 1000
+
+
+def main() -> None:
+    measure(
+        "execute",
+        lambda: [auryn.execute(TEMPLATE, items=ITEMS) for _ in range(N)],
+        number=3,
+        unit="renders",
+        scale=N,
+    )
+    template = auryn.compile(TEMPLATE)
+    measure(
+        "compile + render",
+        lambda: [template.render(items=ITEMS) for _ in range(N)],
+        number=3,
+        unit="renders",
+        scale=N,
+    )
+
+
+if __name__ == "__main__":
+    main()
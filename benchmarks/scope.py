@@ -0,0 +1,38 @@
+"""
+Rendering throughput of a tight loop over a large dataset, with the generated code compiled into a module (where every
+variable is an entry in the execution namespace) and into a function (where they're fast locals).
+
+    $ python -m benchmarks.scope
+"""
+
+import auryn
+
+from . import measure
+
+TEMPLATE = """
+!total = 0
+!for row in rows:
+    !total += row["price"] * row["quantity"]
+    !if row["quantity"] > 1:
+        {row["name"]}: {row["quantity"]}
+total: {total}
+"""
+ROWS = [{"name": f"item {i}", "price": i, "quantity": i % 3} for i in range(100_000)]
+
+
+def main() -> None:
+    gx = auryn.GX.parse(TEMPLATE)
+    gx.generate()
+    for function_scope in [False, True]:
+        code = gx.compile(function_scope=function_scope)
+        measure(
+            f"render ({'function' if function_scope else 'module'} scope)",
+            lambda: gx.clone()._run(code, {"rows": ROWS}),  # type: ignore
+            number=5,
+            unit="rows",
+            scale=len(ROWS),
+        )
+
+
+if __name__ == "__main__":
+    main()
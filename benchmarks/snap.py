@@ -0,0 +1,34 @@
+"""
+Generation throughput of a deeply nested template, where every level snaps its children (as code lines and most macros
+do), and of a parsed template reused across generations.
+
+    $ python -m benchmarks.snap
+"""
+
+import auryn
+
+from . import measure
+
+DEPTH = 200
+TEMPLATE = "\n".join(
+    line
+    for level in range(DEPTH)
+    for line in [f"{'    ' * level}!if True:", f"{'    ' * (level + 1)}line {level}"]
+)
+
+
+def main() -> None:
+    template = auryn.Template.parse(TEMPLATE)
+    lines = 2 * DEPTH
+
+    def generate() -> None:
+        gx = auryn.GX(auryn.Origin.infer(0), template, auryn.Code())
+        gx.load(gx.core_plugin_name)
+        gx.generate()
+
+    measure("generate (nested, parsed once)", generate, unit="lines", scale=lines)
+    measure("generate (nested)", lambda: auryn.generate(TEMPLATE), unit="lines", scale=lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Size and compile time of the generated code of a template that includes a 20-line partial 200 times, inlined and as a
+shared subroutine.
+
+    $ python -m benchmarks.subroutines
+"""
+
+import pathlib
+import tempfile
+
+import auryn
+
+from . import measure
+
+INCLUDES = 200
+PARTIAL = "\n".join(f"<tr><td>{i}</td><td>{{row[{i}]}}</td></tr>" for i in range(20))
+TEMPLATE = "\n".join("%include: partial" for _ in range(INCLUDES))
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        partial = pathlib.Path(directory) / "partial.aur"
+        partial.write_text(PARTIAL)
+        for subroutine in [False, True]:
+            auryn.GX.subroutines_by_default = subroutine
+            name = "subroutine" if subroutine else "inline"
+            code = auryn.generate(TEMPLATE, partial=partial)
+            print(f"{f'generated code ({name})':<40} {len(code.splitlines()):>10,} lines {len(code):>12,} characters")
+            measure(f"compile ({name})", lambda: compile(code, "<generated>", "exec"), unit="includes", scale=INCLUDES)
+
+
+if __name__ == "__main__":
+    main()
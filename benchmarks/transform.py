@@ -0,0 +1,34 @@
+"""
+Line-transform dispatch throughput of a 100k-line template, with a few additional line transforms installed (like the
+filesystem plugin does).
+
+    $ python -m benchmarks.transform
+"""
+
+import auryn
+
+from . import measure
+
+LINES = 100_000
+TEMPLATE = "\n".join("!x = 1" if i % 2 else f"line {i}" for i in range(LINES))
+
+
+def on_load(gx: auryn.GX) -> None:
+    for prefix in ["$", "@", "->", "=>", "::"]:
+        gx.line_transform(gx.transform_text, prefix)
+
+
+def main() -> None:
+    # Templates are immutable, so it can be parsed once and reused.
+    template = auryn.Template.parse(TEMPLATE)
+
+    def generate() -> None:
+        gx = auryn.GX(auryn.Origin.infer(0), template, auryn.Code())
+        gx.load({"on_load": on_load})
+        gx.generate()
+
+    measure("transform (100k lines)", generate, number=5, unit="lines", scale=LINES)
+
+
+if __name__ == "__main__":
+    main()
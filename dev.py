@@ -67,6 +67,12 @@ def type(args: list[str]) -> None:
     _execute("mypy", *packages)
 
 
+def bench(args: list[str]) -> None:
+    names = args or [path.stem for path in sorted((ROOT / "benchmarks").glob("*.py")) if path.stem != "__init__"]
+    for name in names:
+        _execute(sys.executable, "-m", f"benchmarks.{name}")
+
+
 def _execute(*args: Any) -> None:
     subprocess.run([str(arg) for arg in args])
 
@@ -94,6 +100,8 @@ def main(args: list[str]) -> None:
             lint(args)
         case ["type", *args]:
             type(args)
+        case ["bench", *args]:
+            bench(args)
         case _:
             print(f"unknown command {args[0]}")
             sys.exit(1)
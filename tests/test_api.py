@@ -1,8 +1,19 @@
 import pathlib
+import subprocess
+import sys
+import tracemalloc
 
 import pytest
 
-from auryn import GX, GenerationError, execute, generate
+from auryn import (
+    GX,
+    ExecutionError,
+    GenerationError,
+    compile,
+    execute,
+    generate,
+    stream,
+)
 
 from .conftest import this_line, trim
 
@@ -19,7 +30,7 @@ def test_generate() -> None:
     expected = trim(
         """
         for i in range(n):
-            emit(0, 'line ', i)
+            emit_text(0, f'line {i!s}')
         """
     )
     assert received == expected
@@ -74,6 +85,54 @@ def test_indent() -> None:
     assert received == expected
 
 
+def test_static_indent() -> None:
+    template = """
+        !def item(x):
+            <li>{x}</li>
+        <ul>
+            !for i in range(2):
+                !if i:
+                    !item(i)
+                !else:
+                    <li>none</li>
+            %bookmark b
+            !for i in range(2):
+                %append b
+                    <li>{i}</li>
+                %include: partial
+        </ul>
+        """
+    # Indentation known during generation is added to the emitted text, rather than applied during execution; only the
+    # call that might emit output on its own is indented during execution.
+    partial = "\n<li>included</li>\n"
+    code = generate(template, partial=partial)
+    assert code.count("with indent(") == 1
+    received = execute(template, g_partial=partial)
+    expected = trim(
+        """
+        <ul>
+            <li>none</li>
+            <li>1</li>
+            <li>0</li>
+            <li>1</li>
+            <li>included</li>
+            <li>included</li>
+        </ul>
+        """
+    )
+    assert received == expected
+
+
+def test_deep_indent() -> None:
+    # Static indentation doesn't nest blocks, so it's not limited by the number of statically nested blocks.
+    lines: list[str] = []
+    for i in range(30):
+        lines.append(f"{' ' * 8 * i}level {i}")
+        lines.append(f"{' ' * (8 * i + 4)}!if True:")
+    received = execute("\n".join(["", *lines, f"{' ' * 8 * 30}level 30", ""]))
+    assert received == "\n".join(f"{' ' * 4 * i}level {i}" for i in range(31))
+
+
 def test_code_block() -> None:
     received = execute(
         """
@@ -508,3 +567,84 @@ def test_no_line_transforms() -> None:
         match=rf"Failed to generate GX at {THIS_FILE}:{line_number}: unable to transform line 1 \(considered <none>\).",  # noqa: E501 (line too long)
     ):
         gx.generate()
+
+
+def test_compile() -> None:
+    line_number = this_line(+1)
+    template = compile(
+        """
+        %param n
+        !for i in range(n):
+            line {i} of {total}
+        !x = n
+        """,
+    )
+    assert template.render(n=2, total="two") == "line 0 of two\nline 1 of two"
+    assert template.render({"n": 1}, total="one") == "line 0 of one"
+    # Every rendering has a fresh execution namespace.
+    assert "x" not in template.gx.x_globals
+    with pytest.raises(
+        ExecutionError,
+        match=rf"Failed to execute GX at {THIS_FILE}:{line_number}: missing required parameter 'n'.",
+    ):
+        template.render()
+
+
+def test_compile_with_generation_context() -> None:
+    template = compile(
+        """
+        %!for i in range(n):
+            %emit line {i}
+        {name}
+        """,
+        n=2,
+    )
+    assert template.render(name="a") == "line 0\nline 1\na"
+    assert template.render(name="b") == "line 0\nline 1\nb"
+
+
+def test_stream() -> None:
+    chunks = stream(
+        """
+        !for i in range(n):
+            line {i}
+        """,
+        n=3,
+    )
+    assert list(chunks) == ["line 0", "\nline 1", "\nline 2"]
+
+
+def test_execute_with_sink(tmp_path: pathlib.Path) -> None:
+    template = """
+    !for i in range(n):
+        line {i}
+    """
+    output_path = tmp_path / "output.txt"
+    with output_path.open("wb") as file:
+        assert execute(template, n=3, sink=file) == ""
+    assert output_path.read_text() == execute(template, n=3)
+
+    # The output is never kept in memory in its entirety.
+    sizes: list[int] = []
+    tracemalloc.start()
+    try:
+        execute(template, n=100_000, sink=lambda chunk: sizes.append(len(chunk)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert sum(sizes) > 1_000_000
+    assert peak < sum(sizes) / 2
+
+
+def test_import_defers_modules() -> None:
+    # Modules that are only needed for some features aren't imported along with auryn.
+    deferred = ["ast", "importlib.metadata", "inspect", "json", "queue", "shutil", "socket", "subprocess", "textwrap"]
+    deferred += ["uuid", "auryn.plugins.core", "auryn.plugins.filesystem"]
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, auryn; print([m for m in {deferred!r} if m in sys.modules])"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=pathlib.Path(__file__).parent.parent,
+    )
+    assert result.stdout.strip() == "[]"
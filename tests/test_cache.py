@@ -0,0 +1,74 @@
+import pathlib
+
+import pytest
+
+from auryn.cache import DiskCache, LRUCache
+
+
+def test_lru_cache() -> None:
+    cache: LRUCache[str, int] = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 1, 1)
+    assert repr(cache) == "<LRU cache: 2/2 entries, 2 hits, 1 misses, 1 evictions>"
+
+
+def test_lru_cache_on_evict() -> None:
+    evicted: list[tuple[str, int]] = []
+    cache: LRUCache[str, int] = LRUCache(1, on_evict=lambda key, value: evicted.append((key, value)))
+    cache["a"] = 1
+    cache["b"] = 2
+    assert evicted == [("a", 1)]
+    assert cache.pop("b") == 2
+    assert cache.pop("b") is None
+    assert evicted == [("a", 1), ("b", 2)]
+    cache["c"] = 3
+    cache.clear()
+    assert evicted == [("a", 1), ("b", 2), ("c", 3)]
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses, cache.evictions) == (0, 0, 0)
+
+
+def test_lru_cache_validate() -> None:
+    cache: LRUCache[str, int] = LRUCache(2)
+    cache["a"] = 1
+    assert cache.get("a", validate=lambda value: value == 1) == 1
+    assert cache.get("a", validate=lambda value: value == 2) is None
+    assert "a" not in cache
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_cache_invalid_size() -> None:
+    with pytest.raises(ValueError, match=r"invalid cache size: 0 \(expected a positive integer\)"):
+        LRUCache(0)
+
+
+def test_disk_cache(tmp_path: pathlib.Path) -> None:
+    cache = DiskCache(tmp_path / "cache")
+    assert cache.get("a") is None
+    code = compile("x = 1", "<test>", "exec")
+    cache["a"] = {"text": "hello", "code": code}
+    # A different cache object on the same directory stands for a different process.
+    cache = DiskCache(tmp_path / "cache")
+    assert cache.get("a") == {"text": "hello", "code": code}
+    assert cache.get("a", validate=lambda entry: entry["text"] == "world") is None
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert repr(cache) == f"<disk cache at {tmp_path / 'cache'}: 1 hits, 2 misses>"
+
+
+def test_disk_cache_corrupt(tmp_path: pathlib.Path) -> None:
+    cache = DiskCache(tmp_path)
+    cache["a"] = {"text": "hello"}
+    (tmp_path / f"a{DiskCache.entry_suffix}").write_bytes(b"corrupt")
+    assert cache.get("a") is None
+    cache["b"] = {"text": "hello"}
+    cache.clear()
+    assert not tmp_path.exists()
+    assert cache.get("b") is None
@@ -35,7 +35,7 @@ def test_generate(tmp_path: pathlib.Path, cli: CLI) -> None:
     expected = trim(
         """
         for i in range(n):
-            emit(0, 'line ', i)
+            emit_text(0, f'line {i!s}')
         """
     )
     assert received == expected
@@ -127,3 +127,40 @@ def test_error(tmp_path: pathlib.Path, cli: CLI) -> None:
     template_path.write_text(template_code)
     with pytest.raises(RuntimeError, match=r"Failed to execute GX(.|\n)*?NameError: name 'x' is not defined(.|\n)*"):
         cli("execute", template_path)
+
+
+def test_execute_with_cache(tmp_path: pathlib.Path, cli: CLI) -> None:
+    template_path = tmp_path / "template.aur"
+    template_code = trim(
+        """
+        !for i in range(n):
+            line {i}
+        """
+    )
+    template_path.write_text(template_code)
+
+    for n in [1, 2]:
+        received = cli("execute", "--cache", template_path, f"n={n}")
+        assert received == "\n".join(f"line {i}" for i in range(n))
+    assert len(list((tmp_path / ".auryn_cache").iterdir())) == 1
+    assert cli("generate", "--cache", template_path) == "for i in range(n):\n    emit_text(0, f'line {i!s}')"
+
+
+def test_execute_in_main_thread(tmp_path: pathlib.Path, cli: CLI) -> None:
+    plugin_path = tmp_path / "plugin.py"
+    plugin_path.write_text(
+        trim(
+            """
+            import threading
+
+            def x_thread(gx):
+                return "main" if threading.current_thread() is threading.main_thread() else "other"
+            """
+        )
+    )
+    template_path = tmp_path / "template.aur"
+    template_path.write_text("{thread()}")
+
+    # Hooks might hold thread-affine resources (e.g. sqlite connections), so the execution runs in the main thread.
+    assert cli("execute", template_path, "-l", plugin_path) == "main"
+    assert cli("execute", "--cache", template_path, "-l", plugin_path) == "main"
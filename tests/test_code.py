@@ -1,6 +1,8 @@
 import pathlib
 
-from auryn import Code, execute_standalone, generate
+import pytest
+
+from auryn import GX, Code, execute_standalone, generate
 
 from .conftest import trim
 
@@ -24,7 +26,7 @@ def test_code_from_string() -> None:
     line2 = code.lines[1]
     assert line2.template_line_number == 2
     assert line2.indent == 4
-    assert line2.content == "emit(0, 'line ', i)"
+    assert line2.content == "emit_text(0, f'line {i!s}')"
 
 
 def test_code_from_file(tmp_path: pathlib.Path) -> None:
@@ -49,7 +51,7 @@ def test_code_from_file(tmp_path: pathlib.Path) -> None:
     line2 = code.lines[1]
     assert line2.template_line_number == 2
     assert line2.indent == 4
-    assert line2.content == "emit(0, 'line ', i)"
+    assert line2.content == "emit_text(0, f'line {i!s}')"
 
 
 def test_code_from_code() -> None:
@@ -59,6 +61,42 @@ def test_code_from_code() -> None:
     assert code1 is code2
 
 
+def test_code_lines() -> None:
+    gx1 = GX.parse(
+        """
+        !for i in range(n):
+            line {i}
+        """
+    )
+    gx1.generate()
+    gx2 = GX.parse(
+        """
+        hello world
+        """
+    )
+    gx2.generate()
+    code = Code()
+    assert len(code.lines) == 0
+    assert list(code.lines) == []
+    code.extend(gx1.code)
+    code.extend(gx2.code, indent=4)
+    code.append(gx1, 3, 0, "pass")
+    assert len(code.lines) == 4
+    assert [(line.gx, line.template_line_number, line.indent, line.content) for line in code.lines] == [
+        (gx1, 1, 0, "for i in range(n):"),
+        (gx1, 2, 4, "emit_text(0, f'line {i!s}')"),
+        (gx2, 1, 4, "emit_text(0, 'hello world')"),
+        (gx1, 3, 0, "pass"),
+    ]
+    assert code.lines[-1].content == "pass"
+    assert [line.content for line in code.lines[1:3]] == [line.content for line in list(code.lines)[1:3]]
+    # Lines are created when they're accessed, so changing them doesn't change the code.
+    code.lines[0].content = "while True:"
+    assert code.lines[0].content == "for i in range(n):"
+    # Lines can also be passed to a new code object.
+    assert Code(code.lines).to_string(gx1, standalone=True) == code.to_string(gx1, standalone=True)
+
+
 def test_execute_standalone() -> None:
     code = generate(
         """
@@ -190,3 +228,50 @@ def test_execute_standalone_with_multiple_sources(tmp_path: pathlib.Path) -> Non
         assert line.template_line_number == 1
         uids.add(line.gx.id)
     assert len(uids) == 3
+
+
+def test_optimize() -> None:
+    template = """
+        <ul>
+            !for i in range(n):
+                <li>
+                    item {i},
+                    %strip ,
+                </li>
+        </ul>
+        !with indent(4):
+            <p>
+                done
+            </p>
+        """
+    gx = GX.parse(template)
+    gx.generate()
+    expected = gx.execute(n=2)
+
+    gx = GX.parse(template)
+    gx.generate()
+    gx.optimize()
+    assert [(line.template_line_number, line.content) for line in gx.code.lines] == [
+        (1, "emit_block('<ul>\\n')"),
+        (2, "for i in range(n):"),
+        (3, "emit_block('    <li>\\n')"),
+        (4, "emit_text(8, f'item {i!s},')"),
+        (5, "strip(',')"),
+        (6, "emit_block('    </li>\\n')"),
+        (7, "emit_block('</ul>\\n')"),
+        (8, "with indent(4):"),
+        (9, "emit_block('<p>\\n    done\\n</p>\\n')"),
+    ]
+    assert gx.execute(n=2) == expected
+
+
+def test_optimize_by_default(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(GX, "optimize_by_default", True)
+    code = generate(
+        """
+        a
+            b
+        c
+        """
+    )
+    assert code == "emit_block('a\\n    b\\nc\\n')"
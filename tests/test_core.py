@@ -2,7 +2,7 @@ import pathlib
 
 import pytest
 
-from auryn import ExecutionError, GenerationError, execute, generate
+from auryn import GX, ExecutionError, GenerationError, execute, generate, stream
 
 from .conftest import this_line, trim
 
@@ -163,6 +163,22 @@ def test_include_with_load(tmp_path: pathlib.Path) -> None:
     assert received == expected
 
 
+def test_include_namespace() -> None:
+    received = execute(
+        """
+        %!x = 1
+        %include: text
+        %emit {x}
+        """,
+        g_text="""
+            %emit {x}
+            %!x = 2
+            %emit {x}
+        """,
+    )
+    assert received == "1\n2\n1"
+
+
 def test_include_with_continue_generation(tmp_path: pathlib.Path) -> None:
     plugin_path = tmp_path / "plugin.py"
     plugin_code = trim(
@@ -317,6 +333,222 @@ def test_include_file_without_execution(tmp_path: pathlib.Path) -> None:
     assert received == expected
 
 
+def test_include_cache(tmp_path: pathlib.Path) -> None:
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text(
+        trim(
+            """
+            %eval x = {kind!r}
+            %emit kind {kind}
+            """
+        )
+    )
+
+    # Inclusions with the same inputs reuse the generated code.
+    received = generate(
+        """
+        %!for kind in kinds:
+            %include: partial cache=True
+        """,
+        partial=partial_path,
+        kinds=["a", "b", "a"],
+    )
+    expected = trim(
+        """
+        x = 'a'
+        emit_text(0, 'kind a')
+        x = 'b'
+        emit_text(0, 'kind b')
+        x = 'a'
+        emit_text(0, 'kind a')
+        """
+    )
+    assert received == expected
+
+    # Inclusions at different indentations are cached separately.
+    received = execute(
+        """
+        %include: partial cache=True
+        <div>
+            %include: partial cache=True
+        </div>
+        """,
+        g_partial=partial_path,
+        g_kind="a",
+    )
+    expected = trim(
+        """
+        kind a
+        <div>
+            kind a
+        </div>
+        """
+    )
+    assert received == expected
+
+
+def test_include_cache_reuse(tmp_path: pathlib.Path) -> None:
+    def g_count(gx: GX) -> None:
+        counts.append(gx.g_locals.get("kind"))
+
+    inner_path = tmp_path / "inner.aur"
+    inner_path.write_text(
+        trim(
+            """
+            %count
+            %emit inner {kind}
+            """
+        )
+    )
+    outer_path = tmp_path / "outer.aur"
+    outer_path.write_text("%include inner.aur")
+    template = trim(
+        """
+        %!for kind in kinds:
+            %include: outer cache=True
+        """
+    )
+
+    # The outer template doesn't read kind itself, but its (uncached) inclusion of the inner template does.
+    counts: list[str] = []
+    received = execute(template, g_outer=outer_path, g_kinds=["a", "b", "a"], g_count=g_count)
+    assert received == "inner a\ninner b\ninner a"
+    assert counts == ["a", "b"]
+
+    # Caching is disabled by default.
+    counts = []
+    received = execute(
+        """
+        %!for kind in kinds:
+            %include: inner
+        """,
+        g_inner=inner_path,
+        g_kinds=["a", "b", "a"],
+        g_count=g_count,
+    )
+    assert received == "inner a\ninner b\ninner a"
+    assert counts == ["a", "b", "a"]
+
+    # Inclusions that use the generation state are not cached.
+    counts = []
+    inner_path.write_text(
+        trim(
+            """
+            %count
+            %define block
+                %emit inner {kind}
+            %insert block
+            """
+        )
+    )
+    received = execute(template, g_outer=outer_path, g_kinds=["a", "b", "a"], g_count=g_count)
+    assert received == "inner a\ninner b\ninner a"
+    assert counts == ["a", "b", "a"]
+
+
+def test_include_cache_side_effects(tmp_path: pathlib.Path) -> None:
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text(
+        trim(
+            """
+            %!counter.append(1)
+            %emit item {len(counter)}
+            """
+        )
+    )
+
+    outer_path = tmp_path / "outer.aur"
+    outer_path.write_text("%include: 'partial.aur' cache=True")
+
+    # Inclusions that change the values they read are not cached, and neither are the ones that include them.
+    for name in ["partial", "outer"]:
+        counter: list[int] = []
+        received = execute(
+            f"""
+            %!for _ in range(3):
+                %include: {name} cache=True
+            """,
+            g_partial=partial_path,
+            g_outer=outer_path,
+            g_counter=counter,
+        )
+        assert received == "item 1\nitem 2\nitem 3"
+        assert counter == [1, 1, 1]
+
+
+def test_include_subroutine(tmp_path: pathlib.Path) -> None:
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text(
+        trim(
+            """
+            <p>{x}</p>
+            %!if big:
+                <b>{x}</b>
+            """
+        )
+    )
+    template = trim(
+        """
+        !for x in range(2):
+            %include: partial subroutine=True
+        <div>
+            %include: partial subroutine=True
+            %!big = True
+            %include: partial subroutine=True
+        </div>
+        """
+    )
+
+    # Inclusions that generate the same code share a function.
+    code = generate(template, partial=partial_path, big=False)
+    assert code.count("def _subroutine_") == 2
+    assert code.count("_subroutine_0(") == 3
+    assert code.count("_subroutine_1(") == 2
+
+    received = execute(template, g_partial=partial_path, g_big=False)
+    expected = trim(
+        """
+        <p>0</p>
+        <p>1</p>
+        <div>
+            <p>1</p>
+            <p>1</p>
+            <b>1</b>
+        </div>
+        """
+    )
+    assert received == expected
+
+
+def test_include_subroutine_assignments(tmp_path: pathlib.Path) -> None:
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text("!n = 3")
+
+    # Names assigned in a subroutine are available to the including template, like when it's inlined.
+    received = execute(
+        """
+        %include: partial subroutine=True
+        !for i in range(n):
+            line {i}
+        """,
+        g_partial=partial_path,
+    )
+    assert received == "line 0\nline 1\nline 2"
+
+
+def test_include_subroutine_with_continue_generation() -> None:
+    received = execute(
+        """
+        %!x = 1
+        %include: text subroutine=True continue_generation=True
+        """,
+        g_text="""
+            %emit {x}
+        """,
+    )
+    assert received == "1"
+
+
 def test_include_with_children() -> None:
     line_number = this_line(+5)
     with pytest.raises(
@@ -415,6 +647,64 @@ def test_insert() -> None:
     assert received == expected
 
 
+def test_insert_twice() -> None:
+    # Inserting a block aligns it without changing it, so it can be inserted again at a different indentation.
+    received = execute(
+        """
+        %define block
+            a
+                b
+        %insert block
+        <div>
+            %insert block
+            <div>
+                %insert block
+            </div>
+        </div>
+        """
+    )
+    expected = trim(
+        """
+        a
+            b
+        <div>
+            a
+                b
+            <div>
+                a
+                    b
+            </div>
+        </div>
+        """
+    )
+    assert received == expected
+
+
+def test_insert_subroutine() -> None:
+    template = """
+        %define block
+            <p>{x}</p>
+        %insert: "block" subroutine=True
+        <div>
+            %insert: "block" subroutine=True
+            %define empty
+            %insert: "empty" subroutine=True
+        </div>
+    """
+    code = generate(template)
+    assert code.count("def _subroutine_") == 2
+    received = execute(template, x=1)
+    expected = trim(
+        """
+        <p>1</p>
+        <div>
+            <p>1</p>
+        </div>
+        """
+    )
+    assert received == expected
+
+
 def test_insert_missing() -> None:
     received = execute(
         """
@@ -934,6 +1224,47 @@ def test_bookmark_indent() -> None:
     assert received == expected
 
 
+def test_bookmark_stream() -> None:
+    template = """
+    line 1
+    %bookmark x
+    line 3
+    %append x
+        line 2
+    %bookmark x
+    line 5
+    %append x
+        line 4
+    """
+    assert "".join(stream(template)) == execute(template) == "line 1\nline 2\nline 3\nline 4\nline 5"
+
+    # Bookmarks are closed after the last %append in their block, so the output after them is streamed from there on.
+    template = """
+    <head>
+        %bookmark styles
+    </head>
+    <body>
+        %append styles
+            <style>
+        <p>content</p>
+    </body>
+    """
+    assert "close_bookmark('styles')" in generate(template)
+    assert list(stream(template)) == ["<head>", "\n    <style>\n</head>\n<body>", "\n    <p>content</p>", "\n</body>"]
+
+    # Unless a reference to them might execute after that (e.g. in a loop).
+    template = """
+    !for i in range(2):
+        !if i:
+            %append x
+                appended
+        %bookmark x
+        line {i}
+    """
+    assert "close_bookmark" not in generate(template)
+    assert "".join(stream(template)) == execute(template) == "appended\nline 0\nline 1"
+
+
 def test_bookmark_missing() -> None:
     line_number = this_line(+5)
     with pytest.raises(
@@ -0,0 +1,107 @@
+import pathlib
+
+import pytest
+
+from auryn import GX, GenerationError, PluginIndex, execute
+
+from .conftest import trim
+
+HELLO = trim(
+    """
+    import os
+    from os.path import join as x_join
+
+    def g_hello(gx, name):
+        gx.add_text(0, f"hello {name}")
+
+    x_world = lambda gx: "world"
+    g_a, (g_b, c) = 1, (2, 3)
+    """
+)
+SHOUT = trim(
+    """
+    def x_shout(gx, text):
+        return text.upper()
+    """
+)
+
+
+@pytest.fixture
+def plugins_directory(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    directory = tmp_path / "plugins"
+    directory.mkdir()
+    (directory / "hello.py").write_text(HELLO)
+    (directory / "shout.py").write_text(SHOUT)
+    monkeypatch.setattr(GX, "plugin_directories", [directory])
+    monkeypatch.setattr(GX, "plugin_index", PluginIndex())
+    return directory
+
+
+def test_plugin_index(plugins_directory: pathlib.Path) -> None:
+    index = PluginIndex()
+    hello_path = plugins_directory / "hello.py"
+    shout_path = plugins_directory / "shout.py"
+    assert index.names([plugins_directory]) == {
+        "x_join": hello_path,
+        "g_hello": hello_path,
+        "x_world": hello_path,
+        "g_a": hello_path,
+        "g_b": hello_path,
+        "x_shout": shout_path,
+    }
+    assert index.find([plugins_directory], "x_shout") == shout_path
+    assert index.find([plugins_directory], "x_missing") is None
+
+
+def test_plugin_index_precedence(plugins_directory: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    other_directory = tmp_path / "other"
+    other_directory.mkdir()
+    (other_directory / "other.py").write_text(SHOUT)
+    index = PluginIndex()
+    assert index.find([other_directory, plugins_directory], "x_shout") == other_directory / "other.py"
+    assert index.find([plugins_directory, other_directory], "x_shout") == plugins_directory / "shout.py"
+
+
+def test_plugin_index_disk_cache(plugins_directory: pathlib.Path) -> None:
+    shout_path = plugins_directory / "shout.py"
+    assert PluginIndex().find([plugins_directory], "x_shout") == shout_path
+    assert (plugins_directory / ".auryn_cache").is_dir()
+    # The names are read from the disk cache, as long as the module doesn't change.
+    index = PluginIndex()
+    assert index.find([plugins_directory], "x_shout") == shout_path
+    shout_path.write_text(SHOUT.replace("x_shout", "x_yell"))
+    assert index.find([plugins_directory], "x_yell") is None
+    # Once it's refreshed, the change is picked up.
+    index.refresh()
+    assert index.find([plugins_directory], "x_shout") is None
+    assert index.find([plugins_directory], "x_yell") == shout_path
+
+
+def test_discover_macro(plugins_directory: pathlib.Path) -> None:
+    gx = GX.parse(
+        """
+        %hello world
+        """,
+    )
+    gx.generate()
+    assert gx.execute() == "hello world"
+    assert gx._plugins == ["core", str(plugins_directory / "hello.py")]
+
+
+def test_discover_hook(plugins_directory: pathlib.Path) -> None:
+    output = execute(
+        """
+        {shout("hello")}
+        """,
+    )
+    assert output == "HELLO"
+
+
+def test_discover_disabled(plugins_directory: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(GX, "discover_plugins", False)
+    with pytest.raises(GenerationError, match="unknown macro 'hello'"):
+        execute(
+            """
+            %hello world
+            """,
+        )
@@ -0,0 +1,202 @@
+import os
+import pathlib
+from typing import Any
+
+import pytest
+
+from auryn import Environment, ExecutionError
+
+from .conftest import trim
+
+
+def test_environment_cache(tmp_path: pathlib.Path) -> None:
+    template_path = tmp_path / "template.aur"
+    template_path.write_text(
+        trim(
+            """
+            !for i in range(n):
+                line {i}
+            """
+        )
+    )
+    env = Environment()
+    assert env.execute(template_path, n=2) == "line 0\nline 1"
+    assert env.execute(str(template_path), n=1) == "line 0"
+    assert env.compiled_cache.misses == 1
+    assert env.compiled_cache.hits == 1
+    assert len(env.template_cache) == 1
+
+
+def test_environment_generation_context() -> None:
+    env = Environment()
+    template = """
+    %!for i in range(n):
+        %emit line {i}
+    """
+    assert env.execute(template, g_n=1) == "line 0"
+    assert env.execute(template, g_n=2) == "line 0\nline 1"
+    assert env.execute(template, g_n=1) == "line 0"
+    assert env.compiled_cache.misses == 2
+    assert env.compiled_cache.hits == 1
+    # Unhashable context is not cached, but still works.
+    assert env.generate(template, n=1, x=[bytearray()]) == "emit_text(0, 'line 0')"
+    assert len(env.compiled_cache) == 2
+
+
+def test_environment_invalidation(tmp_path: pathlib.Path) -> None:
+    template_path = tmp_path / "template.aur"
+    template_path.write_text("%include partial.aur")
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text("hello")
+    env = Environment()
+    assert env.execute(template_path) == "hello"
+
+    # The same content with a different modification time is still fresh.
+    os.utime(partial_path, ns=(0, 0))
+    assert env.execute(template_path) == "hello"
+    assert env.compiled_cache.hits == 1
+
+    # And once it's found to be the same, it's not read again.
+    read_text = pathlib.Path.read_text
+    reads: list[pathlib.Path] = []
+
+    def read_text_(path: pathlib.Path, *args: Any, **kwargs: Any) -> str:
+        reads.append(path)
+        return read_text(path, *args, **kwargs)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(pathlib.Path, "read_text", read_text_)
+        assert env.execute(template_path) == "hello"
+    assert reads == []
+    assert env.compiled_cache.hits == 2
+
+    # A different content is not.
+    partial_path.write_text("world")
+    os.utime(partial_path, ns=(1, 1))
+    assert env.execute(template_path) == "world"
+    assert env.compiled_cache.hits == 2
+    assert env.compiled_cache.misses == 2
+
+    # Explicit invalidation removes the file and everything that depends on it.
+    env.invalidate(partial_path)
+    assert len(env.template_cache) == 1
+    assert len(env.compiled_cache) == 0
+    env.invalidate()
+    assert len(env.template_cache) == 0
+
+
+def test_environment_shared_partials(tmp_path: pathlib.Path) -> None:
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text("<p>{x}</p>")
+    template1_path = tmp_path / "template1.aur"
+    template1_path.write_text(
+        trim(
+            """
+            <div>
+                %include partial.aur
+            </div>
+            """
+        )
+    )
+    template2_path = tmp_path / "template2.aur"
+    template2_path.write_text(
+        trim(
+            """
+            %include partial.aur
+            %include partial.aur
+            """
+        )
+    )
+    env = Environment()
+    assert env.execute(template1_path, x=1) == "<div>\n    <p>1</p>\n</div>"
+    assert env.execute(template2_path, x=2) == "<p>2</p>\n<p>2</p>"
+    assert env.template_cache.misses == 3
+    # The second inclusion in template2 is resolved by the generation itself, without going through the environment.
+    assert env.template_cache.hits == 1
+
+
+def test_environment_filesystem_source(tmp_path: pathlib.Path) -> None:
+    source_path = tmp_path / "source.txt"
+    source_path.write_text("hello {name}")
+    template_path = tmp_path / "template.aur"
+    template_path.write_text(
+        trim(
+            """
+            %load filesystem
+            output/
+                file.txt source.txt
+            """
+        )
+    )
+    env = Environment()
+    env.execute(template_path, name="world", root=tmp_path)
+    assert (tmp_path / "output" / "file.txt").read_text() == "hello world"
+    source_path.write_text("goodbye {name}")
+    os.utime(source_path, ns=(1, 1))
+    env.execute(template_path, name="world", root=tmp_path)
+    assert (tmp_path / "output" / "file.txt").read_text() == "goodbye world"
+    assert env.compiled_cache.misses == 2
+
+
+def test_environment_disk_cache(tmp_path: pathlib.Path) -> None:
+    plugin_path = tmp_path / "plugin.py"
+    plugin_path.write_text("def x_shout(gx, text):\n    gx.emit(0, text.upper())")
+    partial_path = tmp_path / "partial.aur"
+    partial_path.write_text("!shout(name)")
+    template_path = tmp_path / "template.aur"
+    template_path.write_text(
+        trim(
+            """
+            %load plugin.py
+            %!for i in range(n):
+                %emit line {i}
+            %include partial.aur
+            """
+        )
+    )
+    cache_directory = tmp_path / ".auryn_cache"
+    env = Environment(cache_directory=cache_directory)
+    assert env.execute(template_path, g_n=2, name="hello") == "line 0\nline 1\nHELLO"
+    assert env.disk_cache is not None
+    assert env.disk_cache.misses == 1
+    assert len(list(cache_directory.iterdir())) == 1
+
+    # A new environment stands for a new process.
+    env = Environment(cache_directory=cache_directory)
+    assert env.execute(template_path, g_n=2, name="world") == "line 0\nline 1\nWORLD"
+    assert env.disk_cache is not None
+    assert env.disk_cache.hits == 1
+    # The template and plugin were read (to report errors and load hooks), but nothing was parsed.
+    assert all(cached_file.template is None for _, cached_file in env.template_cache.items())
+    assert env.generate(template_path, n=2) == env.generate(template_path, n=2)
+
+    # Errors are still reported in the right location.
+    env = Environment(cache_directory=cache_directory)
+    with pytest.raises(ExecutionError) as info:
+        env.execute(template_path, g_n=2)
+    assert "!shout(name)" in info.value.report()
+
+    # Changes to included templates or loaded plugins invalidate the entry.
+    partial_path.write_text("!shout(name * 2)")
+    os.utime(partial_path, ns=(1, 1))
+    env = Environment(cache_directory=cache_directory)
+    assert env.execute(template_path, g_n=1, name="hi") == "line 0\nHIHI"
+    plugin_path.write_text("def x_shout(gx, text):\n    gx.emit(0, text.lower())")
+    os.utime(plugin_path, ns=(1, 1))
+    env = Environment(cache_directory=cache_directory)
+    assert env.execute(template_path, g_n=1, name="HI") == "line 0\nhihi"
+    assert env.disk_cache is not None
+    assert env.disk_cache.misses == 1
+
+
+def test_environment_disk_cache_unpersisted(tmp_path: pathlib.Path) -> None:
+    template_path = tmp_path / "template.aur"
+    template_path.write_text("%hello")
+    cache_directory = tmp_path / ".auryn_cache"
+    env = Environment(cache_directory=cache_directory)
+    # Dictionary plugins, unserializable context and template strings are not persisted.
+    assert env.execute(template_path, load={"g_hello": lambda gx: gx.add_text(0, "hello")}) == "hello"
+    template_path.write_text("hello")
+    assert env.execute(template_path, g_x=object()) == "hello"
+    assert env.execute("\nhello\n") == "hello"
+    assert not cache_directory.exists()
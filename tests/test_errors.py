@@ -178,7 +178,7 @@ def test_generation_error_with_multiple_sources(tmp_path: pathlib.Path) -> None:
     assert _is_main("%error 1", info.value.report())
     assert _is_main('%include: "template3.aur" continue_generation=True', info.value.report())
     assert _is_main("%include: template2 continue_generation=True", info.value.report())
-    assert _is_main("error(gx, '1')", info.value.report())
+    assert _is_main("raise ValueError(x)", info.value.report())
 
 
 def test_execution_error_with_multiple_sources(tmp_path: pathlib.Path) -> None:
@@ -217,6 +217,66 @@ def test_execution_error_with_multiple_sources(tmp_path: pathlib.Path) -> None:
     assert _is_main("%include: template2", info.value.report())
 
 
+def test_execution_error_in_subroutine(tmp_path: pathlib.Path) -> None:
+    template1_path = tmp_path / "template1.aur"
+    template1_text = trim(
+        """
+        before
+        %include: "template2.aur" subroutine=True
+        after
+        """
+    )
+    template1_path.write_text(template1_text)
+
+    template2_path = tmp_path / "template2.aur"
+    template2_text = trim(
+        """
+        inside
+        !x
+        """
+    )
+    template2_path.write_text(template2_text)
+
+    line_number = this_line(+5)
+    with pytest.raises(
+        ExecutionError,
+        match=rf"Failed to execute GX of {template1_path} at {THIS_FILE}:{line_number}: name 'x' is not defined.",
+    ) as info:
+        execute(template1_path)
+    assert _is_main("!x", info.value.report())
+    assert _is_main('%include: "template2.aur" subroutine=True', info.value.report())
+
+
+def test_execution_error_in_identical_subroutines(tmp_path: pathlib.Path) -> None:
+    def check() -> None:
+        checks.append(True)
+        if len(checks) > 1:
+            raise ValueError("second check")
+
+    template1_path = tmp_path / "template1.aur"
+    template1_text = trim(
+        """
+        %include: "template2.aur" subroutine=True
+        %include: "template3.aur" subroutine=True
+        """
+    )
+    template1_path.write_text(template1_text)
+
+    # The included templates generate the same code, but each gets its own subroutine, attributed to it.
+    template2_path = tmp_path / "template2.aur"
+    template2_path.write_text("!check()")
+    template3_path = tmp_path / "template3.aur"
+    template3_path.write_text("!check()")
+
+    checks: list[bool] = []
+    with pytest.raises(ExecutionError, match="second check") as info:
+        execute(template1_path, check=check)
+    report = info.value.report()
+    assert _is_main('%include: "template3.aur" subroutine=True', report)
+    assert f"{template3_path}:1" in report
+    assert f"{template2_path}:1" not in report
+
+
 def test_double_generation_error(tmp_path: pathlib.Path) -> None:
     template_path = tmp_path / "template.aur"
     template_text = trim(
@@ -84,6 +84,38 @@ def test_filesystem_simple(tmp_path: pathlib.Path) -> None:
     assert file.read_text() == ""
 
 
+def test_filesystem_error(tmp_path: pathlib.Path) -> None:
+    file = tmp_path / "file"
+    file.write_text("hello world")
+    file.chmod(0o755)
+
+    with pytest.raises(ExecutionError, match="division by zero"):
+        execute(
+            """
+            %load filesystem
+            file
+                line 1
+                line 2
+                {1 / 0}
+            """,
+            root=tmp_path,
+        )
+    # A failed execution leaves the file as it was (rather than truncated or partially written).
+    assert file.read_text() == "hello world"
+    assert [path.name for path in tmp_path.iterdir()] == ["file"]
+
+    execute(
+        """
+        %load filesystem
+        file
+            goodbye world
+        """,
+        root=tmp_path,
+    )
+    assert file.read_text() == "goodbye world"
+    assert file.stat().st_mode & 0o777 == 0o755
+
+
 def test_path_interpolation(tmp_path: pathlib.Path) -> None:
     received = execute(
         """
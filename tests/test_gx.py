@@ -1,10 +1,25 @@
+import inspect
+import linecache
+import os
 import pathlib
+from typing import Any
 
 import pytest
 
-from auryn import GX, Line, generate
+from auryn import (
+    GX,
+    ExecutionError,
+    GenerationError,
+    Line,
+    LineTransforms,
+    Namespace,
+    Origin,
+    Template,
+    execute,
+    generate,
+)
 
-from .conftest import this_line
+from .conftest import this_line, trim
 
 THIS_FILE = pathlib.Path(__file__)
 
@@ -85,6 +100,56 @@ def test_derived_gx_from_file(tmp_path: pathlib.Path) -> None:
     assert derived_gx.origin.gx is gx
 
 
+def test_derived_gx_namespace() -> None:
+    derived_gxs: list[GX] = []
+
+    def g_derive(gx: GX) -> None:
+        derived_gx = gx.derive(
+            """
+            %!y = x + 1
+            """,
+            continue_generation=True,
+        )
+        derived_gx.generate()
+        derived_gxs.append(derived_gx)
+
+    gx = GX.parse(
+        """
+        %!x = 1
+        %derive
+        """
+    )
+    gx.load({"g_derive": g_derive})
+    gx.generate()
+    [derived_gx] = derived_gxs
+    # The derived namespace is layered over the original one, rather than copied from it.
+    assert isinstance(derived_gx.g_locals, Namespace)
+    assert derived_gx.g_locals.maps[1] is gx.g_locals
+    assert derived_gx.g_locals["x"] == 1
+    assert derived_gx.g_locals["y"] == 2
+    assert "y" not in gx.g_locals
+
+
+def test_namespace() -> None:
+    parent = {"x": 1, "y": 2}
+    namespace = Namespace.layer(parent)
+    namespace["x"] = 3
+    assert namespace["x"] == 3
+    assert namespace["y"] == 2
+    assert namespace.get("z", 4) == 4
+    assert "y" in namespace
+    assert "z" not in namespace
+    assert parent == {"x": 1, "y": 2}
+    with pytest.raises(KeyError):
+        namespace["z"]
+
+    # Layered namespaces are flattened.
+    child = Namespace.layer(namespace)
+    assert child.maps == [{}, {"x": 3}, parent]
+    assert dict(child) == {"x": 3, "y": 2}
+    assert eval("x + y", {}, child) == 5
+
+
 def test_line() -> None:
     lines: list[Line] = []
 
@@ -141,3 +206,469 @@ def test_execution_evaluation() -> None:
     assert "z" not in gx.x_globals
     gx.x_exec("z = x + y")
     assert gx.x_globals["z"] == 3
+
+
+def test_dynamic_code_in_memory() -> None:
+    gx = GX.parse(
+        """
+        hello world
+        """,
+    )
+    with pytest.raises(ZeroDivisionError) as info:
+        gx.g_exec("x = 1 / 0")
+    filename = info.traceback[-1].frame.code.raw.co_filename
+    assert filename.endswith(GX.generation_file_suffix)
+    assert not pathlib.Path(filename).exists()
+    assert linecache.getline(filename, 1) == "x = 1 / 0"
+
+
+def test_code_cache() -> None:
+    gx = GX.parse(
+        """
+        hello world
+        """,
+    )
+    gx.g_locals.update(x=1)
+    misses = GX.code_cache.misses
+    hits = GX.code_cache.hits
+    for _ in range(3):
+        assert gx.g_eval("x + 1 # test_code_cache") == 2
+    assert GX.code_cache.misses == misses + 1
+    assert GX.code_cache.hits == hits + 2
+
+
+def test_execute_twice() -> None:
+    gx = GX.parse(
+        """
+        !for i in range(n):
+            line {i}
+        """,
+    )
+    gx.generate()
+    assert gx.execute(n=2) == "line 0\nline 1"
+    assert gx.execute(n=1) == "line 0"
+
+
+def test_clone() -> None:
+    gx = GX.parse(
+        """
+        !x = n
+        line {n}
+        """,
+    )
+    gx.generate()
+    clone = gx.clone()
+    assert clone.template is gx.template
+    assert clone.code is gx.code
+    assert clone.id == gx.id
+    assert clone.x_globals["gx"] is clone
+    assert clone.x_globals["emit"] == clone.emit
+    assert clone.execute(n=1) == "line 1"
+    assert clone.x_globals["x"] == 1
+    assert "x" not in gx.x_globals
+    assert gx.output == []
+
+
+def test_redirect_output_error() -> None:
+    gx = GX.parse("\nline\n")
+    output = gx.output
+    chunks: list[str] = []
+    with pytest.raises(ZeroDivisionError):
+        with gx.redirect_output(chunks.append):
+            gx.emit(0, "line 1\n")
+            gx.emit(0, "line 2\n")
+            1 / 0
+    assert gx.output is output
+    assert chunks == ["line 1"]
+
+
+def test_clone_template() -> None:
+    prototype = GX.parse(Template())
+    prototype.load({"g_hello": lambda gx: gx.add_text(0, "hello"), "x_world": lambda gx: "world"})
+    gx = prototype.clone(
+        """
+        %hello
+        {world()}
+        """,
+    )
+    assert gx.template is not prototype.template
+    assert gx.code is not prototype.code
+    assert gx.id != prototype.id
+    assert gx.x_globals["world"].__self__ is gx
+    gx.generate()
+    assert gx.execute() == "hello\nworld"
+    assert not prototype.code.lines
+
+
+def test_bundle() -> None:
+    loaded: list[GX] = []
+    bundle = GX.bundle(
+        {
+            "g_hello": lambda gx: gx.add_text(0, "hello"),
+            "x_world": lambda gx: "world",
+            "on_load": loaded.append,
+        },
+    )
+    assert [name for name, _ in bundle.g_globals] == ["hello"]
+    assert [name for name, _ in bundle.x_hooks] == ["world"]
+    gx = GX.parse(
+        """
+        %hello
+        {world()}
+        """,
+    )
+    gx.load(bundle)
+    assert loaded == [gx]
+    gx.generate()
+    assert gx.execute() == "hello\nworld"
+
+    # Plugins are bundled with the naming conventions of the GX they're loaded into.
+    gx = GX.parse(
+        """
+        %hello
+        """,
+        load_core=False,
+    )
+    gx.generation_prefix = "gen_"  # type: ignore[misc]
+    gx.load({"gen_hello": lambda gx: gx.add_text(0, "hello")})
+    gx.generate()
+    assert gx.execute() == "hello"
+
+
+def test_builtin_bundle(monkeypatch: pytest.MonkeyPatch) -> None:
+    from auryn.plugins import core
+
+    def g_hello(gx: GX) -> None:
+        gx.add_text(0, "hello")
+
+    def g_emit(gx: GX, text: str) -> None:
+        gx.add_text(0, f"emitted {text}")
+
+    template = """
+        %emit hello
+        %!if "hello" in gx.g_globals:
+            %hello
+    """
+    assert execute(template) == "hello"
+
+    # Builtins are bundled again once their module changes.
+    monkeypatch.setattr(core, "g_hello", g_hello, raising=False)
+    assert execute(template) == "hello\nhello"
+    monkeypatch.setattr(core, "g_emit", g_emit)
+    assert execute(template) == "emitted hello\nhello"
+
+
+def test_plugin_cache(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    plugin_path = tmp_path / "plugin.py"
+    plugin_path.write_text(
+        trim(
+            """
+            module = object()
+
+            def on_load(gx):
+                gx.state["module"] = module
+            """
+        )
+    )
+
+    def load(**kwargs: Any) -> object:
+        gx = GX.parse(Template())
+        gx.load(plugin_path, **kwargs)
+        return gx.state["module"]
+
+    # The module is only executed once, but on_load is still called for every GX.
+    module = load()
+    assert load() is module
+    # It's only read again if its modification time or size change, and only executed again if its content does.
+    with monkeypatch.context() as patch:
+        patch.setattr(pathlib.Path, "read_text", lambda path: pytest.fail(f"{path} was read"))
+        assert load() is module
+    os.utime(plugin_path, ns=(0, 0))
+    assert load() is module
+    # Once it changes, it's executed again.
+    plugin_path.write_text(plugin_path.read_text() + "\n# Changed.\n")
+    changed_module = load()
+    assert changed_module is not module
+    assert load() is changed_module
+    # And it can be executed again explicitly.
+    reloaded_module = load(reload=True)
+    assert reloaded_module is not changed_module
+    assert load() is reloaded_module
+
+
+def test_origin() -> None:
+    origin = Origin(THIS_FILE, 1, None)
+    gx = GX.parse("\nline\n", origin=origin)
+    assert gx.origin is origin
+
+
+def test_execute_iter() -> None:
+    gx = GX.parse(
+        """
+        !for i in range(n):
+            line {i}
+            !lines.append(i)
+        """,
+    )
+    gx.generate()
+    lines: list[int] = []
+    chunks = gx.execute_iter(n=1000, lines=lines)
+    chunk = next(chunks)
+    assert chunk == "line 0"
+    # The execution is only a bounded number of chunks ahead.
+    assert len(lines) < 1000
+    assert chunk + "".join(chunks) == gx.execute(n=1000, lines=[])
+
+    # Once the iteration stops, so does the execution.
+    lines = []
+    chunks = gx.execute_iter(n=1000, lines=lines)
+    next(chunks)
+    chunks.close()
+    assert len(lines) < 1000
+
+    gx = GX.parse(
+        """
+        line 1
+        !x
+        """,
+    )
+    gx.generate()
+    chunks = gx.execute_iter()
+    with pytest.raises(ExecutionError, match="name 'x' is not defined"):
+        next(chunks)
+
+
+def test_line_transforms() -> None:
+    def transform_a(gx: GX, content: str) -> None:
+        pass
+
+    def transform_b(gx: GX, content: str) -> None:
+        pass
+
+    line_transforms = LineTransforms({"!": transform_a, "": transform_b})
+    assert line_transforms.match("!x") == ("!", transform_a)
+    assert line_transforms.match("x") == ("", transform_b)
+    assert line_transforms.match("") == ("", transform_b)
+    # Changes take effect immediately, and longer prefixes take precedence.
+    line_transforms["!!"] = transform_b
+    assert line_transforms.match("!!x") == ("!!", transform_b)
+    assert line_transforms.match("!x") == ("!", transform_a)
+    del line_transforms[""]
+    assert line_transforms.match("x") is None
+    line_transforms.update({"x": transform_a})
+    assert line_transforms.match("x") == ("x", transform_a)
+    line_transforms.clear()
+    assert line_transforms.match("!x") is None
+
+    # Any dictionary assigned to the GX is converted.
+    gx = GX.parse(
+        """
+        hello world
+        """
+    )
+    with gx.patch(line_transforms={"": transform_a}):
+        assert isinstance(gx.line_transforms, LineTransforms)
+        assert gx.line_transforms.match("!x") == ("", transform_a)
+    assert gx.line_transforms.match("!x") == ("!", GX.transform_code)
+
+
+def test_invoke() -> None:
+    calls: list[tuple[Any, ...]] = []
+
+    def g_macro(gx: GX, *args: Any, **kwargs: Any) -> None:
+        calls.append((args, kwargs))
+
+    gx = GX.parse(
+        """
+        %macro
+        %macro x y
+        %macro: x "y z" k=x
+        %macro:: x, [x], k=1
+        %!
+            def macro(gx, *args):
+                calls.append(args)
+        %macro local
+        """
+    )
+    gx.load({"g_macro": g_macro})
+    # Functions defined during the generation see the global generation namespace.
+    gx.g_globals["calls"] = calls
+    gx.generate(x=1)
+    assert calls == [
+        ((), {}),
+        (("x y",), {}),
+        ((1, "y z"), {"k": 1}),
+        ((1, [1]), {"k": 1}),
+        ("local",),
+    ]
+    gx.g_locals["y"] = 2
+    with gx._line(gx.template.lines[0]):
+        gx.invoke("macro", 0, code="y")
+        with pytest.raises(ValueError, match=r"unknown macro 'y' on line 1 \(available macros are .*macro.*\)"):
+            gx.invoke("y")
+    assert calls[-1] == (0, 2)
+
+
+def test_emit_text() -> None:
+    gx = GX.parse(
+        """
+        plain "text" isn't interpolated
+        {x} {{escaped}} {d["a"]} {(lambda: "it's")()}
+            {x if x else y}: {x, y} {*xs}
+        {none}
+
+        %inline
+            {x}
+        """
+    )
+    gx.generate()
+    # Lines are formatted in place and emitted by EMIT_TEXT, unless their interpolated code can't be (since EMIT would
+    # emit several values), or they're not emitted with a newline.
+    assert [line.content.split("(", 1)[0] for line in gx.code.lines] == [
+        "emit_text",
+        "emit_text",
+        "emit",
+        "emit_text",
+        "emit",
+        "emit",
+        "emit_newline",
+    ]
+    output = gx.execute(x=1, y=2, xs=[3, 4], d={"a": "b"}, none=None)
+    assert output == "plain \"text\" isn't interpolated\n1 {escaped} b it's\n    1: 12 34\nNone\n1"
+
+
+def test_function_scope(monkeypatch: pytest.MonkeyPatch) -> None:
+    gx = GX.parse(
+        """
+        %param n
+        %param:: "step", 1
+        !total = total + n
+        !for i in range(0, n, step):
+            line {i}
+            !if i == 2:
+                %stop
+        total {total}
+        """
+    )
+    gx.generate()
+    code = gx.compile(function_scope=True)
+    assert code.co_flags & inspect.CO_OPTIMIZED
+    # Names assigned during the execution are local, and hooks are read into locals once.
+    assert {"total", "i", "step", "emit_text"} <= set(code.co_varnames)
+    monkeypatch.setattr(GX, "function_scope_by_default", True)
+    assert gx.execute(n=2, total=1) == "line 0\nline 1\ntotal 3"
+    assert gx.execute(n=4, total=1) == "line 0\nline 1\nline 2"
+    assert "i" not in gx.x_globals
+    del gx.x_globals["n"], gx.x_globals["total"]
+    with pytest.raises(ExecutionError, match="missing required parameter 'n'"):
+        gx.execute(total=1)
+    del gx.x_globals["total"]
+    with pytest.raises(ExecutionError) as error:
+        gx.execute(n=2)
+    assert isinstance(error.value.error, NameError)
+
+
+def test_function_scope_bound_names(monkeypatch: pytest.MonkeyPatch) -> None:
+    # The same code compiled into a function for GXs with different execution namespaces binds different names.
+    monkeypatch.setattr(GX, "function_scope_by_default", True)
+    template = """
+        !set_name()
+        hello {name}
+    """
+    hooks = {"x_set_name": lambda gx: gx.x_globals.update(name="world")}
+    origin = Origin.infer(0)
+
+    def parse() -> GX:
+        # Both GXs have the same origin, so their generated code is cached under the same name.
+        gx = GX.parse(template, origin=origin)
+        gx.load(hooks)
+        gx.generate()
+        return gx
+
+    gx1 = parse()
+    # Since name is in the execution namespace when it starts, it's read into a local once.
+    gx1.x_globals["name"] = "alice"
+    assert "name" in gx1.compile().co_varnames
+    assert gx1.execute() == "hello alice"
+    gx2 = parse()
+    # Since name isn't in the execution namespace when it starts, it's read from there once the hook sets it.
+    assert "name" not in gx2.compile().co_varnames
+    assert gx2.execute() == "hello world"
+
+
+def test_function_scope_fallback() -> None:
+    # Code that can't be compiled into a function is compiled into a module.
+    gx = GX.parse(
+        """
+        !from math import *
+        {floor(pi)}
+        """
+    )
+    gx.generate()
+    code = gx.compile(function_scope=True)
+    assert not code.co_flags & inspect.CO_OPTIMIZED
+    assert gx.execute() == "3"
+
+
+def test_deep_nesting() -> None:
+    # Nesting isn't limited by Python's recursion limit.
+    depth = 5000
+    template = "\n".join(f"{'    ' * i}{i}" for i in range(depth))
+    gx = GX.parse(f"\n{template}\n")
+    gx.generate()
+    assert gx.execute() == template
+
+
+def test_continuations() -> None:
+    events: list[Any] = []
+
+    def g_nested(gx: GX) -> Any:
+        gx.add_code("if True:")
+        events.append(("start", gx.line.number))
+        with gx.increased_code_indent():
+            try:
+                yield gx.line.children.snap()
+            except ValueError as error:
+                events.append(("error", str(error)))
+                raise
+        events.append(("end", gx.line.number))
+
+    def g_children(gx: GX) -> Any:
+        return gx.line.children.snap()
+
+    def g_fail(gx: GX) -> None:
+        raise ValueError("failed")
+
+    gx = GX.parse(
+        """
+        %nested
+            %children
+                %nested
+                    line 1
+            line 2
+        line 3
+        """
+    )
+    gx.load({"g_nested": g_nested, "g_children": g_children, "g_fail": g_fail})
+    gx.generate()
+    assert events == [("start", 1), ("start", 3), ("end", 3), ("end", 1)]
+    assert [line.indent for line in gx.code.lines] == [0, 4, 8, 4, 0]
+    assert gx.execute() == "line 1\nline 2\nline 3"
+
+    # Errors are raised in the generators waiting for the lines that failed, and the failed line is reported.
+    events.clear()
+    gx = GX.parse(
+        """
+        %nested
+            %children
+                %nested
+                    %fail
+        """
+    )
+    gx.load({"g_nested": g_nested, "g_children": g_children, "g_fail": g_fail})
+    with pytest.raises(GenerationError, match="failed") as info:
+        gx.generate()
+    assert events == [("start", 1), ("start", 3), ("error", "failed"), ("error", "failed")]
+    assert gx.line.number == 4
+    assert isinstance(info.value.error, ValueError)
+    assert gx.code_indent == 0
@@ -0,0 +1,74 @@
+import io
+import socket
+
+import pytest
+
+from auryn.output import Output, Writer
+from auryn.plugins.core import Bookmark
+
+
+def test_output() -> None:
+    chunks: list[str] = []
+    output = Output(chunks.append)
+    output.append("line 1\n")
+    assert chunks == []
+    output.append("line 2,\n")
+    assert chunks == ["line 1"]
+    # The last item is held back, so it can still be changed.
+    output[-1] = output[-1].rstrip().rstrip(",")
+    output.append("\n")
+    output.append("   ")
+    assert chunks == ["line 1", "\nline 2"]
+    output.close()
+    assert chunks == ["line 1", "\nline 2"]
+
+
+def test_output_open_items() -> None:
+    chunks: list[str] = []
+    output = Output(chunks.append)
+    bookmark = Bookmark(0)
+    output.append("line 1\n")
+    output.append(bookmark)
+    output.append("line 3\n")
+    output.append("line 4\n")
+    assert chunks == ["line 1"]
+    bookmark.lines.append("line 2\n")
+    # A bookmark with a nested bookmark that's still open is open.
+    nested_bookmark = Bookmark(0)
+    bookmark.bookmarks.append(nested_bookmark)
+    bookmark.closed = True
+    output.append("line 5\n")
+    assert chunks == ["line 1"]
+    nested_bookmark.closed = True
+    output.append("line 6\n")
+    assert chunks == ["line 1", "\nline 2\nline 3\nline 4\nline 5"]
+    output.close()
+    assert "".join(chunks) == "line 1\nline 2\nline 3\nline 4\nline 5\nline 6"
+
+
+def test_writer() -> None:
+    chunks: list[str] = []
+    writer = Writer(chunks.append, buffer_size=10)
+    writer("hello ")
+    assert chunks == []
+    writer("world")
+    assert chunks == ["hello world"]
+    writer("!")
+    writer.flush()
+    assert chunks == ["hello world", "!"]
+
+
+def test_writer_sinks() -> None:
+    text_file = io.StringIO()
+    binary_file = io.BytesIO()
+    left, right = socket.socketpair()
+    with left, right:
+        for sink, encoding in [(text_file, None), (binary_file, None), (left, "utf-16")]:
+            writer = Writer(sink, encoding=encoding)
+            writer("héllo")
+            writer.flush()
+        assert text_file.getvalue() == "héllo"
+        assert binary_file.getvalue() == "héllo".encode()
+        assert right.recv(1024) == "héllo".encode("utf-16")
+    with pytest.raises(ValueError, match="invalid sink: 1 \\(expected a file object, a socket or a function\\)"):
+        Writer(1)  # type: ignore
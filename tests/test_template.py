@@ -1,6 +1,11 @@
 import pathlib
+import random
+from typing import Any
 
-from auryn import GX, Lines, Template
+import pytest
+
+from auryn import GX, Line, Lines, Template, crop_lines
+from auryn.utils import split_indent
 
 
 def test_template_from_string() -> None:
@@ -154,21 +159,52 @@ def test_first_line_number_in_file(tmp_path: pathlib.Path) -> None:
     assert template.lines[0].number == 1
 
 
-def test_lines_append() -> None:
-    template = Template()
-    lines = template.lines
-    assert flatten(lines) == []
-
-    lines.append(1, 0, "a")
+def test_lines_construction() -> None:
+    lines = Lines([Line(1, 0, "a", [Line(2, 4, "b")]), Line(3, 0, "c")])
     assert flatten(lines) == [
         (0, "a"),
+        (4, "b"),
+        (0, "c"),
     ]
+    assert lines.parent is None
+    assert lines[0].children.parent is lines[0]
+    assert str(lines) == "lines 1-3"
 
-    lines.append(2, 0, "b")
-    assert flatten(lines) == [
-        (0, "a"),
-        (0, "b"),
-    ]
+
+def test_lines_without_children() -> None:
+    template = Template.parse(
+        """
+        a
+        b
+            c
+        """
+    )
+    a, b = template.lines
+    c = b.children[0]
+    # Lines without children share the same empty lines object.
+    assert a.children is c.children
+    assert a.children.parent is None
+    assert not a.children
+    assert a.children.snap(4) is a.children
+    assert b.children.parent is b
+
+
+def test_immutability() -> None:
+    template = Template.parse(
+        """
+        a
+            b
+        """
+    )
+    line = template.lines[0]
+    for obj, name, value in [
+        (template, "text", ""),
+        (template.lines, "parent", None),
+        (line, "indent", 4),
+        (line, "children", Lines()),
+    ]:
+        with pytest.raises(AttributeError, match=f"{type(obj).__name__} objects are immutable"):
+            setattr(obj, name, value)
 
 
 def test_lines_snap() -> None:
@@ -192,8 +228,8 @@ def test_lines_snap() -> None:
         (4, "f"),
     ]
 
-    lines.snap(to=4)
-    assert flatten(lines) == [
+    lines4 = lines.snap(to=4)
+    assert flatten(lines4) == [
         (4, "a"),
         (8, "b"),
         (12, "c"),
@@ -201,55 +237,58 @@ def test_lines_snap() -> None:
         (8, "e"),
         (8, "f"),
     ]
+    assert str(lines4) == "lines 1-6"
+    assert [line.number for line in lines4] == [1, 4]
 
-    lines.snap()
-    assert flatten(lines) == [
-        (0, "a"),
+    # Snapping doesn't change the original lines.
+    assert flatten(lines) == flatten(lines4.snap())
+    assert flatten(lines.snap()) == flatten(lines)
+
+    children = lines4[0].children.snap()
+    assert children.parent is lines4[0]
+    assert str(children) == "children 2-3 of line 1"
+    assert flatten(children) == [
         (4, "b"),
         (8, "c"),
-        (0, "d"),
-        (4, "e"),
-        (4, "f"),
     ]
-
-    lines[0].children.snap()
-    assert flatten(lines) == [
-        (0, "a"),
-        (0, "b"),
-        (4, "c"),
-        (0, "d"),
-        (4, "e"),
-        (4, "f"),
+    assert flatten(children[0].children.snap(to=2)) == [
+        (2, "c"),
+    ]
+    assert flatten(children[0].children.snap(to=2).snap(to=6)) == [
+        (6, "c"),
     ]
 
-    lines[0].children[0].children.snap(to=2)
-    assert flatten(lines) == [
-        (0, "a"),
-        (0, "b"),
+    # Views of views shift the lines they were aligned to, not the original lines.
+    assert [(line.indent, line.content) for line in lines4[1].children.snap(to=0)] == [
+        (0, "e"),
+        (0, "f"),
+    ]
+    assert flatten(lines4[0].children.snap()[0].children.snap(to=2)) == [
         (2, "c"),
-        (0, "d"),
-        (4, "e"),
-        (4, "f"),
     ]
 
-    lines.snap(to=2)
-    assert flatten(lines) == [
-        (2, "a"),
-        (2, "b"),
-        (4, "c"),
-        (2, "d"),
-        (6, "e"),
-        (6, "f"),
-    ]
+    # Lines are aligned when they're accessed, and then remain the same objects.
+    assert lines4[0] is lines4[0]
+    assert list(lines4) == [lines4[0], lines4[1]]
 
-    lines[1].children.snap()
-    assert flatten(lines) == [
+
+def test_template_snap() -> None:
+    template = Template.parse(
+        """
+        a
+            b
+        """
+    )
+    snapped = template.snap(2)
+    assert snapped.text == template.text
+    assert snapped.path == template.path
+    assert flatten(snapped.lines) == [
         (2, "a"),
-        (2, "b"),
-        (4, "c"),
-        (2, "d"),
-        (2, "e"),
-        (2, "f"),
+        (6, "b"),
+    ]
+    assert flatten(template.lines) == [
+        (0, "a"),
+        (4, "b"),
     ]
 
 
@@ -309,6 +348,92 @@ def test_line() -> None:
     assert repr(line3) == "<line 3: 8 | c>"
 
 
+def test_lazy_parsing() -> None:
+    text = """
+        a
+            b
+                c
+            d
+        e
+        """
+    template = Template.parse(text, lazy=True)
+    assert _dump(template.lines) == _dump(Template.parse(text).lines)
+    assert str(template.lines) == "lines 1-5"
+    a, e = template.lines
+    b, d = a.children
+    assert str(a.children) == "children 2-4 of line 1"
+    # Lines are only created once, when they're first accessed.
+    assert a.children[0] is b
+    assert b.children.parent is b
+    assert not e.children
+    assert flatten(a.children.snap()) == [
+        (0, "b"),
+        (4, "c"),
+        (0, "d"),
+    ]
+
+    # Templates are still validated when they're parsed.
+    with pytest.raises(ValueError, match="expected line 2 to start with 8 spaces, but got '    b'"):
+        Template.parse("\n        a\n    b\n", lazy=True)
+
+
+def test_lazy_parsing_by_default(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Template, "lazy_by_default", True)
+    template = Template.parse(
+        """
+        !for i in range(n):
+            line {i}
+        """
+    )
+    assert template.lines[0].children._lines is None
+    gx = GX.parse(template)
+    gx.generate()
+    assert gx.execute(n=2) == "line 0\nline 1"
+
+
+def test_parse_differential() -> None:
+    # The parser should behave exactly like the original one (below), eagerly and lazily.
+    rng = random.Random(0)
+    for _ in range(5000):
+        rows = []
+        for _ in range(rng.randint(0, 10)):
+            indent = rng.choice(["", " ", "  ", "    ", "\t", " \t"]) * rng.randint(0, 3)
+            rows.append(indent + rng.choice(["", "a", "b c", "\tx", "y ", "\xa0z"]))
+        separator = rng.choice(["\n", "\r\n", "\r"])
+        text = rng.choice(["", "\n", "  \n\n"]) + separator.join(rows) + rng.choice(["", "\n  "])
+        path = rng.choice([None, pathlib.Path("template")])
+        expected = _outcome(_reference_parse, text, path)
+        assert _outcome(lambda: _dump(Template.from_text(text, path).lines)) == expected
+        assert _outcome(lambda: _dump(Template.from_text(text, path, lazy=True).lines)) == expected
+
+
+def _outcome(function: Any, *args: Any) -> Any:
+    try:
+        return function(*args)
+    except ValueError as error:
+        return str(error)
+
+
+def _dump(lines: Lines) -> list[Any]:
+    return [(line.number, line.indent, line.content, _dump(line.children)) for line in lines]
+
+
+def _reference_parse(text: str, path: pathlib.Path | None) -> list[Any]:
+    root_lines: list[Any] = []
+    stack: list[Any] = []
+    for number, line_text in crop_lines(text):
+        number += 1 if path else 0
+        indent, content = split_indent(line_text)
+        if not content:
+            indent = stack[-1][1] if stack else 0
+        while stack and stack[-1][1] >= indent:
+            stack.pop()
+        line = (number, indent, content, [])
+        (stack[-1][3] if stack else root_lines).append(line)
+        stack.append(line)
+    return root_lines
+
+
 def flatten(lines: Lines) -> list[tuple[int, str]]:
     flat_lines: list[tuple[int, str]] = []
     for line in lines: